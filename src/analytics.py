@@ -0,0 +1,154 @@
+import json
+import os
+from threading import Lock
+
+import cv2
+import numpy as np
+
+ZONE_GRID = 256  # Resolution of the zone lookup masks; centres are looked up, not tested against polygons
+
+
+class TrackAnalytics:
+    """Live line-crossing counts and zone occupancy, updated incrementally from tracked detections.
+
+    Lines are ``{name, points: [[x, y], [x, y]], classes}`` and zones ``{name, polygon: [[x, y], ...], classes}`` in
+    normalised 0-1 frame coordinates; ``classes`` (ids) is optional and limits what is counted. Each frame costs
+    O(boxes): a track remembers which side of every line its centre was on, and a crossing is counted when that side
+    flips between updates; zone membership is a mask lookup of the centre, kept as a set of track ids per zone. Track
+    state is a fixed-size record dropped once the track has been gone for ``max_age`` frames.
+    """
+
+    def __init__(self, frame_size, lines=(), zones=(), max_age=150):
+        self.width, self.height = frame_size
+        self.max_age = max_age
+        self.lock = Lock()  # Updates run on the detection thread, snapshots are drawn on the render thread
+
+        self.line_names = [line['name'] for line in lines]
+        self.line_classes = [set(line.get('classes') or ()) for line in lines]
+        points = np.array([line['points'] for line in lines], np.float32).reshape(-1, 2, 2)
+        self.line_start, self.line_end = points[:, 0], points[:, 1]
+        self.line_counts = [{'forward': 0, 'backward': 0, 'classes': {}} for _ in lines]
+
+        self.zone_names = [zone['name'] for zone in zones]
+        self.zone_classes = [set(zone.get('classes') or ()) for zone in zones]
+        self.zone_polygons = [np.array(zone['polygon'], np.float32) for zone in zones]
+        self.zone_masks = []
+        for polygon in self.zone_polygons:
+            mask = np.zeros((ZONE_GRID, ZONE_GRID), np.uint8)
+            cv2.fillPoly(mask, [np.round(polygon * (ZONE_GRID - 1)).astype(np.int32)], 1)
+            self.zone_masks.append(mask.astype(bool))
+        self.zone_members = [set() for _ in zones]  # Track ids inside each zone right now
+        self.zone_entries = [0 for _ in zones]
+
+        self.tracks = {}  # track id -> (side of every line, frame last seen, class)
+        self.frame_index = 0
+
+    def update(self, frame_index, frame_time, detections):
+        """Fold one frame of tracked detections into the counts. Untracked boxes (id -1) are ignored."""
+        tracked = detections.ids >= 0
+        ids = detections.ids[tracked]
+        classes = detections.cls[tracked]
+        xyxy = detections.xyxy[tracked]
+        centres = np.stack([(xyxy[:, 0] + xyxy[:, 2]) / (2 * self.width),
+                            (xyxy[:, 1] + xyxy[:, 3]) / (2 * self.height)], axis=1)
+
+        # Side of every line for every box at once: sign of the cross product, plus whether the centre projects
+        # onto the segment rather than its extension
+        sides = np.zeros((len(ids), len(self.line_names)), np.int8)
+        within = np.zeros_like(sides, bool)
+        if len(self.line_names):
+            direction = self.line_end - self.line_start
+            offset = centres[:, None, :] - self.line_start[None, :, :]
+            cross = direction[None, :, 0] * offset[:, :, 1] - direction[None, :, 1] * offset[:, :, 0]
+            sides = np.sign(cross).astype(np.int8)
+            projection = (offset * direction[None]).sum(axis=2) / np.maximum((direction ** 2).sum(axis=1), 1e-9)
+            within = (projection >= 0) & (projection <= 1)
+
+        cells = np.clip(np.round(centres * (ZONE_GRID - 1)).astype(int), 0, ZONE_GRID - 1)
+        inside = [mask[cells[:, 1], cells[:, 0]] for mask in self.zone_masks]
+
+        with self.lock:
+            self.frame_index = frame_index
+            for i, (track_id, cls) in enumerate(zip(ids.tolist(), classes.tolist())):
+                previous = self.tracks.get(track_id)
+                track_sides = sides[i]
+                if previous is not None:
+                    for line, (before, after) in enumerate(zip(previous[0], track_sides)):
+                        if before and after and before != after and within[i, line]:
+                            self.__count_crossing(line, cls, 'forward' if after > 0 else 'backward')
+                    # A centre exactly on a line keeps the side it came from
+                    track_sides = np.where(track_sides != 0, track_sides, previous[0])
+                self.tracks[track_id] = (track_sides, frame_index, cls)
+
+            for zone, zone_inside in enumerate(inside):
+                members = self.zone_members[zone]
+                allowed = self.zone_classes[zone]
+                current = {track_id for track_id, cls, flag in zip(ids.tolist(), classes.tolist(), zone_inside)
+                           if flag and (not allowed or cls in allowed)}
+                self.zone_entries[zone] += len(current - members)
+                # Members not seen this frame stay until their track expires, so a missed detection is not an exit
+                members -= {track_id for track_id in members - current
+                            if track_id in self.tracks and self.tracks[track_id][1] == frame_index}
+                members |= current
+
+            if frame_index % 30 == 0:
+                self.__expire(frame_index)
+
+    def __count_crossing(self, line, cls, direction):
+        allowed = self.line_classes[line]
+        if allowed and cls not in allowed:
+            return
+        counts = self.line_counts[line]
+        counts[direction] += 1
+        per_class = counts['classes'].setdefault(cls, {'forward': 0, 'backward': 0})
+        per_class[direction] += 1
+
+    def __expire(self, frame_index):
+        expired = [track_id for track_id, (_, last_seen, _) in self.tracks.items()
+                   if frame_index - last_seen > self.max_age]
+        for track_id in expired:
+            del self.tracks[track_id]
+        for members in self.zone_members:
+            members.difference_update(expired)
+
+    def snapshot(self):
+        """Current counts as plain data: {'frame', 'lines': {name: counts}, 'zones': {name: occupancy}}."""
+        with self.lock:
+            return {
+                'frame': self.frame_index,
+                'lines': {name: {'forward': counts['forward'], 'backward': counts['backward'],
+                                 'classes': {cls: dict(value) for cls, value in counts['classes'].items()}}
+                          for name, counts in zip(self.line_names, self.line_counts)},
+                'zones': {name: {'occupancy': len(members), 'entries': entries}
+                          for name, members, entries in zip(self.zone_names, self.zone_members, self.zone_entries)},
+            }
+
+    def draw(self, frame):
+        """Overlay the lines, zones and their current counts onto a frame of any size."""
+        height, width = frame.shape[:2]
+        scale = np.array([width, height], np.float32)
+        snapshot = self.snapshot()
+
+        for name, polygon in zip(self.zone_names, self.zone_polygons):
+            points = np.round(polygon * scale).astype(np.int32)
+            cv2.polylines(frame, [points], True, (255, 200, 0), 2)
+            zone = snapshot['zones'][name]
+            cv2.putText(frame, f"{name}: {zone['occupancy']} now, {zone['entries']} total", tuple(points[0].tolist()),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 200, 0), 2)
+
+        for name, start, end in zip(self.line_names, self.line_start, self.line_end):
+            start = tuple(np.round(start * scale).astype(int).tolist())
+            end = tuple(np.round(end * scale).astype(int).tolist())
+            cv2.line(frame, start, end, (0, 200, 255), 2)
+            line = snapshot['lines'][name]
+            cv2.putText(frame, f"{name}: {line['forward']} / {line['backward']}", start,
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 200, 255), 2)
+        return frame
+
+    def export(self, path):
+        """Write the current counts to a JSON file."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2)
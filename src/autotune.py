@@ -0,0 +1,145 @@
+"""Inference runtime autotuner.
+
+Sweeps torch intra-op thread count, batch size, inference image size and backend (CPU, CUDA, CUDA fp16) on a sample
+clip and measures throughput and latency for each combination. The fastest settings are saved as a per-machine
+performance profile that ``DetectionProcessor`` loads at startup: a latency-optimised ``live`` profile for the GUI and
+a throughput-optimised ``offline`` profile for batch processing.
+
+Usage:
+    python -m src.autotune test_flight.mp4 --frames 64
+"""
+import argparse
+import itertools
+import os
+import time
+
+import cv2
+import torch
+import yaml
+
+from src.performance_profile import PROFILE_PATH, save_profiles
+from src.threads import DetectionProcessor
+
+
+def parse_int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def read_sample_frames(path, count):
+    """Decode the sample frames up front so decoding is not part of the measurement."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Unable to open video source {path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+
+    if not frames:
+        raise IOError(f"No frames could be read from {path}")
+    return frames, fps
+
+
+def candidate_backends():
+    backends = [('cpu', False)]
+    if torch.cuda.is_available():
+        backends += [('cuda', False), ('cuda', True)]
+    return backends
+
+
+def measure(detector, frames, source_fps):
+    """Time the detector over the sample frames and return throughput and latency figures."""
+    batch_size = detector.batch_size
+
+    # Warm up once so model fusing and CUDA kernel selection are not timed
+    detector.detect(frames[:batch_size])
+
+    batch_times = []
+    start_time = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        batch_start = time.perf_counter()
+        detector.detect(frames[i:i + batch_size])
+        batch_times.append(time.perf_counter() - batch_start)
+    total_time = time.perf_counter() - start_time
+
+    # In live use a frame also waits for the rest of its batch to be captured before inference starts
+    fill_time = (batch_size - 1) / source_fps
+    latencies = sorted(batch_time + fill_time for batch_time in batch_times)
+    return {
+        'fps': round(len(frames) / total_time, 2),
+        'latency_ms': round(1000 * latencies[len(latencies) // 2], 2),
+        'p95_latency_ms': round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 2),
+    }
+
+
+def choose_profiles(measurements, source_fps):
+    """Pick the lowest-latency setting that keeps up with the source, and the highest-throughput setting."""
+    realtime = [m for m in measurements if m['fps'] >= source_fps] or measurements
+    live = min(realtime, key=lambda m: m['p95_latency_ms'])
+    offline = max(measurements, key=lambda m: m['fps'])
+    return {'live': dict(live), 'offline': dict(offline)}
+
+
+def autotune(clip, model_path, frame_count=64, batch_sizes=(1, 2, 4, 8), image_sizes=(320, 480, 640, 960),
+             thread_counts=None):
+    cores = os.cpu_count() or 1
+    if thread_counts is None:
+        thread_counts = sorted({1, max(1, cores // 4), max(1, cores // 2), cores})
+
+    frames, source_fps = read_sample_frames(clip, max(frame_count, max(batch_sizes)))
+    print(f"Tuning on {len(frames)} frames of {clip} ({source_fps:.1f} FPS source).")
+
+    detector = DetectionProcessor(None, model_path, None, profile=None)
+    detector.update_settings(detector.settings.replace(use_tracking=False))
+
+    measurements = []
+    for (device, half), threads, batch_size, imgsz in itertools.product(candidate_backends(), thread_counts,
+                                                                         batch_sizes, image_sizes):
+        if device == 'cuda' and threads != thread_counts[-1]:
+            continue  # Intra-op threads barely matter once inference runs on the GPU
+
+        settings = {'device': device, 'half': half, 'threads': threads, 'batch_size': batch_size, 'imgsz': imgsz}
+        detector.apply_profile(settings)
+        try:
+            settings.update(measure(detector, frames, source_fps))
+        except Exception as e:
+            print(f"Skipping {settings}: {e}")
+            continue
+
+        measurements.append(settings)
+        print(f"{device:4} half={half!s:5} threads={threads:<3} batch={batch_size:<2} imgsz={imgsz:<4} "
+              f"{settings['fps']:8.2f} FPS  {settings['latency_ms']:8.2f} ms  p95 {settings['p95_latency_ms']:8.2f} ms")
+
+    if not measurements:
+        raise RuntimeError("No configuration could be measured.")
+    return choose_profiles(measurements, source_fps), measurements
+
+
+def main(argv=None):
+    with open('config/config.yaml', 'r') as file:
+        config = yaml.safe_load(file)
+
+    parser = argparse.ArgumentParser(description="Tune inference settings for this machine.")
+    parser.add_argument('clip', nargs='?', default=config['video']['source'], help="Sample video clip")
+    parser.add_argument('--model', default=config['model']['yolov8s'])
+    parser.add_argument('--frames', type=int, default=64, help="Frames measured per configuration")
+    parser.add_argument('--batch-sizes', type=parse_int_list, default=[1, 2, 4, 8])
+    parser.add_argument('--imgsz', type=parse_int_list, default=[320, 480, 640, 960])
+    parser.add_argument('--threads', type=parse_int_list, default=None)
+    parser.add_argument('--output', default=PROFILE_PATH)
+    args = parser.parse_args(argv)
+
+    profiles, measurements = autotune(args.clip, args.model, args.frames, args.batch_sizes, args.imgsz, args.threads)
+    save_profiles(profiles, measurements, args.output)
+    for mode, profile in profiles.items():
+        print(f"{mode}: {profile}")
+    print(f"Saved performance profile to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
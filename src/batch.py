@@ -0,0 +1,253 @@
+"""Offline batch processing of flight recordings.
+
+Runs the same detection and drawing code as the GUI over every recording matched by the given directories or glob
+patterns, as fast as the hardware allows, using one worker process per CPU core by default. Finished recordings are
+checkpointed in a manifest inside the output directory so an interrupted run picks up where it left off.
+
+Usage:
+    python -m src.batch recordings/ "flights/**/*.mp4" --output output/batch --video
+"""
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import torch
+import yaml
+
+from src.detection_index import DetectionIndex
+from src.regions import RegionMask
+from src.threads import DetectionProcessor, draw_detections
+from src.video_stream import open_capture
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov')
+MANIFEST_NAME = 'batch_manifest.json'
+
+# Per-process detector, created once by the pool initializer
+_detector = None
+
+
+def find_recordings(patterns):
+    """Expand directories and glob patterns into a sorted list of absolute video paths."""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                paths.update(os.path.join(root, name) for name in files if name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            paths.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def output_name(path):
+    """Name outputs after the recording, suffixed with a path hash so equal file names never collide."""
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:8]
+    return f"{os.path.splitext(os.path.basename(path))[0]}-{digest}"
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'files': {}}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def save_manifest(output_dir, manifest):
+    """Write the manifest atomically so a crash never leaves it half written."""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def is_complete(manifest, path, output_dir, save_video):
+    """Check whether a recording was already processed and has not changed since."""
+    entry = manifest['files'].get(path)
+    if entry is None or entry['size'] != os.path.getsize(path) or entry['mtime'] != os.path.getmtime(path):
+        return False
+    if save_video and not entry.get('video'):
+        return False
+    outputs = [entry['detections']] + ([entry['video']] if entry.get('video') else [])
+    return all(os.path.exists(os.path.join(output_dir, output)) for output in outputs)
+
+
+def _init_worker(model_path, batch_size, threads):
+    global _detector
+    _detector = DetectionProcessor(None, model_path, None, batch_size=batch_size, profile='offline')
+    torch.set_num_threads(threads)  # The profile was tuned for one process; share the cores between workers
+
+
+def process_recording(path, output_dir, settings):
+    """Detect (and optionally draw) every frame of a single recording. Runs inside a pool worker.
+
+    Outputs are written to temporary names and only moved into place once the whole file is done.
+    """
+    detector = _detector
+    runtime = detector.settings.replace(conf_thres=settings['conf_thres'],
+                                        class_thresholds=settings['class_thresholds'],
+                                        omit_classes=settings['omit_classes'], max_boxes=settings['max_boxes'],
+                                        use_tracking=settings['use_tracking'], multicolor=settings['multicolor'])
+    detector.update_settings(runtime)
+    detector.regions = RegionMask(settings['regions'].get('roi'), settings['regions'].get('exclude'))
+    detector.reset_tracker()
+
+    cap = open_capture(path, settings['backend'], settings['ffmpeg'])
+    if not cap.isOpened():
+        raise IOError(f"Unable to open video source {path}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    names = detector.model.names
+
+    name = output_name(path)
+    detections_name = f"{name}.detections.jsonl"
+    detections_tmp = os.path.join(output_dir, detections_name + '.partial')
+    video_name = None
+    writer = None
+    if settings['save_video']:
+        video_name = f"{name}.annotated.mp4"
+        video_tmp = os.path.join(output_dir, f"{name}.partial.mp4")
+        writer = cv2.VideoWriter(video_tmp, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+
+    start_time = time.time()
+    frame_index = 0
+    try:
+        with open(detections_tmp, 'w') as detections_file:
+            header = {'source': path, 'fps': fps, 'width': width, 'height': height, 'names': names}
+            detections_file.write(json.dumps(header) + '\n')
+
+            frames = []
+            while True:
+                ret, frame = cap.read()
+                if ret:
+                    frames.append(frame)
+
+                if frames and (not ret or len(frames) == detector.batch_size):
+                    for frame, detections in zip(frames, detector.detect(frames)):
+                        record = {'frame': frame_index, 'time': round(frame_index / fps, 3),
+                                  'boxes': detections.to_records()}
+                        detections_file.write(json.dumps(record) + '\n')
+                        if writer is not None:
+                            writer.write(draw_detections(frame, detections, names, runtime))
+                        frame_index += 1
+                    frames = []
+
+                if not ret:
+                    break
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+
+    os.replace(detections_tmp, os.path.join(output_dir, detections_name))
+    if writer is not None:
+        os.replace(video_tmp, os.path.join(output_dir, video_name))
+
+    return {'frames': frame_index, 'seconds': round(time.time() - start_time, 2),
+            'detections': detections_name, 'video': video_name}
+
+
+def run_batch(patterns, output_dir, model_path, settings, workers=0, batch_size=None, index_path=None):
+    """Process every matched recording that is not already checkpointed as complete.
+
+    With index_path, each finished recording is also loaded into that DetectionIndex for querying.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+
+    recordings = find_recordings(patterns)
+    pending = [path for path in recordings
+               if not is_complete(manifest, path, output_dir, settings['save_video'])]
+    print(f"Found {len(recordings)} recordings, {len(recordings) - len(pending)} already processed.")
+    if not pending:
+        return manifest
+
+    cores = os.cpu_count() or 1
+    workers = min(workers or cores, len(pending))
+    threads = max(1, cores // workers)  # Avoid oversubscribing the cores with torch intra-op threads
+    print(f"Processing {len(pending)} recordings with {workers} workers ({threads} threads each).")
+
+    index = DetectionIndex(index_path) if index_path else None
+    completed = 0
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(model_path, batch_size, threads)) as executor:
+        futures = {executor.submit(process_recording, path, output_dir, settings): path for path in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            completed += 1
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[{completed}/{len(pending)}] Error processing {path}: {e}")
+                continue
+
+            manifest['files'][path] = {**file_signature(path), **result}
+            save_manifest(output_dir, manifest)
+            if index is not None:
+                index.ingest(os.path.join(output_dir, result['detections']))
+            fps = result['frames'] / result['seconds'] if result['seconds'] > 0 else 0.0
+            print(f"[{completed}/{len(pending)}] {path}: {result['frames']} frames in "
+                  f"{result['seconds']:.1f}s ({fps:.1f} FPS)")
+    if index is not None:
+        index.close()
+    return manifest
+
+
+def main(argv=None):
+    with open('config/config.yaml', 'r') as file:
+        config = yaml.safe_load(file)
+    batch_config = config.get('batch', {})
+    name_id_map = {details['class']: class_id for class_id, details in config['class_details'].items()}
+    class_thresholds = config['detection'].get('class_thresholds') or {}
+
+    parser = argparse.ArgumentParser(description="Run detection over directories or globs of recordings.")
+    parser.add_argument('inputs', nargs='+', help="Video files, directories or glob patterns")
+    parser.add_argument('--output', default=batch_config.get('output_dir', 'output/batch'))
+    parser.add_argument('--model', default=config['model']['yolov8s'])
+    parser.add_argument('--workers', type=int, default=batch_config.get('workers', 0),
+                        help="Worker processes, 0 for one per CPU core")
+    parser.add_argument('--batch-size', type=int, default=batch_config.get('batch_size', 0),
+                        help="Frames per inference call, 0 to use the autotuned offline profile")
+    parser.add_argument('--video', action=argparse.BooleanOptionalAction, default=batch_config.get('save_video', False),
+                        help="Also write an annotated copy of each recording (--no-video overrides batch.save_video)")
+    parser.add_argument('--no-tracking', action='store_true')
+    parser.add_argument('--multicolor', action='store_true', help="Use class-specific box colours")
+    parser.add_argument('--conf', type=float, default=config['detection']['confidence_threshold'],
+                        help="Minimum confidence for detected boxes")
+    parser.add_argument('--max-boxes', type=int, default=100)
+    parser.add_argument('--index', default=batch_config.get('index_path') or None,
+                        help="SQLite detection index to load results into (see src.detection_index)")
+    args = parser.parse_args(argv)
+
+    settings = {
+        'save_video': args.video,
+        'use_tracking': not args.no_tracking,
+        'multicolor': args.multicolor,
+        'conf_thres': args.conf,
+        'max_boxes': args.max_boxes,
+        'omit_classes': [name_id_map.get(cls, cls) for cls in config['detection']['omit_classes']],
+        'regions': config.get('regions') or {},
+        'backend': config['video'].get('backend', 'opencv'),
+        'ffmpeg': config.get('ffmpeg') or {},
+        'class_thresholds': {name_id_map[name]: float(value) for name, value in class_thresholds.items()
+                             if name in name_id_map},
+    }
+    run_batch(args.inputs, args.output, args.model, settings, workers=args.workers,
+              batch_size=args.batch_size or None, index_path=args.index)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import time
+from collections import deque
+from queue import Empty, Full
+from threading import Condition
+
+import numpy as np
+
+from src.tracing import tracer
+
+MB = 1024 * 1024
+
+
+def item_bytes(item):
+    """Memory held by a queued item: the numpy arrays in it, e.g. a (frame, detections, capture time) tuple.
+
+    Markers such as None or END_OF_STREAM count as zero.
+    """
+    if isinstance(item, np.ndarray):
+        return item.nbytes
+    if isinstance(item, (tuple, list)):
+        return sum(item_bytes(part) for part in item)
+    nbytes = getattr(item, 'nbytes', None)
+    if callable(nbytes):
+        return nbytes()
+    return 0
+
+
+class ByteBudgetQueue:
+    """Queue bounded by the memory of its items rather than their count, with the ``queue.Queue`` interface used
+    between the pipeline stages.
+
+    An item is admitted while the queued bytes plus its own stay within ``max_bytes``; an item that alone exceeds the
+    budget is still admitted into an empty queue, so a large frame never blocks forever. Markers (zero bytes) are always
+    admitted. When the budget is reached the ``overflow`` policy decides:
+
+    - ``block``: ``put`` waits (or raises ``Full`` after its timeout), slowing the producer down to the consumer's pace
+    - ``drop``: the oldest queued items are discarded to make room, as a live source would drop frames it cannot show
+
+    ``max_items`` optionally also bounds the count (0: unbounded).
+    """
+
+    def __init__(self, max_bytes, overflow='block', max_items=0, name='queue'):
+        if overflow not in ('block', 'drop'):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.max_bytes = int(max_bytes)
+        self.overflow = overflow
+        self.max_items = max_items
+        self.name = name
+        self.items = deque()  # (item, size)
+        self.bytes = 0
+        self.peak_bytes = 0
+        self.dropped = 0
+        self.blocked_time = 0.0  # Seconds producers spent waiting for room
+        self._state = Condition()
+
+    def __fits(self, size):
+        if size == 0 or not self.items:
+            return True
+        if self.max_items and len(self.items) >= self.max_items:
+            return False
+        return self.bytes + size <= self.max_bytes
+
+    def __drop_oldest(self, size):
+        index = 0
+        while not self.__fits(size) and index < len(self.items):
+            if self.items[index][1] == 0:
+                index += 1  # Markers are kept in order; only frames are dropped
+                continue
+            _, dropped_size = self.items[index]
+            del self.items[index]
+            self.bytes -= dropped_size
+            self.dropped += 1
+
+    def put(self, item, block=True, timeout=None):
+        size = item_bytes(item)
+        with self._state:
+            if not self.__fits(size):
+                if self.overflow == 'drop':
+                    self.__drop_oldest(size)
+                elif not block:
+                    raise Full
+                else:
+                    start = time.perf_counter()
+                    admitted = self._state.wait_for(lambda: self.__fits(size), timeout)
+                    self.blocked_time += time.perf_counter() - start
+                    if not admitted:
+                        raise Full
+            self.items.append((item, size))
+            self.bytes += size
+            self.peak_bytes = max(self.peak_bytes, self.bytes)
+            self._state.notify_all()
+        tracer.counter(f'{self.name}_bytes', self.bytes)
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        with self._state:
+            if not self.items:
+                if not block or not self._state.wait_for(lambda: self.items, timeout):
+                    raise Empty
+            item, size = self.items.popleft()
+            self.bytes -= size
+            self._state.notify_all()
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        with self._state:
+            return len(self.items)
+
+    def empty(self):
+        with self._state:
+            return not self.items
+
+    def full(self):
+        with self._state:
+            return bool(self.items) and self.bytes >= self.max_bytes
+
+    def nbytes(self):
+        """Bytes currently queued."""
+        with self._state:
+            return self.bytes
+
+    def stats(self):
+        with self._state:
+            return {'items': len(self.items), 'bytes': self.bytes, 'peak_bytes': self.peak_bytes,
+                    'max_bytes': self.max_bytes, 'dropped': self.dropped,
+                    'blocked_seconds': round(self.blocked_time, 3)}
+
+
+def format_usage(usage):
+    """One line summary of ``{buffer name: bytes}``."""
+    return ", ".join(f"{name} {size / MB:.1f} MB" for name, size in usage.items())
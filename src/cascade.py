@@ -0,0 +1,93 @@
+import numpy as np
+import torch
+import torchvision
+from ultralytics import YOLO
+
+from src.detections import Detections
+
+
+class Cascade:
+    """Two-stage detection: a fast model on the full frame, the main model only on crops around uncertain boxes.
+
+    Boxes from the fast model that are confident and large enough are kept as they are. Low-confidence and small
+    boxes are cut out of the capture-resolution frame with some context and re-checked by the main model, batched
+    across every crop of the frame batch; the re-check replaces the fast model's verdict for that box. Both sets are
+    merged with per-class NMS before tracking.
+    """
+
+    def __init__(self, fast_model_path, device, recheck_conf=0.5, small_object_size=32, crop_size=320,
+                 crop_padding=1.0, min_conf=0.1, max_crops=32):
+        self.fast_model = YOLO(fast_model_path).to(device)
+        self.recheck_conf = recheck_conf
+        self.small_object_size = small_object_size
+        self.crop_size = crop_size
+        self.crop_padding = crop_padding
+        self.min_conf = min_conf
+        self.max_crops = max_crops
+
+        # Running totals for the second-stage statistics
+        self.frames = 0
+        self.boxes = 0
+        self.crops = 0
+
+    def split(self, frames, detections):
+        """Separate confident boxes from uncertain ones and cut a crop around each uncertain box.
+
+        Returns the accepted Detections per frame, the crops, and for each crop its frame index, offset and the box
+        it re-checks, all in capture coordinates.
+        """
+        accepted, crops, origins = [], [], []
+        for index, (frame, frame_detections) in enumerate(zip(frames, detections)):
+            sizes = np.max(frame_detections.xyxy[:, 2:] - frame_detections.xyxy[:, :2], axis=1)
+            uncertain = (frame_detections.conf < self.recheck_conf) | (sizes < self.small_object_size)
+            accepted.append(frame_detections.select(~uncertain))
+
+            # Most doubtful boxes first when there are more than the crop budget allows; the rest are dropped
+            candidates = np.flatnonzero(uncertain)
+            candidates = candidates[np.argsort(frame_detections.conf[candidates])][:self.max_crops]
+            height, width = frame.shape[:2]
+            for box in frame_detections.xyxy[candidates]:
+                centre = (box[:2] + box[2:]) / 2
+                side = max(float(np.max(box[2:] - box[:2])) * (1 + 2 * self.crop_padding), self.crop_size / 2)
+                x1, y1 = (int(max(value, 0)) for value in centre - side / 2)
+                x2, y2 = int(min(centre[0] + side / 2, width)), int(min(centre[1] + side / 2, height))
+                if x2 - x1 < 2 or y2 - y1 < 2:
+                    continue
+                crops.append(frame[y1:y2, x1:x2])
+                origins.append((index, x1, y1, box))
+
+            self.boxes += len(frame_detections)
+        self.frames += len(frames)
+        self.crops += len(crops)
+        return accepted, crops, origins
+
+    def merge(self, accepted, rechecked, origins, iou_threshold=0.5):
+        """Map re-checked crop detections back to the frame and merge them with the accepted boxes."""
+        extra = [[] for _ in accepted]
+        for (index, x1, y1, box), crop_detections in zip(origins, rechecked):
+            crop_detections = crop_detections.translate(x1, y1)
+            # Keep only what the main model sees where the uncertain box was, padded by half its size
+            margin = (box[2:] - box[:2]) / 2
+            centres = (crop_detections.xyxy[:, :2] + crop_detections.xyxy[:, 2:]) / 2
+            inside = np.all((centres >= box[:2] - margin) & (centres <= box[2:] + margin), axis=1)
+            extra[index].append(crop_detections.select(inside))
+
+        merged = []
+        for frame_detections, frame_extra in zip(accepted, extra):
+            if not frame_extra:
+                merged.append(frame_detections)
+                continue
+            parts = [frame_detections] + frame_extra
+            combined = Detections(np.concatenate([part.xyxy for part in parts]),
+                                  np.concatenate([part.conf for part in parts]),
+                                  np.concatenate([part.cls for part in parts]))
+            keep = torchvision.ops.batched_nms(torch.from_numpy(combined.xyxy), torch.from_numpy(combined.conf),
+                                               torch.from_numpy(combined.cls), iou_threshold)
+            merged.append(combined.select(keep.numpy()))
+        return merged
+
+    def summary(self):
+        average = self.crops / self.frames if self.frames else 0.0
+        share = 100 * self.crops / self.boxes if self.boxes else 0.0
+        return (f"Cascade: {self.crops} crops re-checked over {self.frames} frames "
+                f"({average:.2f} per frame, {share:.1f}% of first-stage boxes)")
@@ -0,0 +1,281 @@
+"""Spatio-temporal index of detections for post-flight queries.
+
+Loads the ``.detections.jsonl`` files written by batch processing into a SQLite database. Every box is indexed by
+class, track and time, and by its centre point (normalised 0-1 frame coordinates) and time in an R*Tree, so a query
+like "trucks in the lower-left quadrant between minute 10 and 20" touches only the matching rows. Matching frames
+can then be extracted by seeking straight to them instead of replaying the recording.
+
+Usage:
+    python -m src.detection_index ingest output/batch
+    python -m src.detection_index query --class truck --region 0 0.5 0.5 1 --start 10:00 --end 20:00
+    python -m src.detection_index query --track 12 --source flight3 --extract output/matches
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import time
+
+import cv2
+import yaml
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    source TEXT UNIQUE NOT NULL,
+    fps REAL, width INTEGER, height INTEGER, frames INTEGER, names TEXT
+);
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    recording INTEGER NOT NULL,
+    frame INTEGER NOT NULL,
+    time REAL NOT NULL,
+    cls INTEGER NOT NULL,
+    track INTEGER NOT NULL,
+    conf REAL NOT NULL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL
+);
+CREATE INDEX IF NOT EXISTS detections_by_class ON detections (cls, recording, time);
+CREATE INDEX IF NOT EXISTS detections_by_track ON detections (recording, track, time);
+CREATE INDEX IF NOT EXISTS detections_by_time ON detections (recording, time);
+CREATE VIRTUAL TABLE IF NOT EXISTS detection_points USING rtree(id, min_x, max_x, min_y, max_y, min_t, max_t);
+"""
+
+
+class DetectionIndex:
+    """SQLite store of detections with a class/track/time B-tree index and an R*Tree over box centre and time."""
+
+    def __init__(self, path='output/detections.sqlite'):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def ingest(self, detections_path):
+        """Load one ``.detections.jsonl`` file, replacing any earlier copy of the same recording."""
+        with open(detections_path, 'r') as file:
+            header = json.loads(file.readline())
+            width, height = header['width'] or 1, header['height'] or 1
+
+            with self.connection:
+                self.remove(header['source'])
+                cursor = self.connection.execute(
+                    "INSERT INTO recordings (source, fps, width, height, names) VALUES (?, ?, ?, ?, ?)",
+                    (header['source'], header['fps'], header['width'], header['height'],
+                     json.dumps(header.get('names', {}))))
+                recording = cursor.lastrowid
+                next_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM detections").fetchone()[0]
+
+                rows, points, frames = [], [], 0
+                for line in file:
+                    record = json.loads(line)
+                    frames += 1
+                    for x1, y1, x2, y2, conf, cls, track in record['boxes']:
+                        centre_x, centre_y = (x1 + x2) / 2 / width, (y1 + y2) / 2 / height
+                        rows.append((next_id, recording, record['frame'], record['time'], cls, track, conf,
+                                     x1, y1, x2, y2))
+                        points.append((next_id, centre_x, centre_x, centre_y, centre_y,
+                                       record['time'], record['time']))
+                        next_id += 1
+                    if len(rows) >= 10000:
+                        self.__insert(rows, points)
+                        rows, points = [], []
+                self.__insert(rows, points)
+                self.connection.execute("UPDATE recordings SET frames = ? WHERE id = ?", (frames, recording))
+        return header['source'], frames
+
+    def __insert(self, rows, points):
+        self.connection.executemany("INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.connection.executemany("INSERT INTO detection_points VALUES (?, ?, ?, ?, ?, ?, ?)", points)
+
+    def remove(self, source):
+        row = self.connection.execute("SELECT id FROM recordings WHERE source = ?", (source,)).fetchone()
+        if row is None:
+            return
+        self.connection.execute("DELETE FROM detection_points WHERE id IN "
+                                "(SELECT id FROM detections WHERE recording = ?)", row)
+        self.connection.execute("DELETE FROM detections WHERE recording = ?", row)
+        self.connection.execute("DELETE FROM recordings WHERE id = ?", row)
+
+    def recordings(self):
+        return self.connection.execute(
+            "SELECT source, fps, width, height, frames FROM recordings ORDER BY source").fetchall()
+
+    def query(self, classes=None, region=None, start=None, end=None, tracks=None, source=None, min_conf=0.0,
+              limit=None):
+        """Return matching detections as (source, frame, time, cls, track, conf, x1, y1, x2, y2) tuples.
+
+        region is (x1, y1, x2, y2) in normalised frame coordinates and matches boxes whose centre lies inside it;
+        start and end are seconds from the start of the recording; source matches a substring of the path.
+        """
+        conditions, parameters = ["d.conf >= ?"], [min_conf]
+        tables = "detections d JOIN recordings r ON r.id = d.recording"
+        if region is not None or start is not None or end is not None:
+            # Let the R*Tree narrow the candidates down before any row is touched
+            tables = "detection_points p JOIN detections d ON d.id = p.id JOIN recordings r ON r.id = d.recording"
+            if region is not None:
+                conditions += ["p.min_x >= ?", "p.max_x <= ?", "p.min_y >= ?", "p.max_y <= ?"]
+                parameters += [region[0], region[2], region[1], region[3]]
+            if start is not None:
+                conditions.append("p.min_t >= ?")
+                parameters.append(start)
+            if end is not None:
+                conditions.append("p.max_t <= ?")
+                parameters.append(end)
+        if classes:
+            conditions.append(f"d.cls IN ({', '.join('?' * len(classes))})")
+            parameters += list(classes)
+        if tracks:
+            conditions.append(f"d.track IN ({', '.join('?' * len(tracks))})")
+            parameters += list(tracks)
+        if source:
+            conditions.append("r.source LIKE ?")
+            parameters.append(f"%{source}%")
+
+        sql = (f"SELECT r.source, d.frame, d.time, d.cls, d.track, d.conf, d.x1, d.y1, d.x2, d.y2 FROM {tables} "
+               f"WHERE {' AND '.join(conditions)} ORDER BY r.source, d.frame")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def density(self, sources, bucket=1.0):
+        """Mean boxes per frame in every ``bucket`` seconds of a recording, or None if it is not indexed.
+
+        sources lists the paths the recording may have been indexed under; the first one found is used.
+        """
+        row = self.connection.execute(
+            f"SELECT id, fps FROM recordings WHERE source IN ({', '.join('?' * len(sources))}) LIMIT 1",
+            list(sources)).fetchone()
+        if row is None:
+            return None
+        recording, fps = row
+        counts = self.connection.execute("SELECT CAST(time / ? AS INTEGER) AS slot, COUNT(*) FROM detections "
+                                         "WHERE recording = ? GROUP BY slot", (bucket, recording)).fetchall()
+        if not counts:
+            return []
+        values = [0.0] * (max(slot for slot, _ in counts) + 1)
+        frames_per_bucket = (fps or 30) * bucket
+        for slot, count in counts:
+            values[slot] = count / frames_per_bucket
+        return values
+
+    @staticmethod
+    def frames(matches):
+        """Group matches into {source: sorted frame numbers}."""
+        frames = {}
+        for match in matches:
+            frames.setdefault(match[0], set()).add(match[1])
+        return {source: sorted(numbers) for source, numbers in frames.items()}
+
+
+def extract_frames(frames, output_dir):
+    """Decode only the given frames of each recording and save them as JPEGs. Returns the number written."""
+    os.makedirs(output_dir, exist_ok=True)
+    written = 0
+    for source, numbers in frames.items():
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            print(f"Unable to open video source {source}")
+            continue
+        stem = os.path.splitext(os.path.basename(source))[0]
+        position, ret = 0, False
+        for number in numbers:
+            # Seeking costs a keyframe decode; for nearby frames reading forward is cheaper
+            if number < position or number - position > 30:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, number)
+                position = number
+            while position <= number:
+                ret, frame = cap.read()
+                position += 1
+                if not ret:
+                    break
+            if ret:
+                cv2.imwrite(os.path.join(output_dir, f"{stem}-{number:07d}.jpg"), frame)
+                written += 1
+        cap.release()
+    return written
+
+
+def parse_time(value):
+    """Parse seconds, mm:ss or hh:mm:ss."""
+    seconds = 0.0
+    for part in value.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def main(argv=None):
+    with open('config/config.yaml', 'r') as file:
+        config = yaml.safe_load(file)
+    name_id_map = {details['class']: class_id for class_id, details in config['class_details'].items()}
+    default_db = config.get('batch', {}).get('index_path') or 'output/detections.sqlite'
+
+    parser = argparse.ArgumentParser(description="Index and query detections from batch processing.")
+    parser.add_argument('--db', default=default_db)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = commands.add_parser('ingest', help="Load .detections.jsonl files into the index")
+    ingest_parser.add_argument('inputs', nargs='+', help="Detection files, directories or glob patterns")
+
+    query_parser = commands.add_parser('query', help="Find detections")
+    query_parser.add_argument('--class', dest='classes', action='append', default=[],
+                              help="Class name or id; repeat for several")
+    query_parser.add_argument('--track', dest='tracks', action='append', type=int, default=[])
+    query_parser.add_argument('--region', nargs=4, type=float, metavar=('X1', 'Y1', 'X2', 'Y2'),
+                              help="Normalised area the box centre must fall in")
+    query_parser.add_argument('--start', type=parse_time, help="Seconds, mm:ss or hh:mm:ss")
+    query_parser.add_argument('--end', type=parse_time)
+    query_parser.add_argument('--source', help="Substring of the recording path")
+    query_parser.add_argument('--min-conf', type=float, default=0.0)
+    query_parser.add_argument('--limit', type=int)
+    query_parser.add_argument('--frames-only', action='store_true', help="List matching frames, not boxes")
+    query_parser.add_argument('--extract', metavar='DIR', help="Save the matching frames as images")
+
+    commands.add_parser('list', help="List indexed recordings")
+    args = parser.parse_args(argv)
+
+    index = DetectionIndex(args.db)
+    try:
+        if args.command == 'ingest':
+            paths = set()
+            for pattern in args.inputs:
+                if os.path.isdir(pattern):
+                    pattern = os.path.join(pattern, '**', '*.detections.jsonl')
+                paths.update(glob.glob(pattern, recursive=True))
+            for path in sorted(paths):
+                source, frames = index.ingest(path)
+                print(f"Indexed {source}: {frames} frames")
+        elif args.command == 'list':
+            for source, fps, width, height, frames in index.recordings():
+                print(f"{source}: {frames} frames, {width}x{height} @ {fps:.2f} FPS")
+        else:
+            classes = [int(name) if name.isdigit() else name_id_map[name] for name in args.classes]
+            start_time = time.perf_counter()
+            matches = index.query(classes, args.region, args.start, args.end, args.tracks, args.source,
+                                  args.min_conf, args.limit)
+            elapsed = 1000 * (time.perf_counter() - start_time)
+
+            frames = index.frames(matches)
+            if args.frames_only:
+                for source, numbers in frames.items():
+                    print(f"{source}: {' '.join(map(str, numbers))}")
+            else:
+                for source, frame, seconds, cls, track, conf, x1, y1, x2, y2 in matches:
+                    print(f"{source} frame {frame} ({seconds:.2f}s): class {cls} track {track} conf {conf:.2f} "
+                          f"[{x1:.0f}, {y1:.0f}, {x2:.0f}, {y2:.0f}]")
+            print(f"{len(matches)} detections in {sum(map(len, frames.values()))} frames ({elapsed:.1f} ms)")
+
+            if args.extract:
+                written = extract_frames(frames, args.extract)
+                print(f"Saved {written} frames to {args.extract}")
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
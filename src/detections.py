@@ -0,0 +1,81 @@
+import numpy as np
+
+
+class Detections:
+    """Per-frame detections stored as plain numpy arrays.
+
+    Decouples the rest of the pipeline from the ultralytics ``Results`` object so detections can be
+    filtered, written to disk or drawn without touching the model.
+    """
+
+    def __init__(self, xyxy=None, conf=None, cls=None, ids=None):
+        self.xyxy = np.zeros((0, 4), np.float32) if xyxy is None else np.asarray(xyxy, np.float32).reshape(-1, 4)
+        count = len(self.xyxy)
+        self.conf = np.zeros(count, np.float32) if conf is None else np.asarray(conf, np.float32)
+        self.cls = np.zeros(count, np.int32) if cls is None else np.asarray(cls, np.int32)
+        self.ids = np.full(count, -1, np.int32) if ids is None else np.asarray(ids, np.int32)
+
+    @classmethod
+    def from_results(cls, results):
+        """Build detections from an ultralytics ``Results`` object."""
+        boxes = results.boxes
+        if boxes is None or len(boxes) == 0:
+            return cls()
+
+        ids = None
+        if getattr(boxes, 'id', None) is not None:
+            ids = boxes.id.cpu().numpy()
+        return cls(boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy(), ids)
+
+    @classmethod
+    def from_array(cls, array):
+        """Inverse of ``to_array``."""
+        array = np.asarray(array, np.float32).reshape(-1, 7)
+        return cls(array[:, :4], array[:, 4], array[:, 5], array[:, 6])
+
+    @classmethod
+    def concatenate(cls, detections):
+        """Join several Detections into one, in order."""
+        detections = [d for d in detections if len(d)]
+        if not detections:
+            return cls()
+        if len(detections) == 1:
+            return detections[0]
+        return cls(np.concatenate([d.xyxy for d in detections]), np.concatenate([d.conf for d in detections]),
+                   np.concatenate([d.cls for d in detections]), np.concatenate([d.ids for d in detections]))
+
+    def __len__(self):
+        return len(self.xyxy)
+
+    def nbytes(self):
+        """Memory held by the arrays, for byte-bounded queues."""
+        return self.xyxy.nbytes + self.conf.nbytes + self.cls.nbytes + self.ids.nbytes
+
+    def select(self, mask):
+        """Return the detections selected by a boolean mask or index array."""
+        return Detections(self.xyxy[mask], self.conf[mask], self.cls[mask], self.ids[mask])
+
+    def translate(self, dx, dy):
+        """Return the detections shifted by a pixel offset, e.g. from crop to full-frame coordinates."""
+        return Detections(self.xyxy + np.array([dx, dy, dx, dy], np.float32), self.conf, self.cls, self.ids)
+
+    def scale(self, factor_x, factor_y=None):
+        """Return the detections with their boxes scaled, e.g. from inference to capture resolution."""
+        factor_y = factor_x if factor_y is None else factor_y
+        return Detections(self.xyxy * np.array([factor_x, factor_y, factor_x, factor_y], np.float32),
+                          self.conf, self.cls, self.ids)
+
+    def to_array(self):
+        """Pack into a single (N, 7) float32 array: x1, y1, x2, y2, conf, cls, id."""
+        array = np.empty((len(self), 7), np.float32)
+        array[:, :4] = self.xyxy
+        array[:, 4] = self.conf
+        array[:, 5] = self.cls
+        array[:, 6] = self.ids
+        return array
+
+    def to_records(self):
+        """Return the detections as JSON-serialisable lists, rounded to keep the output compact."""
+        return [[round(float(x1), 1), round(float(y1), 1), round(float(x2), 1), round(float(y2), 1),
+                 round(float(conf), 4), int(cls), int(track_id)]
+                for (x1, y1, x2, y2), conf, cls, track_id in zip(self.xyxy, self.conf, self.cls, self.ids)]
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import struct
+import time
+from threading import Thread, Condition
+
+import numpy as np
+
+EXPORT_FORMATS = {'jsonl': '.detections.jsonl', 'mot': '.mot.txt', 'columnar': '.detections.bin'}
+
+COLUMNAR_MAGIC = b'IEYC'
+COLUMNAR_HEADER = struct.Struct('<4sI')  # magic, header JSON length
+CHUNK_HEADER = struct.Struct('<I')  # rows in the chunk
+COLUMNS = (('frame', np.int32, ()), ('time', np.float64, ()), ('xyxy', np.float32, (4,)),
+           ('conf', np.float32, ()), ('cls', np.int32, ()), ('id', np.int32, ()))
+
+
+class DetectionExporter:
+    """Streams per-frame detections to disk as JSON Lines, MOTChallenge CSV or a binary columnar file.
+
+    ``submit`` only appends to an in-memory buffer, so it never waits on the disk; a background thread formats and
+    appends the buffer every ``flush_interval`` seconds and flushes the file, so a crash loses at most one interval.
+    If the disk falls behind by more than ``max_pending`` frames the oldest buffered frames are dropped.
+
+    JSON Lines files use the batch processing layout (a header line, then ``{frame, time, boxes}`` per frame) so they
+    can be loaded into the detection index. Columnar files hold a JSON header followed by one chunk per flush, each
+    storing the rows of every column contiguously; read them back with ``read_columnar``.
+    """
+
+    def __init__(self, path, export_format='jsonl', header=None, flush_interval=1.0, fsync=False,
+                 max_pending=10000):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {export_format}; use one of {', '.join(EXPORT_FORMATS)}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.format = export_format
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_pending = max_pending
+        self.dropped = 0
+
+        self._state = Condition()
+        self.pending = []  # (frame index, time, Detections) waiting for the writer
+        self.alive = True
+
+        header = header or {}
+        if export_format == 'columnar':
+            self.file = open(path, 'wb')
+            header_bytes = json.dumps({**header, 'columns': [name for name, _, _ in COLUMNS]}).encode('utf-8')
+            self.file.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, len(header_bytes)) + header_bytes)
+        else:
+            self.file = open(path, 'w')
+            if export_format == 'jsonl':
+                self.file.write(json.dumps(header) + '\n')
+        self.file.flush()
+
+        self.thread = Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame_index, frame_time, detections):
+        """Queue one frame's detections (in capture coordinates). Never blocks on I/O."""
+        with self._state:
+            self.pending.append((frame_index, frame_time, detections))
+            if len(self.pending) > self.max_pending:
+                del self.pending[0]
+                self.dropped += 1
+
+    def close(self):
+        """Write everything still buffered and close the file."""
+        with self._state:
+            self.alive = False
+            self._state.notify_all()
+        self.thread.join()
+        self.file.close()
+        if self.dropped:
+            logging.warning(f"Exporter dropped {self.dropped} frames because the disk could not keep up")
+
+    def __run(self):
+        while True:
+            with self._state:
+                self._state.wait_for(lambda: not self.alive, self.flush_interval)
+                batch, self.pending = self.pending, []
+                alive = self.alive
+
+            if batch:
+                try:
+                    self.__write(batch)
+                    self.file.flush()
+                    if self.fsync:
+                        os.fsync(self.file.fileno())
+                except OSError as e:
+                    logging.error(f"Error writing detections to {self.path}: {e}")
+            if not alive:
+                return
+
+    def __write(self, batch):
+        if self.format == 'jsonl':
+            self.file.write(''.join(json.dumps({'frame': frame_index, 'time': round(frame_time, 3),
+                                                'boxes': detections.to_records()}) + '\n'
+                                    for frame_index, frame_time, detections in batch))
+        elif self.format == 'mot':
+            # MOTChallenge: 1-based frame, id, left, top, width, height, conf, x, y, z
+            lines = []
+            for frame_index, _, detections in batch:
+                for (x1, y1, x2, y2), conf, track_id in zip(detections.xyxy, detections.conf, detections.ids):
+                    lines.append(f"{frame_index + 1},{track_id},{x1:.2f},{y1:.2f},{x2 - x1:.2f},{y2 - y1:.2f},"
+                                 f"{conf:.4f},-1,-1,-1\n")
+            self.file.write(''.join(lines))
+        else:
+            counts = [len(detections) for _, _, detections in batch]
+            columns = {
+                'frame': np.repeat([frame_index for frame_index, _, _ in batch], counts).astype(np.int32),
+                'time': np.repeat([frame_time for _, frame_time, _ in batch], counts).astype(np.float64),
+                'xyxy': np.concatenate([detections.xyxy for _, _, detections in batch]),
+                'conf': np.concatenate([detections.conf for _, _, detections in batch]),
+                'cls': np.concatenate([detections.cls for _, _, detections in batch]),
+                'id': np.concatenate([detections.ids for _, _, detections in batch]),
+            }
+            self.file.write(CHUNK_HEADER.pack(int(sum(counts))))
+            for name, dtype, _ in COLUMNS:
+                self.file.write(np.ascontiguousarray(columns[name], dtype).data)
+
+
+def read_columnar(path):
+    """Load a columnar export into (header, {column: array}). A chunk cut short by a crash is ignored."""
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    magic, length = COLUMNAR_HEADER.unpack_from(data, 0)
+    if magic != COLUMNAR_MAGIC:
+        raise ValueError(f"{path} is not a columnar detection export")
+    offset = COLUMNAR_HEADER.size
+    header = json.loads(data[offset:offset + length])
+    offset += length
+
+    chunks = {name: [] for name, _, _ in COLUMNS}
+    row_bytes = sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for _, dtype, shape in COLUMNS)
+    while offset + CHUNK_HEADER.size <= len(data):
+        (rows,) = CHUNK_HEADER.unpack_from(data, offset)
+        if offset + CHUNK_HEADER.size + rows * row_bytes > len(data):
+            break
+        offset += CHUNK_HEADER.size
+        for name, dtype, shape in COLUMNS:
+            size = rows * np.dtype(dtype).itemsize * int(np.prod(shape))
+            chunks[name].append(np.frombuffer(data, dtype, rows * int(np.prod(shape)), offset).reshape((rows,) + shape))
+            offset += size
+
+    return header, {name: np.concatenate(parts) if parts else np.zeros((0,) + shape, dtype)
+                    for (name, dtype, shape), parts in zip(COLUMNS, chunks.values())}
+
+
+def export_path(directory, source, export_format):
+    """Name an export after its source and the time it started."""
+    stem = f"camera{source}" if isinstance(source, int) else os.path.splitext(os.path.basename(source))[0]
+    stem = stem.replace(':', '-')
+    return os.path.join(directory, f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}{EXPORT_FORMATS[export_format]}")
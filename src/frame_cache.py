@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+
+from src.video_stream import open_capture
+
+
+class FrameCache:
+    """On-disk cache of decoded recordings, stored as raw frames at the inference resolution.
+
+    A recording is decoded once; while that first pass plays, every frame is resized to fit the inference size and
+    appended to ``<key>.frames``. Once the pass completes, a ``<key>.json`` index records the frame geometry and the
+    source file's size and modification time. Later opens memory-map the frame file, so frames come straight from the
+    page cache without decoding or copying. Entries are invalidated when the source changes, and the least recently
+    used entries are evicted to keep the directory under ``max_bytes``.
+    """
+
+    def __init__(self, directory='cache/frames', max_bytes=4 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source, size):
+        return hashlib.sha1(f"{os.path.abspath(source)}|{size[0]}x{size[1]}".encode('utf-8')).hexdigest()
+
+    def paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.frames', base + '.json'
+
+    def open(self, source, size, backend='opencv', ffmpeg_options=None):
+        """Return a capture for the source whose frames fit inside size = (width, height).
+
+        Serves from the cache when a valid entry exists, otherwise decodes the source and fills the cache on the way.
+        """
+        frames_path, index_path = self.paths(self.key(source, size))
+        index = self.__load_index(index_path)
+        stat = os.stat(source)
+        if index is not None and index['source_size'] == stat.st_size and index['source_mtime'] == stat.st_mtime:
+            index['last_used'] = time.time()
+            self.__save_index(index_path, index)
+            return CachedCapture(frames_path, index)
+
+        # Missing or stale: drop whatever is there and rebuild during the next pass
+        self.remove(frames_path, index_path)
+        cap = open_capture(source, backend, ffmpeg_options)
+        return CacheWriterCapture(cap, self, source, size, frames_path, index_path)
+
+    def total_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.directory, name))
+                   for name in os.listdir(self.directory) if name.endswith('.frames'))
+
+    def make_room(self, needed):
+        """Evict least recently used entries until needed bytes fit. Returns False if they never can."""
+        if needed > self.max_bytes:
+            return False
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                index_path = os.path.join(self.directory, name)
+                index = self.__load_index(index_path) or {}
+                entries.append((index.get('last_used', 0), index_path[:-len('.json')] + '.frames', index_path))
+
+        total = self.total_bytes()
+        for _, frames_path, index_path in sorted(entries):
+            if total + needed <= self.max_bytes:
+                break
+            if os.path.exists(frames_path):
+                total -= os.path.getsize(frames_path)
+            self.remove(frames_path, index_path)
+        return total + needed <= self.max_bytes
+
+    @staticmethod
+    def remove(*paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def __load_index(path):
+        try:
+            with open(path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def __save_index(path, index):
+        with open(path + '.tmp', 'w') as file:
+            json.dump(index, file)
+        os.replace(path + '.tmp', path)
+
+    def commit(self, index_path, index):
+        """Publish a fully written entry; the index is written last so partial entries are never used."""
+        index['last_used'] = time.time()
+        self.__save_index(index_path, index)
+
+
+class CachedCapture:
+    """Reads frames from a completed cache entry as read-only views into a memory-mapped file."""
+
+    borrowed_frames = True  # Frames are read-only views into the cache file
+
+    def __init__(self, frames_path, index):
+        self.index = index
+        self.width, self.height = index['width'], index['height']
+        self.frames = np.memmap(frames_path, np.uint8, 'r', shape=(index['count'], self.height, self.width, 3))
+        self.position = 0
+
+    def isOpened(self):
+        return self.frames is not None
+
+    def read(self):
+        if self.frames is None or self.position >= len(self.frames):
+            return False, None
+        frame = self.frames[self.position]
+        self.position += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.index['fps']
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.index['count']
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        return 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(min(max(value, 0), self.index['count']))
+            return True
+        return False
+
+    def release(self):
+        self.frames = None
+
+
+class CacheWriterCapture:
+    """Wraps a live capture for the first pass over a recording, resizing frames and appending them to the cache.
+
+    The cache entry is only committed if the whole recording was read; a stopped pass or one that would exceed the
+    cache size limit leaves no entry behind and simply passes frames through.
+    """
+
+    def __init__(self, cap, cache, source, size, frames_path, index_path):
+        self.cap = cap
+        self.cache = cache
+        self.frames_path = frames_path
+        self.index_path = index_path
+        self.count = 0
+        self.file = None
+
+        width, height = cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        scale = min(size[0] / width, size[1] / height, 1.0) if width and height else 1.0
+        self.width, self.height = max(1, round(width * scale)), max(1, round(height * scale))
+        self.frame_bytes = self.width * self.height * 3
+
+        stat = os.stat(source)
+        self.index = {'source': os.path.abspath(source), 'source_size': stat.st_size, 'source_mtime': stat.st_mtime,
+                      'source_width': int(width), 'source_height': int(height), 'width': self.width,
+                      'height': self.height, 'fps': cap.get(cv2.CAP_PROP_FPS) or 30}
+
+        expected = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0) * self.frame_bytes
+        self.budget = 0
+        if cap.isOpened() and width and height and cache.make_room(expected):
+            self.budget = cache.max_bytes - cache.total_bytes()
+            self.file = open(frames_path, 'wb')
+        else:
+            logging.warning(f"Not caching {source}: it does not fit in the frame cache")
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            self.__finish()
+            return ret, frame
+
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            frame = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        if self.file is not None:
+            if (self.count + 1) * self.frame_bytes > self.budget:
+                logging.warning("Frame cache size limit reached; abandoning this cache entry")
+                self.__abandon()
+            else:
+                self.file.write(np.ascontiguousarray(frame).data)
+        self.count += 1
+        return True, frame
+
+    def __finish(self):
+        if self.file is None:
+            return
+        if self.count == 0:
+            self.__abandon()
+            return
+        self.file.close()
+        self.file = None
+        self.index['count'] = self.count
+        self.cache.commit(self.index_path, self.index)
+
+    def __abandon(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.cache.remove(self.frames_path)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return False  # Seeking would leave gaps in the cache entry
+
+    def release(self):
+        self.__abandon()  # Only a pass that reached the end of the recording is kept
+        self.cap.release()
+
+    @property
+    def borrowed_frames(self):
+        return getattr(self.cap, 'borrowed_frames', False)
@@ -0,0 +1,149 @@
+import time
+
+import cv2
+import numpy as np
+
+SYNTHETIC_LATENCY_SOURCE = 'synthetic:latency'
+PATTERN_BITS = 32
+
+
+class LatencyProbe:
+    """Keeps the most recent capture-to-display latencies and summarises them as percentiles.
+
+    ``carried`` latencies use the capture time that travels with each frame through the queues; ``pattern``
+    latencies are decoded from the timestamp drawn into frames by ``SyntheticLatencySource``, so they cover the whole
+    path, including anything that copies or re-orders frames.
+    """
+
+    def __init__(self, window=1000):
+        self.carried = np.zeros(window, np.float64)
+        self.pattern = np.zeros(window, np.float64)
+        self.carried_count = 0
+        self.pattern_count = 0
+
+    def record(self, carried, pattern=None):
+        self.carried[self.carried_count % len(self.carried)] = carried
+        self.carried_count += 1
+        if pattern is not None:
+            self.pattern[self.pattern_count % len(self.pattern)] = pattern
+            self.pattern_count += 1
+
+    @staticmethod
+    def __percentiles(samples, count):
+        values = samples[:min(count, len(samples))]
+        if not len(values):
+            return None
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+        return {'p50_ms': round(p50, 1), 'p95_ms': round(p95, 1), 'p99_ms': round(p99, 1),
+                'max_ms': round(values.max() * 1000, 1)}
+
+    def summary(self):
+        return {'carried': self.__percentiles(self.carried, self.carried_count),
+                'pattern': self.__percentiles(self.pattern, self.pattern_count)}
+
+    def text(self):
+        summary = self.summary()
+        parts = []
+        for name in ('carried', 'pattern'):
+            if summary[name] is not None:
+                parts.append(f"{name} p50 {summary[name]['p50_ms']:.0f} ms, p95 {summary[name]['p95_ms']:.0f} ms")
+        return "Latency: " + "; ".join(parts) if parts else "Latency: n/a"
+
+
+def timestamp_ms():
+    """Millisecond clock shared by the synthetic source and the probe, wrapped to the pattern's bit width."""
+    return int(time.perf_counter() * 1000) & ((1 << PATTERN_BITS) - 1)
+
+
+def pattern_cell(width):
+    """Side of one pattern cell: the top strip holds a white and a black reference cell, then the bits."""
+    return width / (PATTERN_BITS + 2)
+
+
+def draw_timestamp(frame, value):
+    """Draw value as a row of black/white cells along the top of the frame, in place."""
+    cell = pattern_cell(frame.shape[1])
+    size = int(cell)
+    frame[:size, :int(cell)] = 255
+    frame[:size, int(cell):int(2 * cell)] = 0
+    for bit in range(PATTERN_BITS):
+        x1, x2 = int((bit + 2) * cell), int((bit + 3) * cell)
+        frame[:size, x1:x2] = 255 if value >> (PATTERN_BITS - 1 - bit) & 1 else 0
+
+
+def read_timestamp(frame):
+    """Decode the timestamp drawn by draw_timestamp from a frame at any scale, or None if there is no pattern."""
+    cell = pattern_cell(frame.shape[1])
+    y = int(cell / 2)
+    samples = [frame[y, int((index + 0.5) * cell)].mean() for index in range(PATTERN_BITS + 2)]
+    white, black = samples[0], samples[1]
+    if white - black < 128:
+        return None
+    threshold = (white + black) / 2
+    value = 0
+    for sample in samples[2:]:
+        value = (value << 1) | (sample > threshold)
+    return value
+
+
+def pattern_latency(frame):
+    """Seconds between the timestamp drawn into the frame and now, or None if the frame has no pattern."""
+    value = read_timestamp(frame)
+    if value is None:
+        return None
+    return ((timestamp_ms() - value) & ((1 << PATTERN_BITS) - 1)) / 1000
+
+
+class SyntheticLatencySource:
+    """Test capture that renders frames in real time with the current time drawn into them.
+
+    Paced to ``fps`` like a camera. Each frame carries a moving block so the pipeline has something to work on, and a
+    timestamp pattern along its top edge that ``pattern_latency`` reads back from the displayed frame.
+    """
+
+    def __init__(self, width=1280, height=720, fps=30, frames=0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames = frames  # 0 for an endless stream
+        self.position = 0
+        self.next_time = None
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened or (self.frames and self.position >= self.frames):
+            return False, None
+
+        now = time.perf_counter()
+        if self.next_time is not None and now < self.next_time:
+            time.sleep(self.next_time - now)
+        self.next_time = max(now, self.next_time or now) + 1.0 / self.fps
+
+        frame = np.full((self.height, self.width, 3), 96, np.uint8)
+        x = int((self.position * 8) % (self.width - 120))
+        cv2.rectangle(frame, (x, self.height // 2 - 40), (x + 120, self.height // 2 + 40), (40, 40, 220), -1)
+        draw_timestamp(frame, timestamp_ms())
+        self.position += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frames
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        return 0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.opened = False
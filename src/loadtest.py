@@ -0,0 +1,350 @@
+"""Load test: how many live camera feeds can this machine run before frames start dropping?
+
+Replays local video files as paced live sources at their native frame rate, each feeding its own
+``DetectionProcessor`` the way the GUI does. Streams are added ``step`` at a time; after a warm-up every step is
+measured for a fixed window, recording each stream's capture-to-result latency, its drop rate (frames the source
+produced that detection never took) and its output frame rate, together with the process CPU and memory use divided
+per stream. The first step where a stream drops more than ``max_drop_rate`` of its frames, exceeds
+``max_latency_ms`` at p95 or falls below ``min_fps_ratio`` of its source rate is the saturation point.
+
+Usage:
+    python -m src.loadtest test_flight.mp4 --start 1 --step 1 --max-streams 12 --duration 20
+"""
+import argparse
+import ctypes
+import json
+import os
+import sys
+import time
+from collections import deque
+from queue import Empty
+from threading import Thread, Condition
+
+import cv2
+import torch
+import yaml
+
+from src.buffers import MB, ByteBudgetQueue
+from src.latency import LatencyProbe
+from src.threads import DetectionProcessor, END_OF_STREAM
+from src.video_stream import open_capture
+
+
+class PacedReplay:
+    """Capture that replays a file as a live source: frames are decoded on schedule at the file's native rate.
+
+    Like a camera, the source never waits for its reader. Only the newest ``buffer`` frames are kept, so frames the
+    reader does not take in time are dropped, and when decoding itself falls behind schedule the missed frames are
+    skipped and counted as dropped too. The file loops forever. ``capture_time`` is the scheduled time of the frame
+    last read, so latency includes time spent waiting in the buffer.
+    """
+
+    def __init__(self, path, backend='opencv', ffmpeg_options=None, buffer=2):
+        self.path = path
+        self.cap = open_capture(path, backend, ffmpeg_options)
+        if not self.cap.isOpened():
+            raise IOError(f"Unable to open video source {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.copy_frames = getattr(self.cap, 'borrowed_frames', False)
+        self.backend = backend
+        self.ffmpeg_options = ffmpeg_options
+
+        self._state = Condition()
+        self.buffer = deque(maxlen=max(1, buffer))  # (frame, scheduled time)
+        self.alive = True
+        self.interrupted = False
+        self.capture_time = None
+        self.produced = 0
+        self.dropped = 0
+        self.read_count = 0
+
+        self.thread = Thread(target=self.__run, name=f'replay-{os.path.basename(path)}', daemon=True)
+        self.thread.start()
+
+    def __run(self):
+        interval = 1.0 / self.fps
+        start = time.perf_counter()
+        due = 0  # Index of the next frame on the schedule
+        while self.alive:
+            now = time.perf_counter()
+            behind = int((now - start) / interval) - due
+            if behind > 0:
+                # Decoding could not keep up: skip to the frame that is due now, as a live camera would have
+                for _ in range(behind):
+                    self.__grab()
+                with self._state:
+                    self.produced += behind
+                    self.dropped += behind
+                due += behind
+            else:
+                with self._state:
+                    self._state.wait_for(lambda: not self.alive, start + due * interval - now)
+
+            ret, frame = self.cap.read()
+            if not ret:
+                self.__rewind()
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+            if self.copy_frames:
+                frame = frame.copy()
+            with self._state:
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.dropped += 1
+                self.buffer.append((frame, start + due * interval))
+                self.produced += 1
+                self._state.notify_all()
+            due += 1
+
+    def __grab(self):
+        grab = getattr(self.cap, 'grab', None)
+        if not (grab() if grab is not None else self.cap.read()[0]):
+            self.__rewind()
+
+    def __rewind(self):
+        if not self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+            self.cap.release()
+            self.cap = open_capture(self.path, self.backend, self.ffmpeg_options)
+
+    def counters(self):
+        with self._state:
+            return {'produced': self.produced, 'dropped': self.dropped, 'read': self.read_count}
+
+    def isOpened(self):
+        return self.alive
+
+    def read(self):
+        with self._state:
+            self._state.wait_for(lambda: self.buffer or self.interrupted or not self.alive)
+            if not self.buffer or self.interrupted:
+                return False, None
+            frame, self.capture_time = self.buffer.popleft()
+            self.read_count += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return 0  # Live
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return False
+
+    def interrupt(self):
+        with self._state:
+            self.interrupted = True
+            self._state.notify_all()
+
+    def release(self):
+        with self._state:
+            self.alive = False
+            self._state.notify_all()
+        self.thread.join(timeout=5)
+        self.cap.release()
+
+
+class LoadStream:
+    """One simulated feed: a paced replay, its detection thread, and a consumer timing the results."""
+
+    def __init__(self, path, model_path, settings):
+        self.replay = PacedReplay(path, settings['backend'], settings['ffmpeg'])
+        memory = settings['memory']
+        self.result_queue = ByteBudgetQueue(memory.get('result_queue_mb', 256) * MB,
+                                            overflow=memory.get('overflow', 'block'), name='result_queue')
+        self.processor = DetectionProcessor(self.replay, model_path, self.result_queue,
+                                            nth_frame=settings['nth_frame'], display_size=settings['display_size'],
+                                            batch_mb=memory.get('batch_mb', 0))
+        self.processor.update_settings(self.processor.settings.replace(use_tracking=settings['tracking']))
+        self.probe = LatencyProbe()
+        self.outputs = 0
+        self.alive = True
+        self.consumer = Thread(target=self.__consume, daemon=True)
+
+    def start(self):
+        self.processor.resume()
+        self.processor.start()
+        self.consumer.start()
+
+    def __consume(self):
+        while self.alive:
+            try:
+                item = self.result_queue.get(timeout=0.5)
+            except Empty:
+                continue
+            if item is None or item is END_OF_STREAM:
+                continue
+            self.probe.record(time.perf_counter() - item[2])
+            self.outputs += 1
+
+    def reset_window(self):
+        """Start a new measurement window; returns the source counters at its start."""
+        self.probe = LatencyProbe()
+        self.outputs = 0
+        return self.replay.counters()
+
+    def measure(self, start_counters, seconds):
+        counters = self.replay.counters()
+        produced = counters['produced'] - start_counters['produced']
+        dropped = counters['dropped'] - start_counters['dropped']
+        latency = self.probe.summary()['carried'] or {}
+        queue = self.result_queue.stats()
+        return {'source_fps': round(self.replay.fps, 2), 'output_fps': round(self.outputs / seconds, 2),
+                'produced': produced, 'dropped': dropped, 'drop_rate': round(dropped / produced, 4) if produced else 0,
+                'latency_p50_ms': latency.get('p50_ms'), 'latency_p95_ms': latency.get('p95_ms'),
+                'latency_max_ms': latency.get('max_ms'),
+                'buffer_mb': round(sum(self.processor.memory_usage().values()) / MB, 1),
+                'result_queue_peak_mb': round(queue['peak_bytes'] / MB, 1), 'result_queue_dropped': queue['dropped']}
+
+    def stop(self):
+        self.processor.terminate()
+        self.alive = False
+        self.consumer.join()
+
+
+def resident_bytes():
+    """Current resident memory of this process, or 0 where it cannot be read."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if sys.platform == 'win32':
+        class MemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+        counters = MemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return 0
+
+
+def cpu_seconds():
+    times = os.times()
+    return times.user + times.system
+
+
+def is_saturated(streams, limits):
+    """Reasons the step is over capacity, empty if every stream kept up."""
+    reasons = []
+    for index, stream in enumerate(streams):
+        if stream['drop_rate'] > limits['max_drop_rate']:
+            reasons.append(f"stream {index} dropped {100 * stream['drop_rate']:.1f}% of frames")
+        if stream['latency_p95_ms'] is not None and stream['latency_p95_ms'] > limits['max_latency_ms']:
+            reasons.append(f"stream {index} p95 latency {stream['latency_p95_ms']:.0f} ms")
+        if stream['output_fps'] < limits['min_fps_ratio'] * stream['source_fps']:
+            reasons.append(f"stream {index} ran at {stream['output_fps']:.1f} of {stream['source_fps']:.1f} FPS")
+    return reasons
+
+
+def load_test(clips, model_path, settings, start=1, step=1, max_streams=16, warmup=10.0, duration=20.0,
+              limits=None, keep_going=False):
+    """Step the number of concurrent streams up and measure each step. Returns the report as a dict."""
+    limits = limits or {'max_drop_rate': 0.01, 'max_latency_ms': 500, 'min_fps_ratio': 0.95}
+    baseline_memory = resident_bytes()
+    cuda = torch.cuda.is_available()
+    steps, streams, saturation = [], [], None
+    try:
+        count = start
+        while count <= max_streams:
+            while len(streams) < count:
+                stream = LoadStream(clips[len(streams) % len(clips)], model_path, settings)
+                stream.start()
+                streams.append(stream)
+            print(f"{count} streams: warming up for {warmup:.0f} s")
+            time.sleep(warmup)
+
+            start_counters = [stream.reset_window() for stream in streams]
+            cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+            time.sleep(duration)
+            elapsed = time.perf_counter() - wall_start
+            cores = (cpu_seconds() - cpu_start) / elapsed
+            results = [stream.measure(counters, elapsed) for stream, counters in zip(streams, start_counters)]
+            memory = resident_bytes()
+
+            reasons = is_saturated(results, limits)
+            result = {
+                'streams': count,
+                'cpu_cores': round(cores, 2), 'cpu_cores_per_stream': round(cores / count, 3),
+                'memory_mb': round(memory / 1024 ** 2, 1),
+                'memory_mb_per_stream': round((memory - baseline_memory) / count / 1024 ** 2, 1),
+                'gpu_memory_mb': round(torch.cuda.memory_allocated() / 1024 ** 2, 1) if cuda else None,
+                'saturated': bool(reasons), 'reasons': reasons, 'per_stream': results,
+            }
+            steps.append(result)
+            worst_p95 = max((r['latency_p95_ms'] or 0 for r in results), default=0)
+            worst_drops = max((r['drop_rate'] for r in results), default=0)
+            print(f"{count:3d} streams  CPU {cores:5.2f} cores ({cores / count:.2f}/stream)  "
+                  f"RSS {result['memory_mb']:8.1f} MB ({result['memory_mb_per_stream']:.1f}/stream)  "
+                  f"worst p95 {worst_p95:7.1f} ms  worst drops {100 * worst_drops:5.1f}%"
+                  f"{'  SATURATED: ' + '; '.join(reasons) if reasons else ''}")
+
+            if reasons and saturation is None:
+                saturation = count
+                if not keep_going:
+                    break
+            count += step
+    finally:
+        for stream in streams:
+            stream.stop()  # Also releases the replay
+
+    sustained = [result['streams'] for result in steps if not result['saturated']]
+    return {'clips': clips, 'model': model_path, 'settings': {k: v for k, v in settings.items() if k != 'ffmpeg'},
+            'limits': limits, 'warmup_s': warmup, 'duration_s': duration,
+            'baseline_memory_mb': round(baseline_memory / 1024 ** 2, 1),
+            'max_sustained_streams': max(sustained) if sustained else 0, 'saturation_streams': saturation,
+            'steps': steps}
+
+
+def main(argv=None):
+    with open('config/config.yaml', 'r') as file:
+        config = yaml.safe_load(file)
+
+    parser = argparse.ArgumentParser(description="Find how many live feeds this machine sustains.")
+    parser.add_argument('clips', nargs='*', default=[config['video']['source']],
+                        help="Video files replayed as feeds, assigned round-robin")
+    parser.add_argument('--model', default=config['model']['yolov8s'])
+    parser.add_argument('--start', type=int, default=1, help="Streams in the first step")
+    parser.add_argument('--step', type=int, default=1, help="Streams added per step")
+    parser.add_argument('--max-streams', type=int, default=16)
+    parser.add_argument('--warmup', type=float, default=10, help="Seconds before each step is measured")
+    parser.add_argument('--duration', type=float, default=20, help="Seconds measured per step")
+    parser.add_argument('--nth-frame', type=int, default=1)
+    parser.add_argument('--no-tracking', action='store_true')
+    parser.add_argument('--display-size', type=int, nargs=2, default=None, metavar=('WIDTH', 'HEIGHT'),
+                        help="Downscale results as the GUI would")
+    parser.add_argument('--max-drop-rate', type=float, default=0.01)
+    parser.add_argument('--max-latency-ms', type=float, default=500)
+    parser.add_argument('--min-fps-ratio', type=float, default=0.95)
+    parser.add_argument('--keep-going', action='store_true', help="Keep stepping past the saturation point")
+    parser.add_argument('--output', default=os.path.join('output', 'loadtest',
+                                                         f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    args = parser.parse_args(argv)
+
+    settings = {'backend': config['video'].get('backend', 'opencv'), 'ffmpeg': config.get('ffmpeg'),
+                'nth_frame': args.nth_frame, 'tracking': not args.no_tracking, 'memory': config.get('memory') or {},
+                'display_size': tuple(args.display_size) if args.display_size else None}
+    limits = {'max_drop_rate': args.max_drop_rate, 'max_latency_ms': args.max_latency_ms,
+              'min_fps_ratio': args.min_fps_ratio}
+    report = load_test(args.clips, args.model, settings, args.start, args.step, args.max_streams, args.warmup,
+                       args.duration, limits, args.keep_going)
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    if report['saturation_streams'] is None:
+        print(f"No saturation up to {report['max_sustained_streams']} streams")
+    else:
+        print(f"Saturated at {report['saturation_streams']} streams; "
+              f"{report['max_sustained_streams']} sustained")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
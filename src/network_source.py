@@ -0,0 +1,407 @@
+import argparse
+import json
+import logging
+import re
+import subprocess
+import sys
+import time
+from collections import deque
+from threading import Thread, Condition
+
+import cv2
+import numpy as np
+
+from src.tracing import tracer
+
+NETWORK_SCHEMES = ('udp://', 'rtp://', 'rtsp://', 'rtsps://', 'srt://', 'tcp://')
+
+# ffmpeg warnings counted as network damage; the first group of a pattern, if any, is the amount
+STDERR_COUNTERS = (
+    ('lost_packets', re.compile(r'missed (\d+) packets', re.IGNORECASE)),
+    ('corrupt_packets', re.compile(r'corrupt input packet|packet corrupt|continuity check failed', re.IGNORECASE)),
+    ('overruns', re.compile(r'circular buffer overrun', re.IGNORECASE)),
+    ('decode_errors', re.compile(r'error while decoding|concealing \d+|decode_slice_header error', re.IGNORECASE)),
+)
+
+
+def is_network_source(source):
+    return isinstance(source, str) and source.lower().startswith(NETWORK_SCHEMES)
+
+
+def input_options(source, low_latency=True, rtsp_transport='tcp'):
+    """ffmpeg input options for a network source, with minimal demuxer and decoder buffering in low-latency mode."""
+    options = []
+    if low_latency:
+        options += ['-fflags', 'nobuffer+discardcorrupt', '-flags', 'low_delay',
+                    '-probesize', '500000', '-analyzeduration', '500000']
+    if source.lower().startswith(('rtsp://', 'rtsps://')):
+        options += ['-rtsp_transport', rtsp_transport]
+    return options
+
+
+def udp_url(source, fifo_size=50000):
+    """Give udp:// sources a receive FIFO that overruns without failing, so a slow reader drops packets, not the link."""
+    if not source.lower().startswith('udp://') or 'fifo_size' in source:
+        return source
+    return f"{source}{'&' if '?' in source else '?'}fifo_size={fifo_size}&overrun_nonfatal=1"
+
+
+class NetworkCapture:
+    """Capture for live MPEG-TS/RTP/RTSP/SRT streams, decoded by ffmpeg in the background.
+
+    A reader thread decodes into a bounded jitter buffer of ``jitter_buffer`` frames, further capped to ``buffer_mb``
+    megabytes; when detection falls behind, the oldest buffered frame is dropped. In low-latency mode the demuxer and
+    decoder buffer as little as possible and ``read`` always returns the newest frame, skipping older ones. If the
+    stream stalls for ``stall_timeout`` seconds or ffmpeg exits, the reader reconnects with exponential backoff while
+    ``read`` keeps blocking, so the detection thread survives outages. Packet loss and corruption reported by ffmpeg are counted in ``stats``.
+
+    Frames are scaled to the size found on the first connection (or ``scale``), so every reconnect yields the same
+    frame size. Setting ``scale`` also skips probing the stream, which makes connecting faster.
+    """
+
+    def __init__(self, source, jitter_buffer=8, low_latency=True, rtsp_transport='tcp', udp_fifo_size=50000,
+                 stall_timeout=5.0, reconnect_delay=0.5, max_reconnect_delay=8.0, max_reconnects=0, scale=None,
+                 threads=0, hwaccel=None, buffer_mb=0):
+        self.source = source
+        self.low_latency = low_latency
+        self.stall_timeout = stall_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_reconnects = max_reconnects  # 0: retry forever
+        self.threads = threads
+        self.hwaccel = hwaccel
+        self.url = udp_url(source, udp_fifo_size)
+        self.options = input_options(source, low_latency, rtsp_transport)
+
+        self._state = Condition()  # Guards the buffer, the process and the flags below
+        self.jitter_buffer = max(1, jitter_buffer)
+        self.max_buffer_bytes = int(buffer_mb * 1024 * 1024)  # 0: bounded by jitter_buffer frames only
+        self.buffer = deque(maxlen=self.jitter_buffer)  # (frame, arrival time)
+        self.process = None
+        self.alive = True
+        self.interrupted = False
+        self.finished = False  # Gave up reconnecting
+        self.last_frame_time = 0.0
+        self.capture_time = None  # Arrival time of the frame last read
+        self.stderr_lines = deque(maxlen=20)
+        self.counters = {'frames_received': 0, 'frames_read': 0, 'buffer_drops': 0, 'skipped': 0, 'reconnects': 0,
+                         'lost_packets': 0, 'corrupt_packets': 0, 'overruns': 0, 'decode_errors': 0}
+        self.frame_index = 0
+
+        self.fps = 30
+        if scale:
+            self.width, self.height = int(scale[0]), int(scale[1])
+        else:
+            self.width, self.height = 0, 0
+            self.__probe()
+
+        self.thread = Thread(target=self.__run, name='network-capture', daemon=True)
+        self.thread.start()
+        Thread(target=self.__watch, name='network-watchdog', daemon=True).start()
+
+    def __probe(self):
+        """Find the stream's frame size and rate. Returns False if the stream could not be reached."""
+        from src.video_stream import FFmpegCapture  # Imported here because video_stream imports this module
+        info = FFmpegCapture.probe(self.url, self.options, timeout=max(self.stall_timeout, 1))
+        if not info.get('width') or not info.get('height'):
+            return False
+        self.width, self.height = info['width'], info['height']
+        self.fps = info.get('fps') or self.fps
+        return True
+
+    def __command(self):
+        command = ['ffmpeg', '-hide_banner', '-loglevel', 'warning', '-nostdin']
+        if self.hwaccel:
+            command += ['-hwaccel', self.hwaccel]
+        command += ['-threads', str(self.threads)] + self.options + ['-i', self.url]
+        command += ['-vf', f'scale={self.width}:{self.height}', '-pix_fmt', 'bgr24', '-f', 'rawvideo', '-an', '-sn',
+                    'pipe:1']
+        return command
+
+    def __connect(self):
+        if not self.width and not self.__probe():
+            return None
+        try:
+            process = subprocess.Popen(self.__command(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        except FileNotFoundError:
+            logging.error("Error: FFmpeg is not installed; network sources are unavailable")
+            return None
+        Thread(target=self.__drain_stderr, args=(process,), daemon=True).start()
+        with self._state:
+            self.process = process
+            self.last_frame_time = time.perf_counter()  # The stall timer starts at connect
+        return process
+
+    def __run(self):
+        delay = self.reconnect_delay
+        attempts = 0
+        while self.alive:
+            process = self.__connect()
+            if process is not None:
+                if self.__receive(process):
+                    delay = self.reconnect_delay  # Frames arrived, so the next outage starts with a short wait
+                    attempts = 0
+                self.__disconnect(process)
+            if not self.alive:
+                break
+
+            attempts += 1
+            if self.max_reconnects and attempts > self.max_reconnects:
+                logging.error(f"Giving up on {self.source} after {self.max_reconnects} reconnect attempts")
+                break
+            self.counters['reconnects'] += 1
+            tracer.instant('network.reconnect', attempt=attempts)
+            logging.warning(f"Lost {self.source}; reconnecting in {delay:.1f} s (attempt {attempts})")
+            with self._state:
+                self._state.wait_for(lambda: not self.alive, delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+        with self._state:
+            self.finished = True
+            self._state.notify_all()
+
+    def __receive(self, process):
+        """Decode frames into the jitter buffer until the stream ends or stalls. Returns True if any frame arrived."""
+        frame_bytes = self.width * self.height * 3
+        if self.max_buffer_bytes:
+            # Frames are all the same size, so the byte budget is a frame count; at 4K it may be smaller than
+            # jitter_buffer
+            limit = max(1, min(self.jitter_buffer, self.max_buffer_bytes // frame_bytes))
+            if limit != self.buffer.maxlen:
+                with self._state:
+                    self.buffer = deque(self.buffer, maxlen=limit)
+        received = False
+        while self.alive:
+            frame = np.empty((self.height, self.width, 3), np.uint8)
+            view = memoryview(frame).cast('B')
+            filled = 0
+            while filled < frame_bytes:
+                count = process.stdout.readinto(view[filled:])
+                if not count:
+                    if self.alive and self.stderr_lines:
+                        logging.warning(f"FFmpeg: {self.stderr_lines[-1]}")
+                    return received
+                filled += count
+
+            received = True
+            with self._state:
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.counters['buffer_drops'] += 1  # deque(maxlen) discards the oldest frame on append
+                self.buffer.append((frame, time.perf_counter()))
+                self.counters['frames_received'] += 1
+                self.last_frame_time = time.perf_counter()
+                self._state.notify_all()
+            tracer.counter('network.jitter_buffer', len(self.buffer))
+        return received
+
+    def __disconnect(self, process):
+        with self._state:
+            if self.process is process:
+                self.process = None
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+
+    def __watch(self):
+        # ffmpeg waits forever on a silent UDP socket, so a stalled stream is killed to make the reader reconnect
+        while True:
+            with self._state:
+                self._state.wait_for(lambda: not self.alive, min(1.0, self.stall_timeout / 2))
+                if not self.alive:
+                    return
+                process = self.process
+                stalled = process is not None and time.perf_counter() - self.last_frame_time > self.stall_timeout
+            if stalled and process.poll() is None:
+                logging.warning(f"No frames from {self.source} for {self.stall_timeout:.0f} s")
+                process.kill()
+
+    def __drain_stderr(self, process):
+        for line in iter(process.stderr.readline, b''):
+            text = line.decode(errors='replace').rstrip()
+            self.stderr_lines.append(text)
+            for name, pattern in STDERR_COUNTERS:
+                match = pattern.search(text)
+                if match:
+                    self.counters[name] += int(match.group(1)) if match.groups() else 1
+        process.stderr.close()
+
+    def isOpened(self):
+        return self.alive and not self.finished and self.width > 0
+
+    def read(self):
+        """Block until a frame is buffered. Returns (False, None) once released, interrupted or out of retries."""
+        with self._state:
+            self._state.wait_for(lambda: self.buffer or self.interrupted or self.finished or not self.alive)
+            if not self.buffer or self.interrupted or not self.alive:
+                return False, None
+            if self.low_latency:
+                self.counters['skipped'] += len(self.buffer) - 1
+                frame, self.capture_time = self.buffer.pop()
+                self.buffer.clear()
+            else:
+                frame, self.capture_time = self.buffer.popleft()
+            self.counters['frames_read'] += 1
+        self.frame_index += 1
+        return True, frame
+
+    def interrupt(self):
+        """Wake a blocked read, which returns (False, None) from now on. Used when the detection thread stops."""
+        with self._state:
+            self.interrupted = True
+            self._state.notify_all()
+
+    def stats(self):
+        """Frame, drop, reconnect and packet-loss counters, plus the current buffer depth and frame age."""
+        with self._state:
+            stats = dict(self.counters)
+            stats['buffered'] = len(self.buffer)
+            stats['buffered_bytes'] = sum(frame.nbytes for frame, _ in self.buffer)
+            stats['connected'] = self.process is not None
+            stats['seconds_since_frame'] = round(time.perf_counter() - self.last_frame_time, 2) \
+                if self.last_frame_time else None
+        return stats
+
+    def nbytes(self):
+        """Bytes of decoded frames currently in the jitter buffer."""
+        with self._state:
+            return sum(frame.nbytes for frame, _ in self.buffer)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.frame_index
+        return 0  # Including CAP_PROP_FRAME_COUNT: a live stream has no length
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        with self._state:
+            if not self.alive:
+                return
+            self.alive = False
+            process = self.process
+            self._state.notify_all()
+        if process is not None and process.poll() is None:
+            process.kill()  # Unblocks the reader, which then cleans up the process
+        self.thread.join(timeout=5)
+        logging.info(f"Network source {self.source}: {json.dumps(self.stats())}")
+
+
+def serve(path, url, codec='libx264', gop=30, loop=True):
+    """Start ffmpeg replaying a file in real time as MPEG-TS to url, e.g. udp://127.0.0.1:5000. Returns the process."""
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-re']
+    if loop:
+        command += ['-stream_loop', '-1']
+    command += ['-i', path, '-an', '-sn']
+    if codec == 'copy':
+        command += ['-c:v', 'copy']
+    else:
+        command += ['-c:v', codec, '-preset', 'ultrafast', '-tune', 'zerolatency', '-g', str(gop)]
+    if url.lower().startswith('udp://') and 'pkt_size' not in url:
+        url = f"{url}{'&' if '?' in url else '?'}pkt_size=1316"  # Seven 188-byte TS packets per datagram
+    return subprocess.Popen(command + ['-f', 'mpegts', url], stdin=subprocess.DEVNULL)
+
+
+def watch(capture, seconds, interval=1.0, on_tick=None):
+    """Read from a capture for a while, printing throughput and the capture's stats every interval."""
+    start = tick = time.perf_counter()
+    frames = 0
+    while time.perf_counter() - start < seconds:
+        ret, _ = capture.read()
+        if not ret:
+            print("Stream ended")
+            break
+        frames += 1
+        now = time.perf_counter()
+        if now - tick >= interval:
+            print(f"{now - start:6.1f} s  {frames / (now - tick):5.1f} fps  {json.dumps(capture.stats())}")
+            if on_tick is not None:
+                on_tick(now - start)
+            tick, frames = now, 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve, watch and test live network sources")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="Replay a file as a live MPEG-TS stream")
+    serve_parser.add_argument('path')
+    serve_parser.add_argument('url', nargs='?', default='udp://127.0.0.1:5000')
+    serve_parser.add_argument('--codec', default='libx264', help="Video encoder, or copy to send the file's stream")
+
+    watch_parser = commands.add_parser('watch', help="Receive a stream and print frame rate and loss statistics")
+    watch_parser.add_argument('url')
+    watch_parser.add_argument('--seconds', type=float, default=30)
+
+    loopback_parser = commands.add_parser('loopback', help="Serve a file on loopback, receive it, and cut the stream "
+                                                           "once to check that the receiver reconnects")
+    loopback_parser.add_argument('path')
+    loopback_parser.add_argument('--port', type=int, default=5000)
+    loopback_parser.add_argument('--seconds', type=float, default=20)
+    loopback_parser.add_argument('--outage', type=float, default=3, help="Seconds the server is stopped for")
+
+    for sub in (watch_parser, loopback_parser):
+        sub.add_argument('--jitter-buffer', type=int, default=8)
+        sub.add_argument('--buffered', action='store_true', help="Read every frame instead of the newest")
+        sub.add_argument('--stall-timeout', type=float, default=2)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        process = serve(args.path, args.url, args.codec)
+        print(f"Serving {args.path} to {args.url}; Ctrl+C to stop")
+        try:
+            process.wait()
+        except KeyboardInterrupt:
+            process.terminate()
+        return
+
+    options = {'jitter_buffer': args.jitter_buffer, 'low_latency': not args.buffered,
+               'stall_timeout': args.stall_timeout, 'reconnect_delay': 0.25, 'max_reconnect_delay': 2}
+    if args.command == 'watch':
+        capture = NetworkCapture(args.url, **options)
+        try:
+            watch(capture, args.seconds)
+        finally:
+            capture.release()
+        return
+
+    url = f"udp://127.0.0.1:{args.port}"
+    server = serve(args.path, url)
+    time.sleep(1)  # Give the server a moment to start sending before the receiver probes
+    capture = NetworkCapture(url, **options)
+    if not capture.isOpened():
+        server.terminate()
+        sys.exit(f"Could not receive {url}")
+
+    state = {'server': server, 'cut_at': args.seconds / 3, 'frames_at_restart': None}
+
+    def cut_stream(elapsed):
+        if state['cut_at'] is not None and elapsed >= state['cut_at']:
+            print(f"Stopping the server for {args.outage:.0f} s")
+            state['server'].terminate()
+            state['server'].wait()
+            time.sleep(args.outage)
+            state['server'] = serve(args.path, url)
+            state['cut_at'] = None
+            state['frames_at_restart'] = capture.stats()['frames_received']
+
+    try:
+        watch(capture, args.seconds, on_tick=cut_stream)
+    finally:
+        stats = capture.stats()
+        capture.release()
+        state['server'].terminate()
+    recovered = state['frames_at_restart'] is not None and stats['frames_received'] > state['frames_at_restart']
+    print(f"Reconnects: {stats['reconnects']}, frames after the outage: {'yes' if recovered else 'no'}")
+    sys.exit(0 if recovered else 1)
+
+
+if __name__ == '__main__':
+    main()
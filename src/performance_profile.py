@@ -0,0 +1,43 @@
+import os
+import platform
+import socket
+
+import torch
+import yaml
+
+PROFILE_PATH = 'config/performance_profile.yaml'
+
+# 'live' minimises per-frame latency for the GUI, 'offline' maximises throughput for batch processing
+PROFILE_MODES = ('live', 'offline')
+
+
+def machine_fingerprint():
+    """Describe the hardware a profile was tuned on so it is not silently reused on another machine."""
+    return {
+        'host': socket.gethostname(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'gpu': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        'torch': torch.__version__,
+    }
+
+
+def load_profile(mode, path=PROFILE_PATH):
+    """Return the tuned settings for the given mode, or None if this machine has not been tuned."""
+    if mode is None or not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as file:
+        data = yaml.safe_load(file) or {}
+
+    if data.get('machine') != machine_fingerprint():
+        print("Performance profile was tuned on a different machine; ignoring it. Re-run `python -m src.autotune`.")
+        return None
+    return data.get('profiles', {}).get(mode)
+
+
+def save_profiles(profiles, measurements=(), path=PROFILE_PATH):
+    """Save the per-mode profiles together with the machine fingerprint and the raw sweep measurements."""
+    data = {'machine': machine_fingerprint(), 'profiles': profiles, 'measurements': list(measurements)}
+    with open(path, 'w') as file:
+        yaml.safe_dump(data, file, sort_keys=False)
@@ -0,0 +1,63 @@
+import cv2
+import numpy as np
+
+
+class RegionMask:
+    """Region of interest and exclusion zones for a video.
+
+    Polygons are given as ``[[x, y], ...]`` in normalised 0-1 frame coordinates so they stay valid across
+    resolutions. Inference is cropped to the bounding rectangle of the ROI, and detections whose centre falls
+    outside the ROI polygon or inside an exclusion polygon are dropped.
+    """
+
+    def __init__(self, roi=None, exclude=()):
+        self.roi = [tuple(point) for point in roi] if roi and len(roi) >= 3 else None
+        self.exclude = [[tuple(point) for point in polygon] for polygon in exclude or () if len(polygon) >= 3]
+        self.__size = None
+        self.crop_box = None
+        self.mask = None
+
+    def is_empty(self):
+        return self.roi is None and not self.exclude
+
+    def resolve(self, width, height):
+        """Compute the pixel crop rectangle and the exclusion mask for a frame size. Cached per size."""
+        if self.__size == (width, height):
+            return
+        self.__size = (width, height)
+        scale = np.array([width, height], np.float32)
+
+        if self.roi is None:
+            self.crop_box = (0, 0, width, height)
+            mask = np.zeros((height, width), np.uint8)
+        else:
+            roi = np.round(np.array(self.roi, np.float32) * scale).astype(np.int32)
+            x, y, w, h = cv2.boundingRect(roi)
+            x1, y1 = max(x, 0), max(y, 0)
+            self.crop_box = (x1, y1, max(min(x + w, width), x1 + 1), max(min(y + h, height), y1 + 1))
+            # Everything outside the ROI polygon counts as excluded
+            mask = np.ones((height, width), np.uint8)
+            cv2.fillPoly(mask, [roi], 0)
+
+        for polygon in self.exclude:
+            cv2.fillPoly(mask, [np.round(np.array(polygon, np.float32) * scale).astype(np.int32)], 1)
+
+        self.mask = mask if mask.any() else None
+
+    def crop(self, frame):
+        """Return a view of the frame cropped to the ROI bounding rectangle, and the crop offset."""
+        height, width = frame.shape[:2]
+        self.resolve(width, height)
+        x1, y1, x2, y2 = self.crop_box
+        if (x1, y1, x2, y2) == (0, 0, width, height):
+            return frame, (0, 0)
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def keep(self, xyxy):
+        """Return a boolean mask of the boxes (in full-frame pixels) whose centre is not excluded."""
+        if self.mask is None or len(xyxy) == 0:
+            return np.ones(len(xyxy), bool)
+        height, width = self.mask.shape
+        centre_x = np.clip(((xyxy[:, 0] + xyxy[:, 2]) / 2).astype(int), 0, width - 1)
+        centre_y = np.clip(((xyxy[:, 1] + xyxy[:, 3]) / 2).astype(int), 0, height - 1)
+        return self.mask[centre_y, centre_x] == 0
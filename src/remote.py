@@ -0,0 +1,528 @@
+"""Remote inference workers.
+
+Lets the detection stage send batches of frames to worker processes over TCP or Unix sockets. Every message is a
+fixed header (magic, protocol version, message type, request id, payload length) followed by a binary payload:
+frames travel as JPEG or raw BGR, detections come back as (N, 7) float32 arrays (see ``Detections.to_array``).
+
+Workers are stateless: they only detect. The client keeps a bounded number of batches in flight per worker, pings
+idle workers, resends the batches of a worker that dies or stops answering, and hands results back in submission
+order so tracking can run on the client.
+
+Usage:
+    python -m src.remote worker --bind tcp://0.0.0.0:5600
+    python -m src.remote local --workers 3               # run workers on localhost until interrupted
+    python -m src.remote check tcp://10.0.0.5:5600       # health check
+    python -m src.remote bench test_flight.mp4 --workers 2
+"""
+import argparse
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from collections import deque
+from threading import Thread, Lock, Condition
+
+import cv2
+import numpy as np
+import yaml
+
+from src.detections import Detections
+
+MAGIC = b'IEYE'
+VERSION = 1
+HEADER = struct.Struct('!4sBBQI')  # magic, protocol version, message type, request id, payload length
+FRAME_HEADER = struct.Struct('!HHBI')  # height, width, encoding, data length
+SETTINGS_LENGTH = struct.Struct('!I')
+COUNT = struct.Struct('!H')
+BOX_COUNT = struct.Struct('!I')
+
+MSG_PING, MSG_PONG, MSG_DETECT, MSG_RESULT, MSG_ERROR = 1, 2, 3, 4, 5
+ENCODING_RAW, ENCODING_JPEG = 0, 1
+ENCODINGS = {'raw': ENCODING_RAW, 'jpeg': ENCODING_JPEG}
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def parse_address(address):
+    """Split 'tcp://host:port' or 'unix:///path/to.sock' into a socket family and address."""
+    if address.startswith('unix://'):
+        return socket.AF_UNIX, address[len('unix://'):]
+    if address.startswith('tcp://'):
+        host, _, port = address[len('tcp://'):].rpartition(':')
+        return socket.AF_INET, (host, int(port))
+    raise ValueError(f"Unsupported worker address {address}; use tcp://host:port or unix:///path")
+
+
+def connect(address, timeout):
+    family, target = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(target)
+    sock.settimeout(None)
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Connection closed by peer")
+        received += count
+    return buffer
+
+
+def send_message(sock, message_type, request_id, payload=b''):
+    sock.sendall(HEADER.pack(MAGIC, VERSION, message_type, request_id, len(payload)))
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_message(sock):
+    magic, version, message_type, request_id, length = HEADER.unpack(recv_exact(sock, HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError(f"Unexpected message header {magic!r} v{version}")
+    return message_type, request_id, recv_exact(sock, length) if length else b''
+
+
+def encode_frames(frames, settings, encoding=ENCODING_JPEG, jpeg_quality=90):
+    settings_bytes = json.dumps(settings).encode('utf-8')
+    parts = [SETTINGS_LENGTH.pack(len(settings_bytes)), settings_bytes, COUNT.pack(len(frames))]
+    for frame in frames:
+        if encoding == ENCODING_JPEG:
+            ok, data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+            if not ok:
+                raise ValueError("JPEG encoding failed")
+        else:
+            data = np.ascontiguousarray(frame)
+        parts += [FRAME_HEADER.pack(frame.shape[0], frame.shape[1], encoding, data.nbytes), data.data]
+    return b''.join(parts)
+
+
+def decode_frames(payload):
+    view = memoryview(payload)
+    (length,) = SETTINGS_LENGTH.unpack_from(view, 0)
+    offset = SETTINGS_LENGTH.size
+    settings = json.loads(bytes(view[offset:offset + length]))
+    offset += length
+    (count,) = COUNT.unpack_from(view, offset)
+    offset += COUNT.size
+
+    frames = []
+    for _ in range(count):
+        height, width, encoding, length = FRAME_HEADER.unpack_from(view, offset)
+        offset += FRAME_HEADER.size
+        data = np.frombuffer(view[offset:offset + length], np.uint8)
+        offset += length
+        if encoding == ENCODING_JPEG:
+            frames.append(cv2.imdecode(data, cv2.IMREAD_COLOR))
+        else:
+            frames.append(data.reshape(height, width, 3))
+    return settings, frames
+
+
+def encode_detections(detections):
+    parts = [COUNT.pack(len(detections))]
+    for frame_detections in detections:
+        parts += [BOX_COUNT.pack(len(frame_detections)), frame_detections.to_array().astype('<f4').tobytes()]
+    return b''.join(parts)
+
+
+def decode_detections(payload):
+    view = memoryview(payload)
+    (count,) = COUNT.unpack_from(view, 0)
+    offset = COUNT.size
+    detections = []
+    for _ in range(count):
+        (boxes,) = BOX_COUNT.unpack_from(view, offset)
+        offset += BOX_COUNT.size
+        detections.append(Detections.from_array(np.frombuffer(view[offset:offset + boxes * 28], '<f4')))
+        offset += boxes * 28
+    return detections
+
+
+class InferenceWorker:
+    """Serves detection requests from any number of connections, one batch at a time."""
+
+    def __init__(self, model_path, threads=None):
+        from src.threads import DetectionProcessor  # Only worker processes need the model
+
+        self.detector = DetectionProcessor(None, model_path, None, profile='offline')
+        # Tracking runs on the client, which sees the frames in order
+        self.detector.update_settings(self.detector.settings.replace(use_tracking=False))
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.lock = Lock()
+
+    def detect(self, settings, frames):
+        with self.lock:
+            detector = self.detector
+            class_thresholds = {int(cls): value for cls, value in settings['class_thresholds'].items()}
+            detector.update_settings(detector.settings.replace(conf_thres=settings['conf_thres'],
+                                                               omit_classes=settings['omit_classes'],
+                                                               class_thresholds=class_thresholds))
+            detector.imgsz = settings['imgsz']
+            return detector.detect(frames)
+
+    def handle(self, sock):
+        with sock:
+            while True:
+                try:
+                    message_type, request_id, payload = recv_message(sock)
+                except (ConnectionError, OSError, ProtocolError):
+                    return
+
+                if message_type == MSG_PING:
+                    send_message(sock, MSG_PONG, request_id)
+                elif message_type == MSG_DETECT:
+                    try:
+                        settings, frames = decode_frames(payload)
+                        send_message(sock, MSG_RESULT, request_id, encode_detections(self.detect(settings, frames)))
+                    except OSError:
+                        return
+                    except Exception as e:
+                        send_message(sock, MSG_ERROR, request_id, str(e).encode('utf-8'))
+
+    def serve(self, address):
+        family, target = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(target):
+            os.remove(target)
+
+        server = socket.socket(family, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(target)
+        server.listen()
+        print(f"Inference worker listening on {address}")
+        while True:
+            sock, _ = server.accept()
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            Thread(target=self.handle, args=(sock,), daemon=True).start()
+
+
+class WorkerConnection:
+    def __init__(self, address):
+        self.address = address
+        self.sock = None
+        self.healthy = False
+        self.last_seen = 0.0
+        self.in_flight = {}  # request id -> (time sent, payload), kept so the batch can be resent elsewhere
+        self.send_lock = Lock()
+
+    def send(self, message_type, request_id, payload=b''):
+        with self.send_lock:
+            send_message(self.sock, message_type, request_id, payload)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+
+
+class RemoteDetector:
+    """Client side of the worker pool: load balancing, in-flight limits, health checks and in-order results."""
+
+    def __init__(self, addresses, max_in_flight=2, encoding='jpeg', jpeg_quality=90, timeout=10.0,
+                 health_interval=2.0):
+        self.workers = [WorkerConnection(address) for address in addresses]
+        self.max_in_flight = max_in_flight
+        self.encoding = ENCODINGS[encoding]
+        self.jpeg_quality = jpeg_quality
+        self.timeout = timeout
+        self.health_interval = health_interval
+
+        self._state = Condition()
+        self.alive = True
+        self.next_request = 0  # Id given to the next submitted batch
+        self.next_result = 0  # Id of the next batch to hand back, so results leave in submission order
+        self.contexts = {}  # request id -> caller context
+        self.completed = {}  # request id -> detections, or None if the batch failed
+        self.retry = deque()  # (request id, payload) of batches whose worker failed
+
+        for worker in self.workers:
+            self.__connect(worker)
+        Thread(target=self.__monitor, daemon=True).start()
+
+    def submit(self, frames, settings, context=None):
+        """Send a batch to the least loaded healthy worker. Blocks while every worker is at its in-flight limit."""
+        payload = encode_frames(frames, settings, self.encoding, self.jpeg_quality)
+        with self._state:
+            request_id = self.next_request
+            self.next_request += 1
+            self.contexts[request_id] = context
+        self.__dispatch(request_id, payload)
+        return request_id
+
+    def collect(self, wait=False):
+        """Return finished batches as (context, detections) pairs in submission order.
+
+        Without wait only the batches that are already back are returned; with wait this blocks until every
+        submitted batch has been answered. Failed batches are returned with detections set to None.
+        """
+        ready = []
+        with self._state:
+            while True:
+                while self.next_result in self.completed:
+                    request_id = self.next_result
+                    ready.append((self.contexts.pop(request_id), self.completed.pop(request_id)))
+                    self.next_result += 1
+                if not wait or self.next_result == self.next_request or not self.alive:
+                    return ready
+                if not self._state.wait(self.timeout * 2) and self.next_result not in self.completed:
+                    # Nothing came back in time: give up on the outstanding batches rather than hang
+                    for request_id in range(self.next_result, self.next_request):
+                        self.completed.setdefault(request_id, None)
+
+    def healthy_workers(self):
+        return [worker.address for worker in self.workers if worker.healthy]
+
+    def close(self):
+        with self._state:
+            self.alive = False
+            self._state.notify_all()
+        for worker in self.workers:
+            worker.close()
+
+    def __free_worker(self):
+        candidates = [worker for worker in self.workers
+                      if worker.healthy and len(worker.in_flight) < self.max_in_flight]
+        return min(candidates, key=lambda worker: len(worker.in_flight), default=None)
+
+    def __dispatch(self, request_id, payload):
+        with self._state:
+            if not self._state.wait_for(lambda: self.__free_worker() is not None or not self.alive, self.timeout):
+                self.completed[request_id] = None
+                self._state.notify_all()
+                raise ConnectionError("No healthy inference worker is available")
+            if not self.alive:
+                return
+            worker = self.__free_worker()
+            worker.in_flight[request_id] = (time.monotonic(), payload)
+
+        try:
+            worker.send(MSG_DETECT, request_id, payload)
+        except OSError:
+            self.__worker_failed(worker)
+
+    def __connect(self, worker):
+        try:
+            sock = connect(worker.address, self.timeout)
+        except OSError:
+            return False
+        with self._state:
+            worker.sock = sock
+            worker.healthy = True
+            worker.last_seen = time.monotonic()
+            self._state.notify_all()
+        Thread(target=self.__receive, args=(worker, sock), daemon=True).start()
+        return True
+
+    def __receive(self, worker, sock):
+        try:
+            while True:
+                message_type, request_id, payload = recv_message(sock)
+                worker.last_seen = time.monotonic()
+                if message_type == MSG_PONG:
+                    continue
+
+                detections = decode_detections(payload) if message_type == MSG_RESULT else None
+                if message_type == MSG_ERROR:
+                    print(f"Inference worker {worker.address} failed batch {request_id}: {payload.decode()}")
+                with self._state:
+                    # Ignore answers for batches that were already moved to another worker
+                    if worker.in_flight.pop(request_id, None) is not None:
+                        self.completed[request_id] = detections
+                    self._state.notify_all()
+        except (ConnectionError, OSError, ProtocolError):
+            if sock is worker.sock:
+                self.__worker_failed(worker)
+
+    def __worker_failed(self, worker):
+        with self._state:
+            if not worker.healthy:
+                return
+            worker.healthy = False
+            orphans = sorted((request_id, payload) for request_id, (_, payload) in worker.in_flight.items())
+            worker.in_flight.clear()
+            self.retry.extend(orphans)
+            self._state.notify_all()
+        worker.close()
+        if self.alive:
+            print(f"Inference worker {worker.address} is unavailable; resending {len(orphans)} batches")
+
+    def __monitor(self):
+        while self.alive:
+            now = time.monotonic()
+            for worker in self.workers:
+                if not worker.healthy:
+                    self.__connect(worker)
+                    continue
+
+                with self._state:
+                    oldest = min((sent for sent, _ in worker.in_flight.values()), default=None)
+                if oldest is not None and now - oldest > self.timeout:
+                    self.__worker_failed(worker)  # Stuck on a batch
+                elif oldest is None and now - worker.last_seen > self.timeout:
+                    self.__worker_failed(worker)  # Stopped answering pings
+                elif now - worker.last_seen > self.health_interval:
+                    try:
+                        worker.send(MSG_PING, 0)
+                    except OSError:
+                        self.__worker_failed(worker)
+
+            while self.retry and self.alive:
+                request_id, payload = self.retry.popleft()
+                try:
+                    self.__dispatch(request_id, payload)
+                except ConnectionError as e:
+                    print(f"Dropping batch {request_id}: {e}")
+
+            with self._state:
+                self._state.wait_for(lambda: not self.alive or bool(self.retry), self.health_interval)
+
+
+def wait_until_ready(addresses, timeout=120.0):
+    """Wait until every worker answers a ping; workers need a while to load the model."""
+    deadline = time.monotonic() + timeout
+    for address in addresses:
+        while True:
+            try:
+                with connect(address, 1.0) as sock:
+                    send_message(sock, MSG_PING, 0)
+                    recv_message(sock)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Inference worker {address} did not start")
+                time.sleep(0.5)
+
+
+def launch_local_workers(count, model_path, transport='tcp', base_port=5600):
+    """Start worker processes on this machine and return them with their addresses once they are ready."""
+    threads = max(1, (os.cpu_count() or 1) // count)
+    processes, addresses = [], []
+    for index in range(count):
+        if transport == 'unix':
+            address = f"unix:///tmp/icarus-worker-{os.getpid()}-{index}.sock"
+        else:
+            address = f"tcp://127.0.0.1:{base_port + index}"
+        processes.append(subprocess.Popen([sys.executable, '-m', 'src.remote', 'worker', '--bind', address,
+                                           '--model', model_path, '--threads', str(threads)]))
+        addresses.append(address)
+
+    try:
+        wait_until_ready(addresses)
+    except TimeoutError:
+        for process in processes:
+            process.kill()
+        raise
+    return processes, addresses
+
+
+def check(addresses):
+    for address in addresses:
+        start_time = time.perf_counter()
+        try:
+            with connect(address, 5.0) as sock:
+                send_message(sock, MSG_PING, 0)
+                recv_message(sock)
+            print(f"{address}: ok ({1000 * (time.perf_counter() - start_time):.1f} ms)")
+        except (OSError, ProtocolError) as e:
+            print(f"{address}: unavailable ({e})")
+
+
+def bench(clip, model_path, workers, batch_size, encoding, transport):
+    """Run a clip through local workers, checking that results come back complete and in order."""
+    processes, addresses = launch_local_workers(workers, model_path, transport)
+    detector = RemoteDetector(addresses, encoding=encoding)
+    settings = {'conf_thres': 0.25, 'omit_classes': [], 'class_thresholds': {}, 'imgsz': 640}
+    try:
+        cap = cv2.VideoCapture(clip)
+        expected, received = 0, []
+        start_time = time.perf_counter()
+        while True:
+            frames = []
+            while len(frames) < batch_size:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frames.append(frame)
+            if not frames:
+                break
+            detector.submit(frames, settings, context=expected)
+            expected += 1
+            received += [context for context, _ in detector.collect()]
+        received += [context for context, _ in detector.collect(wait=True)]
+        elapsed = time.perf_counter() - start_time
+        cap.release()
+
+        in_order = received == list(range(expected))
+        print(f"{expected} batches of {batch_size} through {workers} workers in {elapsed:.2f}s "
+              f"({expected * batch_size / elapsed:.1f} FPS); results in order: {in_order}")
+    finally:
+        detector.close()
+        for process in processes:
+            process.terminate()
+
+
+def main(argv=None):
+    with open('config/config.yaml', 'r') as file:
+        config = yaml.safe_load(file)
+
+    parser = argparse.ArgumentParser(description="Remote inference workers.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    worker_parser = commands.add_parser('worker', help="Serve detection requests")
+    worker_parser.add_argument('--bind', default='tcp://127.0.0.1:5600')
+    worker_parser.add_argument('--model', default=config['model']['yolov8s'])
+    worker_parser.add_argument('--threads', type=int, default=None)
+
+    local_parser = commands.add_parser('local', help="Run several workers on this machine")
+    local_parser.add_argument('--workers', type=int, default=2)
+    local_parser.add_argument('--model', default=config['model']['yolov8s'])
+    local_parser.add_argument('--transport', choices=['tcp', 'unix'], default='tcp')
+
+    check_parser = commands.add_parser('check', help="Ping workers")
+    check_parser.add_argument('addresses', nargs='+')
+
+    bench_parser = commands.add_parser('bench', help="Run a clip through local workers")
+    bench_parser.add_argument('clip')
+    bench_parser.add_argument('--workers', type=int, default=2)
+    bench_parser.add_argument('--model', default=config['model']['yolov8s'])
+    bench_parser.add_argument('--batch-size', type=int, default=4)
+    bench_parser.add_argument('--encoding', choices=list(ENCODINGS), default='jpeg')
+    bench_parser.add_argument('--transport', choices=['tcp', 'unix'], default='tcp')
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        InferenceWorker(args.model, args.threads).serve(args.bind)
+    elif args.command == 'local':
+        processes, addresses = launch_local_workers(args.workers, args.model, args.transport)
+        print(f"Workers ready: {', '.join(addresses)}")
+        try:
+            for process in processes:
+                process.wait()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+    elif args.command == 'check':
+        check(args.addresses)
+    else:
+        bench(args.clip, args.model, args.workers, args.batch_size, args.encoding, args.transport)
+
+
+if __name__ == '__main__':
+    main()
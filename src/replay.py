@@ -0,0 +1,226 @@
+"""Deterministic replay for benchmarking.
+
+Runs the detection pipeline over every frame of a recording, in order, with fixed batch boundaries and a virtual
+clock (frame index / FPS) instead of wall-clock pacing, so no frame is ever skipped or dropped and two runs with the
+same settings do the same work. The detections of every frame are hashed into a single digest: an optimisation must
+leave the digest unchanged, and its timing can then be compared with a baseline run on equal terms.
+
+Usage:
+    python -m src.replay test_flight.mp4 --output output/replay/baseline.json
+    python -m src.replay test_flight.mp4 --compare output/replay/baseline.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+import yaml
+
+from src.regions import RegionMask
+from src.threads import DetectionProcessor
+from src.video_stream import open_capture
+
+
+def make_deterministic(seed=0):
+    """Seed torch and ask for deterministic kernels, so repeated runs on one machine give bit-identical detections."""
+    os.environ.setdefault('CUBLAS_WORKSPACE_CONFIG', ':4096:8')  # Needed by deterministic cuBLAS; set before CUDA init
+    torch.manual_seed(seed)
+    torch.use_deterministic_algorithms(True, warn_only=True)
+    torch.backends.cudnn.benchmark = False
+    torch.backends.cudnn.deterministic = True
+
+
+class DetectionDigest:
+    """Running SHA-256 of the detections of every frame, plus a short digest per frame to locate the first change.
+
+    With ``decimals`` the boxes and confidences are rounded before hashing, for comparisons that should tolerate
+    floating point noise (e.g. across GPUs); by default the float32 values are hashed exactly.
+    """
+
+    def __init__(self, decimals=None):
+        self.decimals = decimals
+        self.total = hashlib.sha256()
+        self.frames = []
+        self.boxes = 0
+
+    def update(self, frame_index, detections):
+        array = detections.to_array()
+        if self.decimals is not None:
+            array = np.round(array, self.decimals).astype(np.float32)
+        frame_hash = hashlib.sha256(frame_index.to_bytes(8, 'little') + array.tobytes())
+        self.total.update(frame_hash.digest())
+        self.frames.append(frame_hash.hexdigest()[:16])
+        self.boxes += len(detections)
+
+    def hexdigest(self):
+        return self.total.hexdigest()
+
+
+def percentile_ms(values, percentile):
+    return round(float(np.percentile(values, percentile)) * 1000, 2) if values else None
+
+
+def replay(path, model_path, settings, batch_size=4, imgsz=640, device='cpu', half=False, threads=0, max_frames=0,
+           warmup_batches=2, decimals=None):
+    """Detect every frame of a recording in order and return the report: output digest, counts and timings."""
+    make_deterministic()
+    cap = open_capture(path, settings['backend'], settings['ffmpeg'])
+    if not cap.isOpened():
+        raise IOError(f"Unable to open video source {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+
+    regions = RegionMask(settings['regions'].get('roi'), settings['regions'].get('exclude'))
+    detector = DetectionProcessor(cap, model_path, None, profile=None, conf_thres=settings['conf_thres'],
+                                  omit_classes=settings['omit_classes'], class_thresholds=settings['class_thresholds'],
+                                  regions=regions, tracker_settings=settings['tracker'])
+    # Pinned here instead of read from the machine's performance profile, so every machine runs the same batches
+    detector.apply_profile({'device': device, 'half': half, 'batch_size': batch_size, 'imgsz': imgsz,
+                            'threads': threads})
+    detector.update_settings(detector.settings.replace(use_tracking=settings['use_tracking']))
+    detector.reset_tracker()
+
+    digest = DetectionDigest(decimals)
+    decode_seconds, batch_seconds = 0.0, []
+    timed_frames = 0
+    frame_index = 0
+    batch_index = 0
+    finished = False
+    try:
+        while not finished:
+            # Fixed batch boundaries: always batch_size frames, only the last batch of the clip may be shorter
+            frames = []
+            start = time.perf_counter()
+            while len(frames) < detector.batch_size:
+                if max_frames and frame_index + len(frames) >= max_frames:
+                    finished = True
+                    break
+                ret, frame = cap.read()
+                if not ret:
+                    finished = True
+                    break
+                frames.append(frame.copy() if getattr(cap, 'borrowed_frames', False) else frame)
+            if batch_index >= warmup_batches:
+                decode_seconds += time.perf_counter() - start
+            if not frames:
+                break
+
+            start = time.perf_counter()
+            detections = detector.detect(frames)
+            if detector.device.type == 'cuda':
+                torch.cuda.synchronize()
+            if batch_index >= warmup_batches:
+                batch_seconds.append(time.perf_counter() - start)
+                timed_frames += len(frames)
+
+            for frame_detections in detections:
+                digest.update(frame_index, frame_detections)  # Virtual clock: frame_index / fps, never wall time
+                frame_index += 1
+            batch_index += 1
+    finally:
+        cap.release()
+
+    detect_seconds = sum(batch_seconds)
+    return {
+        'clip': os.path.abspath(path), 'model': model_path, 'digest': digest.hexdigest(),
+        'frames': frame_index, 'boxes': digest.boxes, 'virtual_duration_s': round(frame_index / fps, 3),
+        'settings': {'batch_size': detector.batch_size, 'imgsz': detector.imgsz, 'device': detector.device.type,
+                     'half': detector.half, 'threads': torch.get_num_threads(), 'decimals': decimals,
+                     'backend': settings['backend'], 'use_tracking': settings['use_tracking'],
+                     'conf_thres': settings['conf_thres'], 'torch': torch.__version__},
+        'timing': {'warmup_batches': warmup_batches, 'timed_frames': timed_frames,
+                   'decode_s': round(decode_seconds, 3), 'detect_s': round(detect_seconds, 3),
+                   'detect_fps': round(timed_frames / detect_seconds, 2) if detect_seconds else None,
+                   'batch_p50_ms': percentile_ms(batch_seconds, 50), 'batch_p95_ms': percentile_ms(batch_seconds, 95)},
+        'frame_digests': digest.frames,
+    }
+
+
+def compare(report, baseline):
+    """Check a run against a baseline report. Returns True if their detections are identical."""
+    if report['settings'] != baseline['settings']:
+        changed = sorted(key for key in set(report['settings']) | set(baseline['settings'])
+                         if report['settings'].get(key) != baseline['settings'].get(key))
+        print(f"Warning: settings differ from the baseline ({', '.join(changed)}); timings are not comparable")
+
+    identical = report['digest'] == baseline['digest']
+    if identical:
+        print(f"Identical output: {report['frames']} frames, {report['boxes']} boxes ({report['digest'][:16]})")
+    else:
+        first = next((index for index, (a, b) in enumerate(zip(report['frame_digests'], baseline['frame_digests']))
+                      if a != b), min(len(report['frame_digests']), len(baseline['frame_digests'])))
+        print(f"Output differs from the baseline, first at frame {first} "
+              f"({report['boxes']} boxes vs {baseline['boxes']})")
+
+    fps, baseline_fps = report['timing']['detect_fps'], baseline['timing']['detect_fps']
+    if fps and baseline_fps:
+        print(f"Detection: {fps:.2f} FPS vs {baseline_fps:.2f} FPS baseline ({fps / baseline_fps:.2f}x)")
+    return identical
+
+
+def main(argv=None):
+    with open('config/config.yaml', 'r') as file:
+        config = yaml.safe_load(file)
+    replay_config = config.get('replay', {})
+    name_id_map = {details['class']: class_id for class_id, details in config['class_details'].items()}
+    class_thresholds = config['detection'].get('class_thresholds') or {}
+
+    parser = argparse.ArgumentParser(description="Replay a recording deterministically and hash the detections.")
+    parser.add_argument('clip', nargs='?', default=config['video']['source'])
+    parser.add_argument('--model', default=config['model']['yolov8s'])
+    parser.add_argument('--batch-size', type=int, default=replay_config.get('batch_size', 4))
+    parser.add_argument('--imgsz', type=int, default=replay_config.get('imgsz', 640))
+    parser.add_argument('--device', default=replay_config.get('device', 'cpu'))
+    parser.add_argument('--half', action='store_true', help="fp16 inference (CUDA only)")
+    parser.add_argument('--threads', type=int, default=replay_config.get('threads', 0),
+                        help="Torch intra-op threads, 0 for the torch default")
+    parser.add_argument('--frames', type=int, default=0, help="Stop after this many frames, 0 for the whole clip")
+    parser.add_argument('--warmup', type=int, default=replay_config.get('warmup_batches', 2),
+                        help="Batches processed and hashed but left out of the timings")
+    parser.add_argument('--decimals', type=int, default=None,
+                        help="Round boxes and confidences before hashing, to compare across hardware")
+    parser.add_argument('--no-tracking', action='store_true')
+    parser.add_argument('--compare', default=None, help="Baseline report to check the output and timings against")
+    parser.add_argument('--output', default=os.path.join(replay_config.get('output_dir', 'output/replay'),
+                                                         f"replay-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    args = parser.parse_args(argv)
+
+    settings = {
+        'use_tracking': not args.no_tracking,
+        'conf_thres': config['detection']['confidence_threshold'],
+        'omit_classes': [name_id_map.get(cls, cls) for cls in config['detection']['omit_classes']],
+        'class_thresholds': {name_id_map[name]: float(value) for name, value in class_thresholds.items()
+                             if name in name_id_map},
+        'regions': config.get('regions') or {},
+        'tracker': {**(config.get('tracker') or {}), 'embedder': config['model'].get('deepsort')},
+        'backend': config['video'].get('backend', 'opencv'),
+        'ffmpeg': config.get('ffmpeg') or {},
+    }
+    report = replay(args.clip, args.model, settings, batch_size=args.batch_size, imgsz=args.imgsz,
+                    device=args.device, half=args.half, threads=args.threads, max_frames=args.frames,
+                    warmup_batches=args.warmup, decimals=args.decimals)
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    timing = report['timing']
+    print(f"{report['frames']} frames, {report['boxes']} boxes, digest {report['digest']}")
+    print(f"Detection {timing['detect_fps']} FPS (batch p50 {timing['batch_p50_ms']} ms, "
+          f"p95 {timing['batch_p95_ms']} ms), decoding {timing['decode_s']} s")
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        if not compare(report, baseline):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import itertools
+from types import MappingProxyType
+
+import numpy as np
+
+# Colours of the multicolour class groups (BGR); classes not listed, and every class in single-colour mode, use green
+CLASS_GROUP_COLORS = {0: (255, 0, 0), 1: (255, 0, 0), 2: (0, 255, 0), 3: (0, 0, 255), 4: (255, 255, 0),
+                      5: (255, 0, 255), 6: (0, 255, 255), 7: (255, 255, 255), 8: (255, 255, 255), 9: (255, 255, 255)}
+DEFAULT_COLOR = (0, 255, 0)
+
+_versions = itertools.count(1)
+
+
+def build_class_thresholds(num_classes, conf_thres, class_thresholds=None):
+    """Return an array holding the minimum confidence of every class id.
+
+    Classes listed in ``class_thresholds`` (class id -> confidence) override the global threshold.
+    """
+    thresholds = np.full(num_classes, conf_thres, np.float32)
+    for cls, value in (class_thresholds or {}).items():
+        if 0 <= cls < num_classes:
+            thresholds[cls] = value
+    return thresholds
+
+
+def build_color_lut(num_classes, multicolor):
+    """Return the BGR colour of every class id as an (N, 3) uint8 array, either per class group or all green."""
+    lut = np.tile(np.array(DEFAULT_COLOR, np.uint8), (num_classes, 1))
+    if multicolor:
+        for cls, color in CLASS_GROUP_COLORS.items():
+            if cls < num_classes:
+                lut[cls] = color
+    return lut
+
+
+class RuntimeSettings:
+    """Immutable, versioned snapshot of the detection and render parameters the GUI can change.
+
+    Every change builds a new snapshot (``replace``) and hands the same object to both processors, which swap it in
+    with one reference assignment. Their hot loops read the reference once per batch or frame, so a frame never mixes
+    old and new settings, and no lock is taken. The lookup tables are built here, once per change:
+
+    - ``thresholds``: minimum confidence of every class id (float32), per-class overrides applied
+    - ``class_mask``: True for every class id that is not omitted
+    - ``color_lut``: BGR colour of every class id (uint8), with ``colors`` holding the same as tuples for OpenCV
+    - ``allowed_classes``, ``conf_floor``, ``per_class_filter``: the filters passed into the model call, so NMS only
+      sees candidates that can survive; stricter per-class thresholds are applied after it
+    """
+
+    __slots__ = ('version', 'num_classes', 'conf_thres', 'class_thresholds', 'omit_classes', 'max_boxes',
+                 'use_tracking', 'multicolor', 'thresholds', 'class_mask', 'color_lut', 'colors', 'allowed_classes',
+                 'conf_floor', 'per_class_filter')
+
+    def __init__(self, num_classes, conf_thres=0.5, class_thresholds=None, omit_classes=(), max_boxes=100,
+                 use_tracking=True, multicolor=False):
+        thresholds = build_class_thresholds(num_classes, conf_thres, class_thresholds)
+        class_mask = np.ones(num_classes, bool)
+        omitted = [cls for cls in omit_classes if 0 <= cls < num_classes]
+        class_mask[omitted] = False
+        color_lut = build_color_lut(num_classes, multicolor)
+        allowed = np.flatnonzero(class_mask)
+        conf_floor = float(thresholds[allowed].min()) if len(allowed) else 1.0
+        for array in (thresholds, class_mask, color_lut):
+            array.flags.writeable = False
+
+        values = {
+            'version': next(_versions), 'num_classes': num_classes, 'conf_thres': conf_thres,
+            'class_thresholds': MappingProxyType(dict(class_thresholds or {})), 'omit_classes': tuple(omit_classes),
+            'max_boxes': max_boxes, 'use_tracking': use_tracking, 'multicolor': multicolor,
+            'thresholds': thresholds, 'class_mask': class_mask, 'color_lut': color_lut,
+            'colors': tuple(tuple(color) for color in color_lut.tolist()),
+            'allowed_classes': allowed.tolist() if len(allowed) < num_classes else None,
+            'conf_floor': conf_floor,
+            'per_class_filter': bool(len(allowed)) and bool((thresholds[allowed] > conf_floor).any()),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuntimeSettings is immutable; build a new snapshot with replace()")
+
+    def replace(self, **changes):
+        """Return a new snapshot with some parameters changed; it gets a new version."""
+        parameters = {'conf_thres': self.conf_thres, 'class_thresholds': dict(self.class_thresholds),
+                      'omit_classes': self.omit_classes, 'max_boxes': self.max_boxes,
+                      'use_tracking': self.use_tracking, 'multicolor': self.multicolor}
+        parameters.update(changes)
+        return RuntimeSettings(self.num_classes, **parameters)
+
+    def __repr__(self):
+        return (f"RuntimeSettings(version={self.version}, conf_thres={self.conf_thres}, "
+                f"omit_classes={self.omit_classes}, max_boxes={self.max_boxes}, use_tracking={self.use_tracking}, "
+                f"multicolor={self.multicolor})")
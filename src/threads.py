@@ -3,10 +3,26 @@ from PyQt6.QtCore import pyqtSignal, QObject, QThread
 import subprocess
 import cv2
 import re
+import logging
 import torch
 from ultralytics import YOLO
 import time
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition, current_thread
+from queue import Full
+from contextlib import contextmanager
+from src.buffers import MB
+from src.cascade import Cascade
+from src.detections import Detections
+from src.performance_profile import load_profile
+from src.regions import RegionMask
+from src.settings import RuntimeSettings
+from src.timeline import KeyframeReader, TimelineCache, clip_info, indexed_density, thumbnail_size
+from src.tracing import tracer
+from src.tracking import AppearanceEmbedder, AppearanceTracker, ByteTrackTracker
+
+
+# Predictor events ultralytics hooks its trackers into when model.track is first called
+TRACKER_EVENTS = ('on_predict_start', 'on_predict_postprocess_end')
 
 
 def is_ffmpeg_installed():
@@ -69,12 +85,118 @@ class DeviceScanner(QObject):
         self.devices_scanned.emit(device_info)
 
 
+class TimelineBuilder(QObject):
+    """Builds a recording's thumbnail strip off the GUI thread, from the disk cache or by decoding its keyframes.
+
+    Thumbnails are emitted one at a time as they are decoded, then the detection density already stored in the
+    detection index, if the recording has been batch processed.
+    """
+    info_ready = pyqtSignal(dict)
+    thumbnail_ready = pyqtSignal(float, np.ndarray)
+    density_ready = pyqtSignal(list)
+    finished = pyqtSignal()
+
+    def __init__(self, path, cache_dir='cache/timeline', thumbnail_height=54, max_thumbnails=240, index_path=None):
+        super().__init__()
+        self.path = path
+        self.cache = TimelineCache(cache_dir)
+        self.thumbnail_height = thumbnail_height
+        self.max_thumbnails = max_thumbnails
+        self.index_path = index_path
+        self.reader = None
+        self.cancelled = False
+
+    def run(self):
+        try:
+            info = clip_info(self.path)
+            if self.cancelled or info is None or not info['duration']:
+                return
+            self.info_ready.emit(info)
+
+            cached = self.cache.load(self.path, self.thumbnail_height)
+            if cached is not None:
+                for frame_time, thumbnail in zip(*cached):
+                    if self.cancelled:
+                        break
+                    self.thumbnail_ready.emit(float(frame_time), thumbnail)
+            elif not self.cancelled:
+                self.reader = KeyframeReader(self.path, thumbnail_size(info, self.thumbnail_height), info['duration'],
+                                             self.max_thumbnails)
+                if self.cancelled:
+                    self.reader.cancel()  # cancel() ran before the reader existed
+                times, thumbnails = [], []
+                for frame_time, thumbnail in self.reader:
+                    if self.cancelled:
+                        break
+                    times.append(frame_time)
+                    thumbnails.append(thumbnail)
+                    self.thumbnail_ready.emit(frame_time, thumbnail)
+                if not self.cancelled:
+                    self.cache.save(self.path, self.thumbnail_height, times, thumbnails)
+
+            if not self.cancelled:
+                density = indexed_density(self.path, self.index_path)
+                if density:
+                    self.density_ready.emit(density)
+        except Exception as e:
+            logging.error(f"Error building the timeline of {self.path}: {e}")
+        finally:
+            self.finished.emit()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.reader is not None:
+            self.reader.cancel()
+
+
+def resize_to_fit(frames, max_width, max_height):
+    """Downscale same-sized frames to fit inside max_width x max_height, never upscaling.
+
+    Returns the frames and the applied scale factor.
+    """
+    height, width = frames[0].shape[:2]
+    scale = min(max_width / width, max_height / height)
+    if scale >= 1.0:
+        return frames, 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return [cv2.resize(frame, size, interpolation=cv2.INTER_AREA) for frame in frames], scale
+
+
+def draw_detections(frame, detections, model_names, settings):
+    """Draw the boxes that pass the settings' confidence, class and box-count filters onto the frame in place.
+
+    Uses the lookup tables of a ``RuntimeSettings`` snapshot: one vectorised threshold and class-mask test picks the
+    first ``max_boxes`` boxes to draw.
+    """
+    cls = detections.cls
+    keep = (detections.conf >= settings.thresholds[cls]) & settings.class_mask[cls]
+    for i in np.flatnonzero(keep)[:settings.max_boxes].tolist():
+        x1, y1, x2, y2 = detections.xyxy[i].astype(int).tolist()
+        color = settings.colors[cls[i]]
+        label = f"{model_names[int(cls[i])]}: {detections.conf[i]:.2f}"
+
+        # Include tracking ID if available
+        if settings.use_tracking and detections.ids[i] >= 0:
+            label = f"ID {detections.ids[i]} {label}"
+
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    return frame
+
+
+class EndOfStream:
+    """Queue marker sent by the DetectionProcessor once its capture runs out of frames."""
+
+
+END_OF_STREAM = EndOfStream()
+
+
 class RenderProcessor(QThread):
-    frame_updated = pyqtSignal(np.ndarray)  # Signal to emit frames to the GUI
+    frame_updated = pyqtSignal(np.ndarray, float)  # Signal to emit frames, with their capture time, to the GUI
     fps_updated = pyqtSignal(float)  # Signal to emit the FPS to the GUI
+    stream_ended = pyqtSignal()  # Signal emitted once the last frame of the stream has been rendered
 
-    def __init__(self, result_queue, model_names, fps_target=60, omit_classes=[],
-                 use_tracking=True, max_boxes=100, conf_thres=0.5):
+    def __init__(self, result_queue, model_names, settings, fps_target=60):
         super().__init__()
         self.result_queue = result_queue
         self.model_names = model_names
@@ -82,229 +204,658 @@ class RenderProcessor(QThread):
         self.frame_duration = 1.0 / fps_target
         self.running = True
         self.alive = True
+        self._state = Condition()  # Guards running/alive; notified on every pause, resume and terminate
+        self._rerender = False
+        self.last_frame = None
+        self.last_detections = None
         self.frame_times = []
-        self.conf_thres = conf_thres
-        self.max_boxes = max_boxes
-        self.toggle_color_map(False)
-        self.use_tracking = use_tracking
-        self.omit_classes = omit_classes
+        self.settings = settings  # RuntimeSettings snapshot, swapped whole by update_settings
+        self.overlays = []  # Extra drawing callbacks, e.g. TrackAnalytics.draw, applied after the boxes
 
     def run(self):
-        while self.alive:
-            while self.running:
-                start_time = time.time()
-
-                try:
-                    frame, results = self.result_queue.get(timeout=1)
-                except:
-                    print("No frame in queue; continuing...")
-                    continue
-
-                try:
-                    boxes = results.boxes
-                    confidences = boxes.conf.cpu().numpy()
-                    class_ids = boxes.cls.cpu().numpy().astype(int)
-                    xyxy_boxes = boxes.xyxy.cpu().numpy().astype(int)
-
-                    # Access tracking IDs if available
-                    if hasattr(boxes, 'id') and boxes.id is not None and self.use_tracking:
-                        tracking_ids = boxes.id.cpu().numpy().astype(int)
-                    else:
-                        tracking_ids = [None] * len(boxes)
-
-                    # Combine all information
-                    num_of_boxes = 0
-                    for i in range(len(boxes)):
-                        if confidences[i] >= self.conf_thres and num_of_boxes < self.max_boxes:
-                            cls = class_ids[i]
-                            if cls in self.omit_classes:
-                                continue
-
-                            num_of_boxes = num_of_boxes + 1
-                            x1, y1, x2, y2 = xyxy_boxes[i]
-                            conf = confidences[i]
-                            label = f"{self.model_names[cls]}: {conf:.2f}"
-
-                            # Include tracking ID if available
-                            if tracking_ids[i] is not None:
-                                label = f"ID {tracking_ids[i]} {label}"
-
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), self.color_map[cls], 2)
-                            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX,
-                                        0.5, self.color_map[cls], 2)
-
-                    # Emit the processed frame as a numpy array
-                    self.frame_updated.emit(frame)
-                except Exception as e:
-                    print(f"Error updating frame: {e}")
-
-                # Calculate and emit FPS
-                elapsed_time = time.time() - start_time
-                self.frame_times.append(elapsed_time)
-
-                if len(self.frame_times) > 30:
-                    self.frame_times.pop(0)
-
-                avg_frame_time = sum(self.frame_times) / len(self.frame_times)
-                current_fps = 1.0 / avg_frame_time if avg_frame_time > 0 else 0.0
-
-                # Enforce frame rate limit
-                if elapsed_time < self.frame_duration:
-                    time.sleep(self.frame_duration - elapsed_time)
-
-    def toggle_color_map(self, value):
-        if value:
-            self.color_map = \
-                {
-                    0: (255, 0, 0),
-                    1: (255, 0, 0),
-                    2: (0, 255, 0),
-                    3: (0, 0, 255),
-                    4: (255, 255, 0),
-                    5: (255, 0, 255),
-                    6: (0, 255, 255),
-                    7: (255, 255, 255),
-                    8: (255, 255, 255),
-                    9: (255, 255, 255),
-                }
-        else:
-            self.color_map = \
-                {
-                    0: (0, 255, 0),
-                    1: (0, 255, 0),
-                    2: (0, 255, 0),
-                    3: (0, 255, 0),
-                    4: (0, 255, 0),
-                    5: (0, 255, 0),
-                    6: (0, 255, 0),
-                    7: (0, 255, 0),
-                    8: (0, 255, 0),
-                    9: (0, 255, 0),
-                }
-
-    def update_tracking(self, value):
-        self.use_tracking = value
-
-    def update_confidence_threshold(self, value):
-        self.conf_thres = value
-
-    def update_max_boxes(self, value):
-        self.max_boxes = value
-
-    def update_omitted_classes(self, classes):
-        self.omit_classes = classes
-
-    def update_multicolor_classes(self, value):
-        self.toggle_color_map(value)
+        while self._wait_until_running():
+            # Block until a frame arrives; terminate() and re-render requests unblock this with a wake-up marker
+            with tracer.span('render.wait_for_frame'):
+                item = self.result_queue.get()
+            if item is None:
+                continue
+            if item is END_OF_STREAM:
+                self.stream_ended.emit()
+                continue
+
+            # A pause that arrived while waiting for the frame holds it until playback resumes
+            if not self._wait_until_running():
+                break
+
+            start_time = time.time()
+            frame, detections, capture_time = item
+            try:
+                # Keep the clean frame and its detections so setting changes can be re-composited without inference;
+                # the detections include the boxes the current filters reject (see DetectionProcessor.rerender_floor)
+                self.last_frame = frame
+                self.last_detections = detections
+                with tracer.span('render.annotate', boxes=len(detections)):
+                    self.frame_updated.emit(self.annotate(frame.copy(), detections), capture_time)
+            except Exception as e:
+                print(f"Error updating frame: {e}")
+
+            # Calculate and emit FPS
+            elapsed_time = time.time() - start_time
+            self.frame_times.append(elapsed_time)
+
+            if len(self.frame_times) > 30:
+                self.frame_times.pop(0)
+
+            avg_frame_time = sum(self.frame_times) / len(self.frame_times)
+            current_fps = 1.0 / avg_frame_time if avg_frame_time > 0 else 0.0
+
+            # Enforce frame rate limit, waking early if the processor is terminated
+            if elapsed_time < self.frame_duration:
+                with self._state:
+                    self._state.wait_for(lambda: not self.alive, self.frame_duration - elapsed_time)
+
+    def _wait_until_running(self):
+        """Sleep while paused, re-compositing the last frame whenever a setting changes.
+
+        Returns False once the processor has been terminated.
+        """
+        while True:
+            with self._state:
+                self._state.wait_for(lambda: self.running or self._rerender or not self.alive)
+                if not self.alive:
+                    return False
+                rerender, self._rerender = self._rerender, False
+            if not rerender:
+                return True
+            self.rerender_last_frame()
+
+    def rerender_last_frame(self):
+        """Redraw the overlay of the last frame with the current settings and emit it again."""
+        if self.last_frame is None:
+            return
+        try:
+            self.frame_updated.emit(self.annotate(self.last_frame.copy(), self.last_detections), 0.0)
+        except Exception as e:
+            print(f"Error re-rendering frame: {e}")
+
+    def request_rerender(self):
+        """Ask the render thread to re-composite the last frame, e.g. after a setting change while paused."""
+        with self._state:
+            self._rerender = True
+            self._state.notify_all()
+
+        # Wake the thread if it is blocked waiting for a frame that may never come (e.g. after the stream ended)
+        if self.result_queue.empty():
+            try:
+                self.result_queue.put_nowait(None)
+            except Full:
+                pass
+
+    def annotate(self, frame, detections):
+        """Draw the detections onto the frame using the current render settings."""
+        frame = draw_detections(frame, detections, self.model_names, self.settings)
+        for overlay in self.overlays:
+            frame = overlay(frame)
+        return frame
+
+    def add_overlay(self, overlay):
+        self.overlays.append(overlay)
+
+    def update_settings(self, settings):
+        """Swap in a new RuntimeSettings snapshot; the next frame drawn uses all of it."""
+        self.settings = settings
+        self.request_rerender()
 
     def update_fps_target(self, fps):
         self.fps_target = fps
         self.frame_duration = 1.0 / fps
 
     def stop(self):
-        self.running = False
+        with self._state:
+            self.running = False
+            self._state.notify_all()
 
     def resume(self):
-        self.running = True
+        with self._state:
+            self.running = True
+            self._state.notify_all()
 
     def terminate(self):
-        self.stop()
-        self.alive = False
+        with self._state:
+            self.running = False
+            self.alive = False
+            self._state.notify_all()
+
+        # Wake the thread if it is blocked waiting for a frame
+        try:
+            self.result_queue.put_nowait(None)
+        except Full:
+            pass  # A full queue means the thread is not blocked on get()
         self.wait()
 
 
 class DetectionProcessor(Thread):
-    def __init__(self, video_path, model_path, result_queue, batch_size=4,
-                nth_frame=1):
+    def __init__(self, video_path, model_path, result_queue, batch_size=None,
+                nth_frame=1, profile='live', conf_thres=0.25, omit_classes=(), class_thresholds=None,
+                regions=None, inference_size=None, display_size=None, remote=None, tracker_settings=None,
+                cascade_settings=None, batch_mb=0):
         super().__init__()
         self.cap = video_path
         self.running = False
         self.alive = True
+        self._state = Condition()  # Guards running/alive; notified on every pause, resume and terminate
         self.result_queue = result_queue
-        self.batch_size = batch_size
+        self.batch_size = 4
         self.nth_frame = nth_frame
 
-        # Load the YOLO model
+        # Inference runtime settings, overridden by the autotuned performance profile if one exists
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.imgsz = 640
+        self.half = False
+
+        # Load the YOLO model
         self.model = YOLO(model_path).to(self.device)
 
-        # Add tracking attribute
-        self.use_tracking = True  # Set tracking to be on by default
+        # Class and confidence filters applied inside the model call, before NMS output reaches the tracker; the
+        # snapshot is replaced whole on every change and read once per batch (see RuntimeSettings)
+        self.settings = RuntimeSettings(len(self.model.names), conf_thres=conf_thres,
+                                        class_thresholds=class_thresholds, omit_classes=omit_classes)
+        self._active_settings = self.settings
+        # Opt-in (off by default, as it makes every frame's NMS keep all classes down to the floor): with a floor set,
+        # the model keeps every class down to it and _filter_results applies the filters instead, collecting the boxes
+        # they reject; those travel to the renderer so loosening a filter while paused shows them
+        self.rerender_floor = None
+        self._collect_rejected = False
+        self._rejected = {}
+        self.rejected = []  # Per frame of the last batch detected, in capture coordinates
+        self.model.add_callback('on_predict_postprocess_end', self._filter_results)
+
+        # Region of interest / exclusion zones; inference is cropped to the ROI bounding rectangle
+        self.regions = regions or RegionMask()
+        self._active_regions = self.regions
+        self._crop_offset = (0, 0)
+        self._inference_scale = 1.0
+        self._reset_tracks = False
+
+        # Frames are downscaled once to the inference size (longest side, defaults to the profile's imgsz) and, for
+        # the GUI, to the display size; full-resolution frames never go through the result queue
+        self.display_size = display_size
+
+        performance_profile = load_profile(profile)
+        if performance_profile is not None:
+            self.apply_profile(performance_profile)
+        # Explicit settings win over the autotuned profile
+        if inference_size:
+            self.imgsz = int(inference_size)
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+        # Capture-resolution frames held while a batch fills; a batch is processed early once they reach this budget
+        self.max_batch_bytes = int(batch_mb * MB)
+        self.batch_bytes = 0
 
         # Set tracker configuration path
         self.tracker_config_path = 'models/bytetrack.yaml'  # Use default tracker config
 
-    def run(self):
-        while self.alive:
-            frames = []
-
-            while self.running and self.cap.isOpened():
-                if not self.running:
-                    break  # Exit immediately if running is set to False
+        # Callbacks receiving (frame index, time in seconds, Detections in capture coordinates) for every published
+        # frame, e.g. DetectionExporter.submit; they run on this thread and must not block
+        self.subscribers = []
+        self.frame_index = 0
+
+        # Optional RemoteDetector: inference runs on worker processes and tracking runs here on the in-order results
+        self.remote = remote
+
+        # Tracker run on the detections after inference instead of inside model.track: the appearance (ReID) tracker
+        # when selected in the tracker settings, otherwise ByteTrack for remote inference
+        self.external_tracker = None
+        tracker_settings = tracker_settings or {}
+        if tracker_settings.get('mode') == 'appearance':
+            embedder = AppearanceEmbedder(tracker_settings['embedder'],
+                                          batch_size=tracker_settings.get('embedder_batch_size', 64))
+            self.external_tracker = AppearanceTracker(
+                embedder, max_cosine_distance=tracker_settings.get('max_cosine_distance', 0.2),
+                nn_budget=tracker_settings.get('nn_budget', 100), max_age=tracker_settings.get('max_age', 30),
+                n_init=tracker_settings.get('n_init', 3))
+        elif remote is not None:
+            self.external_tracker = self.__byte_tracker()
+
+        # Optional two-stage cascade (see Cascade); the fast model, and the ByteTrack tracker used while the cascade
+        # is on without an external tracker, are built on the detection thread once the cascade is first enabled
+        self.cascade_settings = cascade_settings or {}
+        self.cascade = None
+        self.cascade_tracker = None
+        self.use_cascade = False
+        self.update_cascade(bool(self.cascade_settings.get('enabled')))
+
+    def __byte_tracker(self):
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap is not None else 0
+        return ByteTrackTracker(self.tracker_config_path, frame_rate=round(fps or 30))
+
+    def apply_profile(self, profile):
+        """Apply runtime settings (device, precision, threads, batch and image size) from a performance profile."""
+        device = torch.device(profile.get('device', self.device.type))
+        if device.type == 'cuda' and not torch.cuda.is_available():
+            print("Performance profile requests CUDA but it is unavailable; staying on CPU.")
+            device = torch.device('cpu')
+        previous = (self.device, self.half)
+        if device != self.device:
+            self.device = device
+            self.model.to(self.device)
+
+        self.half = bool(profile.get('half', False)) and self.device.type == 'cuda'
+        if (self.device, self.half) != previous:
+            # The predictor fixes its backend's device and precision when first set up, so make the next call build
+            # a new one
+            self.model.predictor = None
+        self.batch_size = int(profile.get('batch_size', self.batch_size))
+        self.imgsz = int(profile.get('imgsz', self.imgsz))
+        if profile.get('threads'):
+            torch.set_num_threads(int(profile['threads']))
 
+    def run(self):
+        frames, capture_times = [], []
+        self.batch_bytes = 0
+        while self._wait_until_running():
+            with tracer.span('capture.read'):
                 ret, frame = self.cap.read()
-                if not ret or not self.running:
-                    break  # Exit if reading fails or running is set to False
-
-                frames.append(frame)
-                if len(frames) == self.batch_size:
-                    try:
-                        if self.use_tracking is True:
-                            # Use model.track() when tracking is enabled
-                            results = self.model.track(source=frames,
-                                                       tracker=self.tracker_config_path,
-                                                       stream=True,
-                                                       verbose=False)
-                        else:
-                            # Use model.predict() when tracking is disabled
-                            results = self.model.predict(source=frames,
-                                                         stream=True,
-                                                         verbose=False)
-
-                        for frame, result in zip(frames, results):
-                            if not self.running:
-                                break  # Stop processing if running is set to False
-                            self.result_queue.put((frame, result))
-
-                        frames = []
-                    except Exception as e:
-                        print(f"Error during detection: {e}")
-
-            # Cleanup if there are remaining frames and the thread is still running
-            if frames:
+            # Carried with the frame to measure capture-to-display latency; captures that buffer frames report when the
+            # frame arrived, so time spent in their buffer counts too
+            capture_time = getattr(self.cap, 'capture_time', None) or time.perf_counter()
+            if not self.alive:
+                break
+
+            if not ret:
+                # The capture is exhausted: flush the partial batch and tell the renderer the stream has ended
+                if frames:
+                    self.process_batch(frames, capture_times)
+                self.flush()
+                self._put(END_OF_STREAM)
+                with self._state:
+                    self.running = False
+                break
+
+            # A partial batch is kept across a pause and completed once playback resumes
+            frames.append(frame)
+            capture_times.append(capture_time)
+            self.batch_bytes += frame.nbytes
+            if len(frames) == self.batch_size or (self.max_batch_bytes and self.batch_bytes >= self.max_batch_bytes):
+                self.process_batch(frames, capture_times)
+                frames, capture_times = [], []
+                self.batch_bytes = 0
+
+    def memory_usage(self):
+        """Bytes currently held by each buffer of this pipeline, by name."""
+        usage = {}
+        capture_bytes = getattr(self.cap, 'nbytes', None)
+        if callable(capture_bytes):
+            usage['capture'] = capture_bytes()
+        usage['batch'] = self.batch_bytes
+        queue_bytes = getattr(self.result_queue, 'nbytes', None)
+        if callable(queue_bytes):
+            usage['result_queue'] = queue_bytes()
+        return usage
+
+    def _wait_until_running(self):
+        """Sleep while paused. Returns False once the processor has been terminated."""
+        with self._state:
+            self._state.wait_for(lambda: self.running or not self.alive)
+            return self.alive
+
+    def _put(self, item):
+        """Put an item on the result queue, giving up if the processor is terminated while the queue is full."""
+        with tracer.span('detect.queue_put'):
+            while self.alive:
                 try:
-                    if self.use_tracking:
-                        results = self.model.track(source=frames,
-                                                   tracker=self.tracker_config_path,
-                                                   verbose=False)
-                    else:
-                        results = self.model.predict(source=frames,
-                                                     verbose=False)
-
-                    for frame, result in zip(frames, results):
-                        if not self.running:
-                            break
-                        self.result_queue.put((frame, result))
-                except Exception as e:
-                    print(f"Error during final batch processing: {e}")
-
-    def update_tracking(self, value):
-        print(f"Tracking set to: {value}")
-        self.use_tracking = value
-
-    def update_nth_frame(self, value):
-        pass
+                    self.result_queue.put(item, timeout=0.1)
+                    tracer.counter('result_queue', self.result_queue.qsize())
+                    return True
+                except Full:
+                    continue
+        return False
+
+    def prepare(self, frames, regions):
+        """Crop to the ROI and downscale to the inference size once per frame.
+
+        Returns the inference frames plus the scale and offset that map their boxes back to capture coordinates.
+        """
+        offset = (0, 0)
+        if not regions.is_empty():
+            cropped = [regions.crop(frame) for frame in frames]
+            frames = [crop for crop, _ in cropped]
+            offset = cropped[0][1]
+        frames, scale = resize_to_fit(frames, self.imgsz, self.imgsz)
+        return frames, scale, offset
+
+    @staticmethod
+    def to_capture(detections, scale, offset):
+        """Map detections from inference coordinates back to capture coordinates."""
+        if scale != 1.0:
+            detections = detections.scale(1.0 / scale)
+        if offset != (0, 0):
+            detections = detections.translate(*offset)
+        return detections
+
+    def detect(self, frames):
+        """Run the model on a batch of frames and return one Detections per frame, in full-frame coordinates."""
+        if self._reset_tracks:
+            self._reset_tracks = False
+            self.reset_tracker()
+
+        regions = self.regions
+        settings = self.settings  # One snapshot for the whole batch, including the filter callback
+        inference_frames, scale, offset = self.prepare(frames, regions)
+        self._active_regions = regions
+        self._active_settings = settings
+        self._crop_offset = offset
+        self._inference_scale = scale
+        # Read once: the GUI thread may toggle the cascade while this batch is being inferred
+        use_cascade = self.use_cascade and self.__prepare_cascade()
+        tracker = self.external_tracker or (self.cascade_tracker if use_cascade else None)
+        self._collect_rejected = self.rerender_floor is not None and not use_cascade
+        self._rejected = {}
+        self.rejected = [Detections() for _ in frames]
+
+        if use_cascade:
+            detections = self.detect_cascade(frames, inference_frames, scale, offset, regions, settings)
+        elif settings.use_tracking and tracker is None:
+            # Use model.track() when tracking is enabled, keeping the tracks alive between batches
+            results = self.model.track(source=inference_frames,
+                                       tracker=self.tracker_config_path,
+                                       persist=True,
+                                       **self._inference_args(settings))
+        else:
+            # Use model.predict() when tracking is disabled
+            with self._untracked():
+                results = list(self.model.predict(source=inference_frames,
+                                                  **self._inference_args(settings)))
+
+        if not use_cascade:
+            detections = [self.to_capture(Detections.from_results(result), scale, offset) for result in results]
+            self.rejected = [self.to_capture(self._rejected.get(i, Detections()), scale, offset)
+                             for i in range(len(frames))]
+            self._collect_rejected = False
+        if settings.use_tracking and tracker is not None:
+            with tracer.span('detect.track', frames=len(frames)):
+                detections = tracker.update_batch(frames, detections)
+        return detections
+
+    def detect_cascade(self, frames, inference_frames, scale, offset, regions, settings):
+        """Fast model on the inference frames, main model on crops around its uncertain boxes; untracked."""
+        cascade = self.cascade
+        args = self._inference_args(settings)
+        args['conf'] = min(args['conf'], cascade.min_conf)  # Weak candidates are what the second stage is for
+        candidates = [self.to_capture(Detections.from_results(result), scale, offset)
+                      for result in cascade.fast_model.predict(source=inference_frames, **args)]
+        accepted, crops, origins = cascade.split(frames, candidates)
+
+        rechecked = []
+        if crops:
+            # Crops are in their own coordinates: keep the filter callback from applying exclusions to them
+            self._active_regions = RegionMask()
+            self._crop_offset = (0, 0)
+            self._inference_scale = 1.0
+            with self._untracked():
+                results = self.model.predict(source=crops, **{**self._inference_args(settings),
+                                                              'imgsz': cascade.crop_size})
+                rechecked = [Detections.from_results(result) for result in results]
+
+        detections = []
+        for i, frame_detections in enumerate(cascade.merge(accepted, rechecked, origins)):
+            cls = frame_detections.cls
+            keep = (frame_detections.conf >= settings.thresholds[cls]) & settings.class_mask[cls]
+            in_regions = regions.keep(frame_detections.xyxy) if regions.mask is not None else True
+            if self.rerender_floor is not None:
+                self.rejected[i] = frame_detections.select(~keep & in_regions)
+            detections.append(frame_detections.select(keep & in_regions))
+
+        if cascade.frames // 300 != (cascade.frames - len(frames)) // 300:
+            logging.info(cascade.summary())
+        return detections
+
+    @contextmanager
+    def _untracked(self):
+        """Run model.predict without the ByteTrack callbacks that an earlier model.track registered on the model.
+
+        Those callbacks stay registered for good and would otherwise feed crops or untracked batches into the main
+        tracker, corrupting its state and dropping every box that is not an active track. The results must be
+        consumed inside the block, as streamed predictions run the callbacks lazily.
+        """
+        callbacks = self.model.callbacks
+        saved = {event: callbacks[event] for event in TRACKER_EVENTS if event in callbacks}
+        for event, registered in saved.items():
+            callbacks[event] = [callback for callback in registered
+                                if not getattr(getattr(callback, 'func', callback), '__module__', '').startswith(
+                                    'ultralytics.trackers')]
+        try:
+            yield
+        finally:
+            callbacks.update(saved)
+
+    def update_cascade(self, enabled):
+        """Switch the two-stage cascade on or off from the next batch; tracking moves out of model.track while on."""
+        if enabled and not self.cascade_settings.get('fast_model'):
+            print("Cascade requires cascade.fast_model in the config.")
+            return
+        self.use_cascade = enabled
+        self._reset_tracks = True
+
+    def cascade_summary(self):
+        """Crops re-checked by the cascade so far, or None if it has not run."""
+        return self.cascade.summary() if self.cascade is not None else None
+
+    def __prepare_cascade(self):
+        """Load the fast model and the cascade's tracker on first use. Returns False if the cascade is unavailable."""
+        if self.cascade is None:
+            settings = self.cascade_settings
+            try:
+                self.cascade = Cascade(settings['fast_model'], self.device,
+                                       recheck_conf=settings.get('recheck_conf', 0.5),
+                                       small_object_size=settings.get('small_object_size', 32),
+                                       crop_size=settings.get('crop_size', 320),
+                                       crop_padding=settings.get('crop_padding', 1.0),
+                                       min_conf=settings.get('min_conf', 0.1),
+                                       max_crops=settings.get('max_crops', 32))
+            except Exception as e:
+                print(f"Unable to load the cascade's fast model: {e}")
+                self.use_cascade = False
+                return False
+        if self.external_tracker is None and self.cascade_tracker is None:
+            self.cascade_tracker = self.__byte_tracker()
+        return True
+
+    def submit_remote(self, frames, capture_times):
+        """Send a batch to the remote workers; the frames travel along as context until the results are back."""
+        if self._reset_tracks:
+            self._reset_tracks = False
+            self.flush()  # Batches already out were cropped for the old regions
+            self.reset_tracker()
+
+        regions = self.regions
+        inference_frames, scale, offset = self.prepare(frames, regions)
+        if getattr(self.cap, 'borrowed_frames', False):
+            frames = [frame.copy() for frame in frames]  # Held until the results are back, after the capture moves on
+        snapshot = self.settings
+        settings = {'conf_thres': snapshot.conf_thres, 'omit_classes': list(snapshot.omit_classes),
+                    'class_thresholds': {str(cls): value for cls, value in snapshot.class_thresholds.items()},
+                    'imgsz': self.imgsz}
+        self.remote.submit(inference_frames, settings, (frames, capture_times, scale, offset, regions))
+
+    def publish_remote(self, ready):
+        """Finish batches returned by the remote workers: map boxes back, apply exclusions, track, then publish."""
+        use_tracking = self.settings.use_tracking
+        for (frames, capture_times, scale, offset, regions), detections in ready:
+            if detections is None:
+                print(f"Remote detection failed; dropping {len(frames)} frames")
+                continue
+            detections = [self.to_capture(frame_detections, scale, offset) for frame_detections in detections]
+            if regions.mask is not None:
+                detections = [d.select(regions.keep(d.xyxy)) for d in detections]
+            if use_tracking:
+                with tracer.span('detect.track', frames=len(frames)):
+                    detections = self.external_tracker.update_batch(frames, detections)
+            if not self.publish(frames, detections, capture_times):
+                break
+
+    def flush(self):
+        """Wait for every batch still out on the remote workers and publish it."""
+        if self.remote is not None:
+            self.publish_remote(self.remote.collect(wait=True))
+
+    def _inference_args(self, settings):
+        conf, classes = settings.conf_floor, settings.allowed_classes
+        if self.rerender_floor is not None:
+            conf, classes = min(conf, self.rerender_floor), None
+        return {'imgsz': self.imgsz, 'half': self.half, 'device': self.device, 'conf': conf, 'classes': classes,
+                'stream': True, 'verbose': False}
+
+    def _filter_results(self, predictor):
+        """Drop boxes below their class threshold, of an omitted class or centred in an excluded area.
+
+        Registered before the tracker callback, so the tracker never spends work on the dropped boxes. While rejected
+        boxes are collected, the class and confidence filters all run here and the boxes they drop (outside excluded
+        areas) are kept in ``_rejected`` by frame.
+        """
+        regions = self._active_regions
+        settings = self._active_settings
+        collect = self._collect_rejected
+        exclusion = regions.mask is not None
+        if not collect and not settings.per_class_filter and not exclusion:
+            return
+
+        thresholds = class_mask = None
+        offset = np.array(self._crop_offset * 2, np.float32)
+        scale = self._inference_scale
+        for i, result in enumerate(predictor.results):
+            boxes = result.boxes
+            if boxes is None or len(boxes) == 0:
+                continue
+
+            device = boxes.conf.device
+            keep = torch.ones(len(boxes), dtype=torch.bool, device=device)
+            if collect or settings.per_class_filter:
+                if thresholds is None:
+                    thresholds = torch.from_numpy(settings.thresholds.copy()).to(device)
+                    class_mask = torch.from_numpy(settings.class_mask.copy()).to(device)
+                cls = boxes.cls.long()
+                keep &= boxes.conf >= thresholds[cls]
+                if collect:
+                    keep &= class_mask[cls]
+            in_regions = torch.ones_like(keep)
+            if exclusion:
+                xyxy = boxes.xyxy.cpu().numpy() / scale + offset
+                in_regions = torch.from_numpy(regions.keep(xyxy)).to(device)
+            if collect:
+                rejected = ~keep & in_regions
+                if rejected.any():
+                    self._rejected[i] = Detections(boxes.xyxy[rejected].cpu().numpy(),
+                                                   boxes.conf[rejected].cpu().numpy(),
+                                                   boxes.cls[rejected].cpu().numpy())
+            keep &= in_regions
+            if not keep.all():
+                predictor.results[i] = result[keep]
+
+    def update_display_size(self, size):
+        """Set the (width, height) box that frames sent to the GUI are fitted into, or None for full size."""
+        self.display_size = size
+
+    def update_regions(self, regions):
+        """Swap in a new RegionMask. Tracks are reset because the crop, and so the box coordinates, change."""
+        self.regions = regions
+        self._reset_tracks = True
+
+    def update_settings(self, settings):
+        """Swap in a new RuntimeSettings snapshot; it takes effect from the next batch.
+
+        Switching tracking on or off resets the tracks, which would otherwise resume from a stale state.
+        """
+        if settings.use_tracking != self.settings.use_tracking:
+            self._reset_tracks = True
+        self.settings = settings
+
+    def process_batch(self, frames, capture_times=None):
+        """Detect on a batch of frames and push each (frame, detections, capture time) onto the result queue.
+
+        With remote workers the batch is submitted and whichever earlier batches have come back are published.
+        """
+        capture_times = capture_times or [0.0] * len(frames)
+        try:
+            tracer.instant('detect.batch', frames=len(frames))
+            if self.remote is None:
+                with tracer.span('detect.inference', frames=len(frames)):
+                    detections = self.detect(frames)
+                self.publish(frames, detections, capture_times, self.rejected)
+            else:
+                self.submit_remote(frames, capture_times)
+                self.publish_remote(self.remote.collect())
+        except Exception as e:
+            print(f"Error during detection: {e}")
+
+    def publish(self, frames, detections, capture_times, rejected=None):
+        """Push (frame, detections, capture time) items onto the result queue. Returns False once terminated.
+
+        Subscribers see every frame first; frames are then downscaled to the display size, with the detections
+        scaled to match. Boxes the filters rejected are appended to the queued detections (after the kept ones) for the
+        renderer, whose drawing applies the same filters, so they only appear once a filter is loosened.
+        """
+        fps = (self.cap.get(cv2.CAP_PROP_FPS) if self.cap is not None else 0) or 30
+        rejected = rejected or [None] * len(frames)
+        for frame, frame_detections, capture_time, frame_rejected in zip(frames, detections, capture_times, rejected):
+            for subscriber in self.subscribers:
+                subscriber(self.frame_index, self.frame_index / fps, frame_detections)
+            self.frame_index += 1
+            if frame_rejected is not None and len(frame_rejected):
+                frame_detections = Detections.concatenate([frame_detections, frame_rejected])
+
+            scale = 1.0
+            if self.display_size is not None:
+                (frame,), scale = resize_to_fit([frame], *self.display_size)
+                if scale != 1.0:
+                    frame_detections = frame_detections.scale(scale)
+            if scale == 1.0 and self.remote is None and getattr(self.cap, 'borrowed_frames', False):
+                frame = frame.copy()  # The capture owns its frames (reused or read-only); the queue needs its own
+            if not self._put((frame, frame_detections, capture_time)):
+                return False
+        return True
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def reset_tracker(self):
+        """Forget all active tracks, e.g. before switching to another video."""
+        for tracker in (self.external_tracker, self.cascade_tracker):
+            if tracker is not None:
+                tracker.reset()
+        predictor = self.model.predictor
+        if predictor is not None:
+            for tracker in getattr(predictor, 'trackers', []):
+                tracker.reset()
 
     def is_stopped(self):
         return not self.running
 
     def stop(self):
-        self.running = False
+        with self._state:
+            self.running = False
+            self._state.notify_all()
 
     def resume(self):
-        self.running = True
+        with self._state:
+            self.running = True
+            self._state.notify_all()
 
     def terminate(self):
-        self.alive = False
+        with self._state:
+            self.running = False
+            self.alive = False
+            self._state.notify_all()
+
+        # Unblock a live capture waiting for frames (a network stream may be reconnecting), then join before releasing
+        # so the capture is never released in the middle of a read
+        interrupt = getattr(self.cap, 'interrupt', None)
+        if interrupt is not None:
+            interrupt()
+        if self.ident is not None and self is not current_thread():
+            self.join()
+        if self.remote is not None:
+            self.remote.close()
         self.cap.release()
-        self.stop()
\ No newline at end of file
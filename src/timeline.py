@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import time
+from threading import Thread, Condition
+
+import cv2
+import numpy as np
+
+from src.detection_index import DetectionIndex
+
+PTS_TIME = re.compile(r'pts_time:\s*(-?[\d.]+)')
+
+
+def clip_info(path):
+    """Frame size, frame rate and duration of a recording, read from its header without decoding."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    info = {'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': fps, 'duration': cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps}
+    cap.release()
+    return info
+
+
+def thumbnail_size(info, height):
+    width = max(2, round(height * info['width'] / max(info['height'], 1) / 2) * 2)
+    return width, height
+
+
+class KeyframeReader:
+    """Decodes only the keyframes of a recording, downscaled inside ffmpeg, yielding (time, thumbnail).
+
+    ffmpeg skips every non-key frame before decoding (``-skip_frame nokey``), so an overview costs a small fraction
+    of a full decode. Frame times come from the ``showinfo`` filter on stderr. Falls back to seeking with OpenCV to
+    evenly spaced times when ffmpeg is unavailable.
+    """
+
+    def __init__(self, path, size, duration, max_thumbnails=240):
+        self.path = path
+        self.size = size
+        self.duration = duration
+        self.max_thumbnails = max_thumbnails
+        self.process = None
+        self.cancelled = False
+        self._state = Condition()
+        self.times = []
+
+    def __iter__(self):
+        width, height = self.size
+        command = ['ffmpeg', '-hide_banner', '-nostdin', '-nostats', '-loglevel', 'info', '-skip_frame', 'nokey', '-i', self.path,
+                   '-an', '-sn', '-vf', f'scale={width}:{height}:flags=area,showinfo', '-vsync', '0',
+                   '-pix_fmt', 'bgr24', '-f', 'rawvideo', 'pipe:1']
+        try:
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            yield from self.__seek_thumbnails()
+            return
+        Thread(target=self.__read_times, daemon=True).start()
+
+        # Keyframes closer together than this are skipped, so long clips still give at most max_thumbnails
+        spacing = self.duration / self.max_thumbnails if self.duration else 0
+        last_time = None
+        index = 0
+        frame_bytes = width * height * 3
+        try:
+            while not self.cancelled:
+                data = self.process.stdout.read(frame_bytes)  # Buffered, so this returns a whole frame or EOF
+                if len(data) < frame_bytes:
+                    break
+                with self._state:
+                    self._state.wait_for(lambda: len(self.times) > index, 1.0)
+                    frame_time = self.times[index] if len(self.times) > index else None
+                index += 1
+                if frame_time is None:
+                    continue
+                if last_time is not None and frame_time - last_time < spacing:
+                    continue
+                last_time = frame_time
+                yield frame_time, np.frombuffer(data, np.uint8).reshape(height, width, 3)
+        finally:
+            self.close()
+
+    def __read_times(self):
+        for line in iter(self.process.stderr.readline, b''):
+            match = PTS_TIME.search(line.decode(errors='replace'))
+            if match:
+                with self._state:
+                    self.times.append(float(match.group(1)))
+                    self._state.notify_all()
+
+    def __seek_thumbnails(self):
+        cap = cv2.VideoCapture(self.path)
+        count = min(self.max_thumbnails, max(1, int(self.duration)))
+        for index in range(count):
+            if self.cancelled:
+                break
+            frame_time = index * self.duration / count
+            cap.set(cv2.CAP_PROP_POS_MSEC, frame_time * 1000)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame_time, cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        cap.release()
+
+    def cancel(self):
+        self.cancelled = True
+        self.close()
+
+    def close(self):
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+class TimelineCache:
+    """Thumbnail strips on disk: ``<key>.png`` holds the thumbnails side by side, ``<key>.json`` their times.
+
+    The key covers the recording's path, size and modification time and the thumbnail height, so an edited file or a
+    different height builds a new strip.
+    """
+
+    def __init__(self, directory='cache/timeline'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def paths(self, path, height):
+        stat = os.stat(path)
+        key = hashlib.sha1(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime}|{height}".encode('utf-8'))
+        base = os.path.join(self.directory, key.hexdigest())
+        return base + '.png', base + '.json'
+
+    def load(self, path, height):
+        """Return (times, thumbnails) for a cached strip, or None."""
+        image_path, index_path = self.paths(path, height)
+        try:
+            with open(index_path, 'r') as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return None
+        strip = cv2.imread(image_path)
+        if strip is None:
+            return None
+        width = index['thumbnail_width']
+        thumbnails = [strip[:, i * width:(i + 1) * width] for i in range(len(index['times']))]
+        return index['times'], thumbnails
+
+    def save(self, path, height, times, thumbnails):
+        if not thumbnails:
+            return
+        image_path, index_path = self.paths(path, height)
+        if not cv2.imwrite(image_path, np.hstack(thumbnails)):
+            logging.error(f"Unable to write the timeline strip {image_path}")
+            return
+        # The index is written last, so a half-written strip is never loaded
+        with open(index_path + '.tmp', 'w') as file:
+            json.dump({'source': os.path.abspath(path), 'times': times, 'thumbnail_width': thumbnails[0].shape[1],
+                       'created': time.time()}, file)
+        os.replace(index_path + '.tmp', index_path)
+
+
+def indexed_density(path, index_path):
+    """Per-second mean boxes per frame from the detection index, or None if the recording has not been indexed."""
+    if not index_path or not os.path.exists(index_path):
+        return None
+    index = DetectionIndex(index_path)
+    try:
+        return index.density([path, os.path.abspath(path)])
+    finally:
+        index.close()
+
+
+class LiveDensity:
+    """Per-second mean boxes per frame, accumulated from the detection thread while a recording plays."""
+
+    def __init__(self, duration):
+        seconds = max(1, int(np.ceil(duration)))
+        self.boxes = np.zeros(seconds, np.float64)
+        self.frames = np.zeros(seconds, np.int64)
+        self.position = 0.0
+
+    def update(self, frame_index, frame_time, detections):
+        second = min(int(frame_time), len(self.boxes) - 1)
+        self.boxes[second] += len(detections)
+        self.frames[second] += 1
+        self.position = frame_time
+
+    def values(self):
+        """Density per second; NaN for seconds not played yet."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.frames > 0, self.boxes / np.maximum(self.frames, 1), np.nan)
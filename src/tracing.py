@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class _NullSpan:
+    """Shared do-nothing span returned while tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.tracer.record(('X', self.name, self.start, end - self.start, threading.get_ident(), self.args))
+        return False
+
+
+class Tracer:
+    """Opt-in timeline of pipeline spans, exported as Chrome trace-event JSON (open in Perfetto or chrome://tracing).
+
+    Events go into a fixed-size ring buffer, so a long session keeps only the most recent ``capacity`` events. While
+    disabled, ``span`` returns a shared no-op context manager and ``instant``/``counter`` return immediately.
+    """
+
+    def __init__(self, capacity=200000):
+        self.enabled = False
+        self.events = deque(maxlen=capacity)
+        self.thread_names = {}
+
+    def enable(self, capacity=None):
+        if capacity and capacity != self.events.maxlen:
+            self.events = deque(maxlen=capacity)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **args):
+        """Time a block: ``with tracer.span('detect', frames=4): ...``."""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, args)
+
+    def instant(self, name, **args):
+        if self.enabled:
+            self.record(('i', name, time.perf_counter_ns(), 0, threading.get_ident(), args))
+
+    def counter(self, name, value):
+        """Track a value over time, e.g. queue depth; shown as its own graph."""
+        if self.enabled:
+            self.record(('C', name, time.perf_counter_ns(), 0, threading.get_ident(), {name: value}))
+
+    def record(self, event):
+        thread_id = event[4]
+        if thread_id not in self.thread_names:
+            self.thread_names[thread_id] = threading.current_thread().name
+        self.events.append(event)  # deque.append is atomic, so no lock is needed on the hot path
+
+    def dump(self, path):
+        """Write the buffered events as a Chrome trace JSON file. Returns the number of events written."""
+        events = list(self.events)
+        pid = os.getpid()
+        trace = [{'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': thread_id, 'args': {'name': name}}
+                 for thread_id, name in list(self.thread_names.items())]
+        for phase, name, start, duration, thread_id, args in events:
+            event = {'ph': phase, 'name': name, 'pid': pid, 'tid': thread_id, 'ts': start / 1000}
+            if phase == 'X':
+                event['dur'] = duration / 1000
+            elif phase == 'i':
+                event['s'] = 't'
+            if args:
+                event['args'] = args
+            trace.append(event)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, file)
+        return len(events)
+
+
+# Process-wide tracer used by the pipeline threads and the GUI
+tracer = Tracer()
@@ -0,0 +1,253 @@
+import cv2
+import numpy as np
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.trackers.utils.matching import linear_assignment
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+
+from src.detections import Detections
+
+
+class ByteTrackTracker:
+    """Runs ultralytics' ByteTrack on Detections outside of ``model.track``.
+
+    Used when detection happens somewhere the tracker callback cannot run, e.g. on remote workers. Frames must be
+    passed in order.
+    """
+
+    def __init__(self, config_path='models/bytetrack.yaml', frame_rate=30):
+        self.args = IterableSimpleNamespace(**yaml_load(config_path))
+        self.frame_rate = frame_rate
+        self.tracker = BYTETracker(args=self.args, frame_rate=frame_rate)
+
+    def update(self, detections, frame_shape):
+        """Associate one frame's detections with the active tracks. Returns only the tracked boxes."""
+        data = np.empty((len(detections), 6), np.float32)
+        data[:, :4] = detections.xyxy
+        data[:, 4] = detections.conf
+        data[:, 5] = detections.cls
+        tracks = self.tracker.update(Boxes(data, frame_shape[:2]))
+        if len(tracks) == 0:
+            return Detections()
+        return Detections(tracks[:, :4], tracks[:, 5], tracks[:, 6], tracks[:, 4])
+
+    def reset(self):
+        self.tracker.reset()
+
+    def update_batch(self, frames, detections):
+        return [self.update(frame_detections, frame.shape) for frame, frame_detections in zip(frames, detections)]
+
+
+class AppearanceEmbedder:
+    """Runs the DeepSORT appearance model on box crops, batching every crop of a frame batch into one forward pass.
+
+    Needs an ONNX export of ``mars-small128``, loaded with OpenCV's DNN module: the original ``.pb`` graph takes a
+    uint8 NHWC placeholder and cannot be read by ``cv2.dnn``. Export it with its input converted to NCHW (e.g.
+    ``tf2onnx --inputs-as-nchw``) as a float32 (N, 3, 128, 64) tensor of BGR pixels in the 0-255 range, which is
+    what the crops are fed as; the network does its own scaling. Returns L2-normalised feature vectors.
+    """
+
+    def __init__(self, model_path='models/deepsort/mars-small128.onnx', input_size=(64, 128), batch_size=64):
+        if not model_path.endswith('.onnx'):
+            raise ValueError(f"The appearance embedder needs an ONNX export of mars-small128, got {model_path}")
+        self.net = cv2.dnn.readNet(model_path)
+        self.input_size = input_size
+        self.batch_size = batch_size
+
+    def embed(self, frames, detections):
+        """Return one (N, D) feature array per frame for the boxes in the matching Detections."""
+        crops, counts = [], []
+        for frame, frame_detections in zip(frames, detections):
+            height, width = frame.shape[:2]
+            boxes = np.round(frame_detections.xyxy).astype(int)
+            boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+            boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+            for x1, y1, x2, y2 in boxes:
+                # Crops are views; blobFromImages resizes them straight into the input tensor
+                crops.append(frame[y1:max(y2, y1 + 1), x1:max(x2, x1 + 1)] if x1 < width and y1 < height
+                             else frame[:1, :1])
+            counts.append(len(boxes))
+
+        features = []
+        for start in range(0, len(crops), self.batch_size):
+            # mars-small128 was trained on BGR crops, as OpenCV decodes them: no channel swap
+            blob = cv2.dnn.blobFromImages(crops[start:start + self.batch_size], 1.0, self.input_size, swapRB=False)
+            self.net.setInput(blob)
+            features.append(self.net.forward().reshape(blob.shape[0], -1))
+        features = np.concatenate(features) if features else np.zeros((0, 0), np.float32)
+        features /= np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-6)
+        return np.split(features, np.cumsum(counts)[:-1])
+
+
+class Track:
+    def __init__(self, track_id, slot, xyxy, cls, conf):
+        self.id = track_id
+        self.slot = slot  # Row of the tracker's gallery pool holding this track's features
+        self.xyxy = xyxy
+        self.velocity = np.zeros(2, np.float32)
+        self.cls = cls
+        self.conf = conf
+        self.hits = 1
+        self.missed = 0
+        self.confirmed = False
+
+    def centre(self):
+        return (self.xyxy[:2] + self.xyxy[2:]) / 2
+
+    def predicted_centre(self):
+        return self.centre() + self.velocity * (self.missed + 1)
+
+
+def box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-6)
+
+
+class AppearanceTracker:
+    """DeepSORT-style tracker that matches tracks to detections by appearance, so IDs survive occlusions.
+
+    Each track keeps its last ``nn_budget`` appearance features in a ring buffer inside one preallocated
+    (tracks, nn_budget, D) pool, and the distance to every detection is the smallest cosine distance to any stored
+    feature, computed for all tracks at once. Confirmed tracks are matched by appearance (gated by
+    ``max_cosine_distance`` and by distance from their predicted position); new and just-lost tracks then get a
+    second chance by IoU. Tracks need ``n_init`` consecutive hits to be confirmed and are dropped after ``max_age``
+    missed frames.
+    """
+
+    def __init__(self, embedder, max_cosine_distance=0.2, nn_budget=100, max_age=30, n_init=3, iou_threshold=0.3):
+        self.embedder = embedder
+        self.max_cosine_distance = max_cosine_distance
+        self.nn_budget = nn_budget
+        self.max_age = max_age
+        self.n_init = n_init
+        self.iou_threshold = iou_threshold
+        self.reset()
+
+    def reset(self):
+        self.tracks = []
+        self.next_id = 1
+        self.features = None  # (capacity, nn_budget, D) gallery pool, allocated once the feature size is known
+        self.counts = np.zeros(0, np.int32)  # Features ever written per slot; the newest nn_budget are kept
+        self.free_slots = []
+
+    def update_batch(self, frames, detections):
+        """Embed every box of the batch in one pass, then update the tracks frame by frame."""
+        features = self.embedder.embed(frames, detections)
+        return [self.update(frame_detections, frame_features)
+                for frame_detections, frame_features in zip(detections, features)]
+
+    def update(self, detections, features):
+        """Associate one frame's detections (with their features) with the tracks. Returns the confirmed matches."""
+        for track in self.tracks:
+            track.missed += 1
+
+        confirmed = [track for track in self.tracks if track.confirmed]
+        matches, unmatched = self.__match_appearance(confirmed, detections, features)
+
+        # Second chance by overlap for tentative tracks and tracks lost in the previous frame only
+        matched_tracks = {id(track) for track, _ in matches}
+        candidates = [track for track in self.tracks if id(track) not in matched_tracks and track.missed == 1]
+        iou_matches, unmatched = self.__match_iou(candidates, detections, unmatched)
+        matches += iou_matches
+
+        output = []
+        for track, index in matches:
+            self.__update_track(track, detections, features, index)
+            if track.confirmed:
+                output.append((index, track.id))
+        for index in unmatched:
+            self.__create_track(detections, features, index)
+
+        self.__remove_dead_tracks()
+
+        if not output:
+            return Detections()
+        indices, ids = zip(*output)
+        tracked = detections.select(np.array(indices))
+        tracked.ids = np.array(ids, np.int32)
+        return tracked
+
+    def __match_appearance(self, tracks, detections, features):
+        unmatched = list(range(len(detections)))
+        if not tracks or not unmatched:
+            return [], unmatched
+
+        # (tracks, nn_budget, N) similarities for the active slots only, so the cost follows the live tracks rather
+        # than the pool's capacity
+        slots = np.array([track.slot for track in tracks])
+        similarity = np.matmul(self.features[slots], features.T)
+        valid = np.arange(self.nn_budget)[None, :] < np.minimum(self.counts[slots], self.nn_budget)[:, None]
+        distance = np.where(valid[:, :, None], 1.0 - similarity, np.inf).min(axis=1)
+
+        # Gate out detections too far from where the track is expected, allowing more room the longer it is lost
+        centres = (detections.xyxy[:, :2] + detections.xyxy[:, 2:]) / 2
+        predicted = np.array([track.predicted_centre() for track in tracks])
+        sizes = np.array([max(track.xyxy[2] - track.xyxy[0], track.xyxy[3] - track.xyxy[1]) for track in tracks])
+        reach = sizes * (1.0 + 0.5 * np.array([track.missed for track in tracks]))
+        offsets = np.linalg.norm(centres[None, :, :] - predicted[:, None, :], axis=2)
+        distance[offsets > reach[:, None]] = np.inf
+
+        pairs, _, unmatched = linear_assignment(np.minimum(distance, 1e5), thresh=self.max_cosine_distance)
+        return [(tracks[i], j) for i, j in pairs], list(unmatched)
+
+    def __match_iou(self, tracks, detections, unmatched):
+        if not tracks or not unmatched:
+            return [], unmatched
+        unmatched = np.array(unmatched)
+        boxes = np.array([track.xyxy for track in tracks])
+        cost = 1.0 - box_iou(boxes, detections.xyxy[unmatched])
+        pairs, _, rest = linear_assignment(cost, thresh=1.0 - self.iou_threshold)
+        return [(tracks[i], int(unmatched[j])) for i, j in pairs], [int(unmatched[j]) for j in rest]
+
+    def __update_track(self, track, detections, features, index):
+        xyxy = detections.xyxy[index]
+        movement = ((xyxy[:2] + xyxy[2:]) / 2 - track.centre()) / track.missed
+        track.velocity = 0.7 * track.velocity + 0.3 * movement
+        track.xyxy = xyxy
+        track.cls = detections.cls[index]
+        track.conf = detections.conf[index]
+        track.missed = 0
+        track.hits += 1
+        if track.hits >= self.n_init:
+            track.confirmed = True
+        self.__store_feature(track.slot, features[index])
+
+    def __create_track(self, detections, features, index):
+        if self.features is None:
+            self.features = np.zeros((16, self.nn_budget, features.shape[1]), np.float32)
+            self.counts = np.zeros(16, np.int32)
+            self.free_slots = list(range(16))
+        if not self.free_slots:
+            # Grow the pool; only happens when more tracks are alive at once than ever before
+            capacity = len(self.features)
+            self.features = np.concatenate([self.features, np.zeros_like(self.features)])
+            self.counts = np.concatenate([self.counts, np.zeros(capacity, np.int32)])
+            self.free_slots = list(range(capacity, 2 * capacity))
+
+        slot = self.free_slots.pop()
+        self.counts[slot] = 0
+        track = Track(self.next_id, slot, detections.xyxy[index], detections.cls[index], detections.conf[index])
+        self.next_id += 1
+        if self.n_init <= 1:
+            track.confirmed = True
+        self.tracks.append(track)
+        self.__store_feature(slot, features[index])
+
+    def __store_feature(self, slot, feature):
+        # Ring buffer: the oldest feature is overwritten once the budget is full
+        self.features[slot, self.counts[slot] % self.nn_budget] = feature
+        self.counts[slot] += 1
+
+    def __remove_dead_tracks(self):
+        alive = []
+        for track in self.tracks:
+            if track.missed == 0 or (track.confirmed and track.missed <= self.max_age):
+                alive.append(track)
+            else:
+                self.free_slots.append(track.slot)
+        self.tracks = alive
@@ -1,7 +1,8 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QGroupBox, QLabel, QSlider, QPushButton, QCheckBox, QRadioButton,
-                             QComboBox, QFileDialog, QHBoxLayout, QLineEdit)
+                             QComboBox, QFileDialog, QHBoxLayout, QLineEdit, QInputDialog)
 from PyQt6.QtCore import Qt, QThread
 from PyQt6.QtGui import QIntValidator
+from src.latency import SYNTHETIC_LATENCY_SOURCE
 from src.threads import DeviceScanner
 
 
@@ -20,6 +21,7 @@ class ConfigPanel(QWidget):
         self.__video_group = QGroupBox("Video Settings")
         self.__detection_group = QGroupBox("Detection Settings")
         self.__performance_group = QGroupBox("Performance Settings")
+        self.__regions_group = QGroupBox("Region Settings")
 
         # Defines global variables for the configuration panel
         self.__fps_label = None
@@ -36,12 +38,14 @@ class ConfigPanel(QWidget):
         self.__init_video()
         self.__init_detection()
         self.__init_performance()
+        self.__init_regions()
 
         # Add the config group to the main layout
         self.__config_layout.addWidget(self.__input_settings)
         self.__config_layout.addWidget(self.__video_group)
         self.__config_layout.addWidget(self.__detection_group)
         self.__config_layout.addWidget(self.__performance_group)
+        self.__config_layout.addWidget(self.__regions_group)
 
         # Set the layout for the ConfigPanel
         self.setLayout(self.__config_layout)
@@ -68,12 +72,23 @@ class ConfigPanel(QWidget):
         self.__file_button.clicked.connect(self.__select_video_file)
         self.__file_button.setEnabled(False)  # Initially disabled
 
+        # Synthetic source with a timestamp drawn into every frame, for end-to-end latency checks
+        self.__latency_source_button = QPushButton("Use Latency Test Source")
+        self.__latency_source_button.clicked.connect(
+            lambda: self.controller.set_video_file(SYNTHETIC_LATENCY_SOURCE))
+
+        # Live network stream (MPEG-TS over UDP, RTSP, ...)
+        self.__network_button = QPushButton("Open Network Stream")
+        self.__network_button.clicked.connect(self.__select_network_stream)
+
         # Add widgets to the video input layout
         video_input_layout.addWidget(device_radio)
         video_input_layout.addWidget(self.__device_dropdown)
         video_input_layout.addWidget(self.__refresh_button)
         video_input_layout.addWidget(file_radio)
         video_input_layout.addWidget(self.__file_button)
+        video_input_layout.addWidget(self.__network_button)
+        video_input_layout.addWidget(self.__latency_source_button)
 
         # Set the layout for the input settings group
         self.__input_settings.setLayout(video_input_layout)
@@ -118,6 +133,11 @@ class ConfigPanel(QWidget):
         __tracking_checkbox.setChecked(True)
         __tracking_checkbox.stateChanged.connect(self.controller.toggle_tracking)
 
+        # Enable/Disable the two-stage cascade
+        __cascade_checkbox = QCheckBox("Enable Cascade (Fast Model + Re-check)")
+        __cascade_checkbox.setChecked(bool((self.controller.config.get('cascade') or {}).get('enabled')))
+        __cascade_checkbox.stateChanged.connect(self.controller.toggle_cascade)
+
         # Enable/Disable Class-Specific Bounding Boxes
         __class_specific_bbox_checkbox = QCheckBox("Enable Class-Specific Bounding Boxes")
         __class_specific_bbox_checkbox.stateChanged.connect(self.__toggle_class_specific_bbox)
@@ -147,6 +167,7 @@ class ConfigPanel(QWidget):
         detection_layout.addWidget(self.__confidence_label)
         detection_layout.addWidget(self.__confidence_slider)
         detection_layout.addWidget(__tracking_checkbox)
+        detection_layout.addWidget(__cascade_checkbox)
         detection_layout.addWidget(__class_specific_bbox_checkbox)
         detection_layout.addWidget(self.__omit_classes_checkbox)
         detection_layout.addWidget(self.__classes_dropdown)
@@ -190,6 +211,30 @@ class ConfigPanel(QWidget):
         # Set the layout for the performance group
         self.__performance_group.setLayout(performance_layout)
 
+    def __init_regions(self):
+        # Region of interest and exclusion zone drawing
+        regions_layout = QVBoxLayout()
+        regions_label = QLabel("Left-click on the video to add points, right-click to finish.")
+        regions_label.setWordWrap(True)
+
+        roi_button = QPushButton("Draw Region of Interest")
+        roi_button.clicked.connect(lambda: self.controller.draw_region('roi'))
+
+        exclude_button = QPushButton("Add Exclusion Zone")
+        exclude_button.clicked.connect(lambda: self.controller.draw_region('exclude'))
+
+        clear_button = QPushButton("Clear Regions")
+        clear_button.clicked.connect(self.controller.clear_regions)
+
+        # Add to layout
+        regions_layout.addWidget(regions_label)
+        regions_layout.addWidget(roi_button)
+        regions_layout.addWidget(exclude_button)
+        regions_layout.addWidget(clear_button)
+
+        # Set the layout for the regions group
+        self.__regions_group.setLayout(regions_layout)
+
     def __toggle_class_specific_bbox(self, state):
         """Enable or disable class-specific bounding boxes."""
         enabled = state
@@ -217,6 +262,13 @@ class ConfigPanel(QWidget):
         if file_name:
             self.controller.set_video_file(file_name)
 
+    def __select_network_stream(self):
+        """Ask for the URL of a live stream."""
+        url, ok = QInputDialog.getText(self, "Open Network Stream", "Stream URL (udp://, rtp://, rtsp://, srt://):",
+                                       text="udp://127.0.0.1:5000")
+        if ok and url.strip():
+            self.controller.set_video_file(url.strip())
+
     def __refresh_devices(self):
         """Refresh the list of available devices."""
         self.__device_thread = QThread()
@@ -1,8 +1,12 @@
+import os
+import time
+from PyQt6.QtCore import QFileSystemWatcher
 from PyQt6.QtWidgets import QMainWindow, QWidget, QHBoxLayout, QScrollArea
+from src.frame_cache import FrameCache
+from src.tracing import tracer
 from src.ui.config_panel import ConfigPanel
 from src.ui.video_panel import VideoPanel
 import yaml
-import time
 
 
 class MainWindow(QMainWindow):
@@ -10,7 +14,8 @@ class MainWindow(QMainWindow):
         super().__init__()
 
         # Load the configuration file
-        with open('config/config.yaml', 'r') as file:
+        self.config_path = 'config/config.yaml'
+        with open(self.config_path, 'r') as file:
             self.config = yaml.safe_load(file)
 
         # Setup properties
@@ -27,6 +32,7 @@ class MainWindow(QMainWindow):
 
         self.__multi_color_classes = False
         self.__omit_classes = []
+        self.__class_thresholds = self.__parse_class_thresholds(self.config)
 
         # Create a central widget
         self.central_widget = QWidget()
@@ -43,6 +49,39 @@ class MainWindow(QMainWindow):
         # Set default values in config.
         self.config_panel.set_fps(1)
         self.config_panel.set_confidence(50)
+        self.video_panel.update_class_thresholds(self.__class_thresholds)
+        self.video_panel.update_rerender_floor(self.config['detection'].get('rerender_floor'))
+        video_config = self.config['video']
+        self.video_panel.update_resolutions(video_config.get('capture_resolution') or (1280, 720),
+                                            video_config.get('inference_size') or None,
+                                            video_config.get('display_resolution') or None)
+        cache_config = self.config.get('frame_cache') or {}
+        frame_cache = None
+        if cache_config.get('enabled'):
+            frame_cache = FrameCache(cache_config.get('directory', 'cache/frames'),
+                                     int(cache_config.get('max_size_mb', 4096)) * 1024 ** 2)
+        self.video_panel.update_capture_backend(video_config.get('backend', 'opencv'), self.config.get('ffmpeg'),
+                                                frame_cache)
+        self.video_panel.update_network_settings(self.config.get('network'))
+        self.video_panel.update_remote(self.config.get('remote'))
+        self.video_panel.update_tracker_settings({**(self.config.get('tracker') or {}),
+                                                  'embedder': self.config['model'].get('deepsort')})
+        self.video_panel.update_cascade_settings(self.config.get('cascade'))
+        self.video_panel.update_export_settings(self.config.get('export'))
+        self.video_panel.update_analytics_settings(self.config.get('analytics'))
+        self.video_panel.update_latency_settings(self.config.get('latency'))
+        self.video_panel.update_memory_settings(self.config.get('memory'))
+        self.video_panel.update_timeline_settings({**(self.config.get('timeline') or {}),
+                                                   'index_path': (self.config.get('batch') or {}).get('index_path')})
+        tracing = self.config.get('tracing') or {}
+        if tracing.get('enabled'):
+            tracer.enable(tracing.get('capacity'))
+        regions = self.config.get('regions') or {}
+        self.video_panel.update_regions(regions.get('roi') or None, regions.get('exclude') or [])
+
+        # Reload the live settings whenever config.yaml is saved, without restarting the processors
+        self.config_watcher = QFileSystemWatcher([self.config_path])
+        self.config_watcher.fileChanged.connect(self.reload_config)
 
         self.scroll_area.setWidget(self.config_panel)
         self.scroll_area.setWidgetResizable(True)
@@ -82,6 +121,58 @@ class MainWindow(QMainWindow):
         self.__omit_classes = [self.__name_id_map[class_name] for class_name in classes]
         self.video_panel.update_omitted_classes(self.__omit_classes)
 
+    def __parse_class_thresholds(self, config):
+        """Map the class names in detection.class_thresholds to class ids."""
+        thresholds = config.get('detection', {}).get('class_thresholds') or {}
+        return {self.__name_id_map[name]: float(value) for name, value in thresholds.items()
+                if name in self.__name_id_map}
+
+    def reload_config(self):
+        """Re-read the configuration file and apply its live settings.
+
+        Covers the per-class thresholds, resolutions, capture backend and frame cache, and regions.
+        """
+        # Editors that save by replacing the file drop it from the watcher, so watch it again
+        if self.config_path not in self.config_watcher.files():
+            self.config_watcher.addPath(self.config_path)
+
+        try:
+            with open(self.config_path, 'r') as file:
+                config = yaml.safe_load(file)
+            self.__class_thresholds = self.__parse_class_thresholds(config)
+        except (OSError, yaml.YAMLError, AttributeError, TypeError, ValueError) as e:
+            print(f"Error reloading the configuration: {e}")
+            return
+        self.video_panel.update_class_thresholds(self.__class_thresholds)
+        video_config = config.get('video') or {}
+        self.video_panel.update_resolutions(video_config.get('capture_resolution') or (1280, 720),
+                                            video_config.get('inference_size') or None,
+                                            video_config.get('display_resolution') or None)
+        # The frame cache and capture backend are only rebuilt when their settings changed
+        previous_video = self.config.get('video') or {}
+        if (video_config.get('backend') != previous_video.get('backend')
+                or any(config.get(section) != self.config.get(section) for section in ('frame_cache', 'ffmpeg'))):
+            cache_config = config.get('frame_cache') or {}
+            frame_cache = None
+            if cache_config.get('enabled'):
+                frame_cache = FrameCache(cache_config.get('directory', 'cache/frames'),
+                                         int(cache_config.get('max_size_mb', 4096)) * 1024 ** 2)
+            self.video_panel.update_capture_backend(video_config.get('backend', 'opencv'), config.get('ffmpeg'),
+                                                    frame_cache)
+        # Only a changed regions section replaces the polygons drawn on the video (and resets the tracks)
+        regions = config.get('regions') or {}
+        if regions != (self.config.get('regions') or {}):
+            self.video_panel.update_regions(regions.get('roi') or None, regions.get('exclude') or [])
+        self.config = config
+
+    def draw_region(self, kind):
+        """Start drawing a region ('roi' or 'exclude') on the video panel."""
+        self.video_panel.begin_region_drawing(kind)
+
+    def clear_regions(self):
+        """Remove the region of interest and all exclusion zones."""
+        self.video_panel.update_regions(None, [])
+
     def set_nth_frame(self, value):
         """Set the nth frame value."""
         self.video_panel.update_nth_frame(value)
@@ -103,12 +194,18 @@ class MainWindow(QMainWindow):
             print("Video device removed.")
 
     def closeEvent(self, event):
-        # Ensure processors stop when widget is closed
+        # Ensure processors stop when widget is closed; stop_video joins both threads
         self.video_panel.stop_video()
-        while self.video_panel.detection_processor is not None and self.video_panel.renderer is not None:
-            time.sleep(0.1)
+        if tracer.enabled:
+            output_dir = (self.config.get('tracing') or {}).get('output_dir', 'output/traces')
+            path = os.path.join(output_dir, f"trace-{time.strftime('%Y%m%d-%H%M%S')}.json")
+            print(f"Wrote {tracer.dump(path)} trace events to {path}")
         event.accept()
 
     def toggle_tracking(self, value):
         """Toggle the detection value."""
         self.video_panel.update_tracking(True if value == 2 else False)
+
+    def toggle_cascade(self, value):
+        """Toggle the fast-model / re-check cascade."""
+        self.video_panel.update_cascade(True if value == 2 else False)
@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+from PyQt6.QtCore import Qt, QTimer, QPointF
+from PyQt6.QtGui import QPainter, QPen, QColor, QImage, QPixmap, QPolygonF
+from PyQt6.QtWidgets import QWidget, QSizePolicy
+
+
+class TimelineStrip(QWidget):
+    """Overview of a recording under the video: keyframe thumbnails along its duration, a per-second detection
+    density sparkline and the playback position.
+
+    Thumbnails and indexed density arrive from a TimelineBuilder as they become available; live density is read from
+    a LiveDensity filled by the detection thread and repainted on a timer.
+    """
+
+    def __init__(self, thumbnail_height=54, sparkline_height=24, parent=None):
+        super().__init__(parent)
+        self.thumbnail_height = thumbnail_height
+        self.sparkline_height = sparkline_height
+        self.setFixedHeight(thumbnail_height + sparkline_height)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+
+        self.duration = 0.0
+        self.thumbnails = []  # (time, QPixmap)
+        self.indexed_density = None
+        self.live_density = None
+
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.timeout.connect(self.update)
+        self.setVisible(False)
+
+    def clear(self):
+        self.repaint_timer.stop()
+        self.duration = 0.0
+        self.thumbnails = []
+        self.indexed_density = None
+        self.live_density = None
+        self.setVisible(False)
+
+    def set_info(self, info):
+        self.duration = info['duration']
+        self.setVisible(True)
+
+    def add_thumbnail(self, frame_time, thumbnail):
+        rgb_image = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2RGB)
+        h, w, ch = rgb_image.shape
+        qt_image = QImage(rgb_image.data, w, h, ch * w, QImage.Format.Format_RGB888)
+        self.thumbnails.append((frame_time, QPixmap.fromImage(qt_image)))  # fromImage copies, so rgb_image may go
+        self.update()
+
+    def set_indexed_density(self, density):
+        self.indexed_density = np.array(density, np.float64)
+        self.update()
+
+    def set_live_density(self, live_density):
+        self.live_density = live_density
+        self.repaint_timer.start(500)
+
+    def paintEvent(self, event):
+        if not self.duration:
+            return
+        painter = QPainter(self)
+        width = self.width()
+        painter.fillRect(self.rect(), QColor(20, 20, 20))
+
+        # Thumbnails sit at their keyframe's time; a later one covers the tail of an earlier one
+        for frame_time, pixmap in self.thumbnails:
+            painter.drawPixmap(int(frame_time / self.duration * width), 0, pixmap)
+
+        top = self.thumbnail_height
+        live = self.live_density.values() if self.live_density is not None else None
+        peak = max([np.nanmax(values) for values in (self.indexed_density, live)
+                    if values is not None and len(values) and not np.all(np.isnan(values))] or [0])
+        if peak > 0:
+            for values, color in ((self.indexed_density, QColor(150, 150, 150)), (live, QColor(0, 220, 0))):
+                if values is not None:
+                    self.__draw_sparkline(painter, values, peak, top, width, color)
+
+        if self.live_density is not None:
+            painter.setPen(QPen(QColor(255, 60, 60), 2))
+            x = int(self.live_density.position / self.duration * width)
+            painter.drawLine(x, 0, x, self.height())
+        painter.end()
+
+    def __draw_sparkline(self, painter, values, peak, top, width, color):
+        painter.setPen(QPen(color, 1))
+        points = QPolygonF()
+        for second, value in enumerate(values):
+            if np.isnan(value):
+                if points.size() > 1:
+                    painter.drawPolyline(points)
+                points = QPolygonF()  # Seconds not played yet leave a gap
+                continue
+            x = (second + 0.5) / self.duration * width
+            y = top + self.sparkline_height - 2 - value / peak * (self.sparkline_height - 4)
+            points.append(QPointF(x, y))
+        if points.size() > 1:
+            painter.drawPolyline(points)
@@ -1,15 +1,26 @@
+import os
 import time
 
 import numpy as np
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QPushButton, QSlider, QHBoxLayout, QLabel,
                              QSizePolicy, QMessageBox, QDialog, QSpinBox, QLineEdit, QRadioButton)
-from PyQt6.QtCore import Qt, QTimer, QMutex, QSize
+from PyQt6.QtCore import Qt, QTimer, QMutex, QSize, QEvent, QPointF, QThread
 from ultralytics import YOLO
 import torch
 import yaml
-from PyQt6.QtGui import QPixmap, QImage
-from src.threads import DetectionProcessor, RenderProcessor
-from queue import Queue
+from PyQt6.QtGui import QPixmap, QImage, QPainter, QPen, QColor, QPolygonF
+from src.analytics import TrackAnalytics
+from src.buffers import MB, ByteBudgetQueue, format_usage
+from src.export import DetectionExporter, export_path
+from src.latency import SYNTHETIC_LATENCY_SOURCE, LatencyProbe, pattern_latency
+from src.regions import RegionMask
+from src.remote import RemoteDetector
+from src.settings import RuntimeSettings
+from src.tracing import tracer
+from src.threads import DetectionProcessor, RenderProcessor, TimelineBuilder
+from src.timeline import LiveDensity
+from src.ui.timeline_strip import TimelineStrip
+from src.video_stream import open_capture
 import logging
 import cv2
 
@@ -36,8 +47,13 @@ class VideoPanel(QWidget):
         self.video_display = QLabel(self)
         self.video_display.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
         self.video_display.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.video_display.setMinimumSize(1, 1)  # Let the label shrink below the size of the last frame
         self.layout.addWidget(self.video_display)
 
+        # Keyframe thumbnails and detection density of the loaded recording, filled in by a background builder
+        self.timeline_strip = TimelineStrip(parent=self)
+        self.layout.addWidget(self.timeline_strip)
+
         # Control button
         self.button_layout = QHBoxLayout()
         self.play_pause_button = QPushButton("Play", self)
@@ -50,8 +66,11 @@ class VideoPanel(QWidget):
         self.play_pause_button.clicked.connect(self.toggle_play_pause)
         self.stop_button.clicked.connect(self.stop_video)
 
-        # Queues for processing
-        self.result_queue = Queue(maxsize=100)
+        # Queues for processing, bounded by the byte budgets of the config's memory section
+        self.memory_settings = {}
+        self.memory_reported = 0.0
+        self.rerender_floor = None
+        self.result_queue = self.new_result_queue()
 
         # Thread Creation
         self.frame_lock = QMutex()
@@ -77,12 +96,66 @@ class VideoPanel(QWidget):
         self.nth_frame = 1
         self.max_boxes = 100
         self.omitted_classes = []
+        self.class_thresholds = {}
         self.tracking = True
+        self.multicolor = False
+
+        # Capture resolution requested from devices, longest side used for inference, and an optional cap on the
+        # frames sent to the display (they are otherwise fitted to the window)
+        self.capture_resolution = (1280, 720)
+        self.inference_size = None
+        self.display_resolution = None
+
+        # Capture backend for files and streams: 'opencv' or 'ffmpeg' (see FFmpegCapture)
+        self.capture_backend = 'opencv'
+        self.ffmpeg_options = {}
+        self.network_options = {}
+        self.frame_cache = None
+
+        # Remote inference workers (see src/remote.py); None runs the model in this process
+        self.remote_config = None
+
+        # Tracker mode and appearance tracker settings from the config's tracker section
+        self.tracker_settings = {}
+
+        # Two-stage cascade settings from the config; toggled from the detection settings
+        self.cascade_settings = {}
+
+        # Detection export settings from the config, and the exporter of the current video
+        self.export_settings = {}
+        self.exporter = None
+
+        # Line-crossing / zone analytics settings from the config, and the analytics of the current video
+        self.analytics_settings = {}
+        self.analytics = None
+        self.analytics_source = None
+
+        # Capture-to-display latency measurement (see LatencyProbe)
+        self.latency_settings = {}
+        self.latency_probe = None
+        self.latency_pattern = False
+        self.latency_reported = 0.0
+
+        # Timeline strip settings from the config, and the builder of the current recording's strip
+        self.timeline_settings = {}
+        self.timeline_thread = None
+        self.timeline_builder = None
+
+        # Region of interest / exclusion zones in normalised coordinates, and the polygon being drawn
+        self.roi = None
+        self.exclusions = []
+        self.drawing_region = None
+        self.region_points = []
+        self.frame_pixmap = None
+        self.video_display.installEventFilter(self)
 
     def toggle_play_pause(self):
         if self.detection_processor is None or self.detection_processor is None:
             return
 
+        if self.detection_processor.ident is not None and not self.detection_processor.is_alive():
+            return  # The stream has ended
+
         if self.detection_processor.is_stopped():
             self.start_video()
             self.play_pause_button.setText("Pause")
@@ -97,7 +170,7 @@ class VideoPanel(QWidget):
         # Start processors if not running
         self.detection_processor.resume()
         self.renderer.resume()
-        if not self.detection_processor.is_alive():
+        if self.detection_processor.ident is None:
             self.detection_processor.start()
         if not self.renderer.isRunning():
             self.renderer.start()
@@ -110,26 +183,129 @@ class VideoPanel(QWidget):
         self.detection_processor.stop()
         self.renderer.stop()
 
-    def update_displayed_frame(self, frame: np.ndarray):
-        # Convert the numpy array to QImage
-        rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        bytes_per_line = ch * w
-        qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
+    def update_displayed_frame(self, frame: np.ndarray, capture_time: float = 0.0):
+        with tracer.span('gui.display_frame'):
+            # Convert the numpy array to QImage
+            rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            h, w, ch = rgb_image.shape
+            bytes_per_line = ch * w
+            qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
 
-        # Set the QPixmap from QImage
-        pixmap = QPixmap.fromImage(qt_image)
-        self.video_display.setPixmap(pixmap)
+            # Set the QPixmap from QImage
+            self.frame_pixmap = QPixmap.fromImage(qt_image)
+            self.show_frame_pixmap()
+
+        if self.latency_probe is not None and capture_time:
+            self.record_latency(frame, capture_time)
+        if self.memory_settings.get('report_interval'):
+            self.report_memory()
 
         # Compute and update FPS
         current_time = time.time()
         if self.previous_time is not None and self.previous_time != current_time:
             fps = 1.0 / (current_time - self.previous_time)
-            self.fps_label.setText(f"FPS: {fps:.2f}")
+            self.fps_label.setText(f"FPS: {fps:.2f}" if self.latency_probe is None
+                                   else f"FPS: {fps:.2f} | {self.latency_probe.text()}")
         else:
             self.fps_label.setText("FPS: 0.0")
         self.previous_time = current_time
 
+    def record_latency(self, frame, capture_time):
+        """Record how long this frame took from capture to the display, and report the percentiles periodically."""
+        now = time.perf_counter()
+        self.latency_probe.record(now - capture_time, pattern_latency(frame) if self.latency_pattern else None)
+        if now - self.latency_reported >= self.latency_settings.get('report_interval', 5):
+            self.latency_reported = now
+            logging.info(self.latency_probe.text())
+
+    def report_memory(self):
+        """Print the bytes held in each pipeline buffer periodically."""
+        now = time.perf_counter()
+        if now - self.memory_reported >= self.memory_settings['report_interval'] and self.detection_processor:
+            self.memory_reported = now
+            logging.info(f"Buffers: {format_usage(self.detection_processor.memory_usage())}")
+
+    def show_frame_pixmap(self):
+        """Display the latest frame, outlining the regions and any polygon currently being drawn."""
+        if self.frame_pixmap is None:
+            return
+        if self.roi is None and not self.exclusions and self.drawing_region is None:
+            self.video_display.setPixmap(self.frame_pixmap)
+            return
+
+        pixmap = self.frame_pixmap.copy()
+        width, height = pixmap.width(), pixmap.height()
+
+        def to_polygon(points):
+            return QPolygonF([QPointF(x * width, y * height) for x, y in points])
+
+        painter = QPainter(pixmap)
+        if self.roi is not None:
+            painter.setPen(QPen(QColor(0, 200, 255), 2))
+            painter.drawPolygon(to_polygon(self.roi))
+        painter.setPen(QPen(QColor(255, 0, 0), 2))
+        for polygon in self.exclusions:
+            painter.drawPolygon(to_polygon(polygon))
+        if self.region_points:
+            painter.setPen(QPen(QColor(255, 255, 0), 2, Qt.PenStyle.DashLine))
+            painter.drawPolyline(to_polygon(self.region_points))
+        painter.end()
+        self.video_display.setPixmap(pixmap)
+
+    def begin_region_drawing(self, kind):
+        """Start drawing a 'roi' or 'exclude' polygon: left-click adds points, right-click finishes."""
+        self.drawing_region = kind
+        self.region_points = []
+        self.video_display.setCursor(Qt.CursorShape.CrossCursor)
+
+    def eventFilter(self, obj, event):
+        if obj is self.video_display and self.drawing_region is not None \
+                and event.type() == QEvent.Type.MouseButtonPress:
+            if event.button() == Qt.MouseButton.LeftButton:
+                point = self.__to_normalised(event.position())
+                if point is not None:
+                    self.region_points.append(point)
+            elif event.button() == Qt.MouseButton.RightButton:
+                self.__finish_region()
+            self.show_frame_pixmap()
+            return True
+        return super().eventFilter(obj, event)
+
+    def __to_normalised(self, position):
+        """Map a click on the video label to normalised frame coordinates, or None if it missed the frame."""
+        pixmap = self.video_display.pixmap()
+        if pixmap is None or pixmap.isNull():
+            return None
+        x = (position.x() - (self.video_display.width() - pixmap.width()) / 2) / pixmap.width()
+        y = (position.y() - (self.video_display.height() - pixmap.height()) / 2) / pixmap.height()
+        if not (0 <= x <= 1 and 0 <= y <= 1):
+            return None
+        return round(x, 4), round(y, 4)
+
+    def __finish_region(self):
+        kind, points = self.drawing_region, self.region_points
+        self.drawing_region = None
+        self.region_points = []
+        self.video_display.unsetCursor()
+        if len(points) < 3:
+            return  # Not a polygon; treat as cancelled
+
+        if kind == 'roi':
+            self.update_regions(points, self.exclusions)
+        else:
+            self.update_regions(self.roi, self.exclusions + [points])
+        print(f"Region '{kind}' set to {[list(point) for point in points]}; "
+              f"add it to the regions section of config.yaml to keep it.")
+
+    def update_regions(self, roi, exclusions):
+        """Update the region of interest and the exclusion zones (normalised polygons)."""
+        self.roi = roi
+        self.exclusions = list(exclusions)
+        self.show_frame_pixmap()
+        if self.detection_processor is None or self.detection_processor is None:
+            return
+        self.detection_processor.update_regions(RegionMask(self.roi, self.exclusions))
+
     def stop_video(self):
         if self.detection_processor is None or self.detection_processor is None:
             return
@@ -139,15 +315,32 @@ class VideoPanel(QWidget):
         # Stop both processors
         self.detection_processor.terminate()
         self.renderer.terminate()
+        stats = self.result_queue.stats()
+        logging.info(f"Result queue: peak {stats['peak_bytes'] / MB:.1f} of {stats['max_bytes'] / MB:.0f} MB, "
+                     f"{stats['dropped']} frames dropped, detection blocked for {stats['blocked_seconds']:.1f} s")
+        cascade_summary = self.detection_processor.cascade_summary()
+        if cascade_summary is not None:
+            logging.info(cascade_summary)
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+        if self.analytics is not None:
+            path = export_path(self.analytics_settings.get('export_dir', 'output/analytics'), self.analytics_source,
+                               'jsonl')
+            self.analytics.export(path.replace('.detections.jsonl', '.analytics.json'))
+            self.analytics = None
 
         # Clear the video display
         self.video_display.clear()
+        self.stop_timeline()
+        self.frame_pixmap = None
         self.detection_processor = None
         self.renderer = None
 
     def resizeEvent(self, event):
         if self.detection_processor is None or self.detection_processor is None:
             return
+        tracer.instant('gui.resize', width=event.size().width(), height=event.size().height())
 
         was_paused = self.detection_processor.is_stopped()
         if not self.converting_to_pixmap:
@@ -165,33 +358,123 @@ class VideoPanel(QWidget):
     def end_resize(self):
         # Called when resizing has stabilized
         self.currently_resizing = False
+        if self.detection_processor is not None:
+            self.detection_processor.update_display_size(self.display_size())
         # Now apply the latest frame
         if self.qt_image and not self.qt_image.isNull():
             self.apply_image(self.qt_image)
 
 
-    def update_confidence_threshold(self, value):
-        self.conf_thres = value
-        if self.detection_processor is None or self.detection_processor is None:
+    def build_settings(self):
+        """Snapshot the panel's detection and render parameters for a model with the processor's classes."""
+        return RuntimeSettings(len(self.detection_processor.model.names), conf_thres=self.conf_thres,
+                               class_thresholds=self.class_thresholds, omit_classes=self.omitted_classes,
+                               max_boxes=self.max_boxes, use_tracking=self.tracking, multicolor=self.multicolor)
+
+    def publish_settings(self):
+        """Build one new settings snapshot and hand the same object to both processors."""
+        if self.detection_processor is None:
             return
+        settings = self.build_settings()
+        self.detection_processor.update_settings(settings)
+        self.renderer.update_settings(settings)
+
+    def update_confidence_threshold(self, value):
         """Update the confidence threshold for the detection model."""
-        self.renderer.update_confidence_threshold(value)
+        self.conf_thres = value
+        self.publish_settings()
+
+    def update_class_thresholds(self, thresholds):
+        """Update the per-class confidence thresholds (class id -> confidence)."""
+        self.class_thresholds = thresholds
+        self.publish_settings()
 
     def update_colormap(self, value):
         """Update the colormap value."""
-        self.renderer.update_multicolor_classes(value)
+        self.multicolor = value
+        self.publish_settings()
 
     def update_nth_frame(self, value):
+        """Update the nth frame value used for the next video opened."""
         self.nth_frame = value
-        if self.detection_processor is None or self.detection_processor is None:
+
+
+    def update_resolutions(self, capture_resolution, inference_size=None, display_resolution=None):
+        """Update the capture resolution, inference size (longest side) and display resolution cap."""
+        self.capture_resolution = tuple(capture_resolution)
+        self.inference_size = inference_size
+        self.display_resolution = tuple(display_resolution) if display_resolution else None
+        if self.detection_processor is not None:
+            self.detection_processor.update_display_size(self.display_size())
+
+    def update_capture_backend(self, backend, ffmpeg_options=None, frame_cache=None):
+        """Select the capture backend, and optional FrameCache for recordings, used for the next video opened."""
+        self.capture_backend = backend
+        self.ffmpeg_options = ffmpeg_options or {}
+        self.frame_cache = frame_cache
+
+    def update_network_settings(self, network_options):
+        """Jitter buffer, low-latency and reconnect options for network streams (see NetworkCapture)."""
+        self.network_options = network_options or {}
+
+    def update_remote(self, remote_config):
+        """Use the inference workers from the config's remote section for the next video opened."""
+        self.remote_config = remote_config if remote_config and remote_config.get('workers') else None
+
+    def update_tracker_settings(self, tracker_settings):
+        """Select the tracker (ByteTrack or appearance ReID) used for the next video opened."""
+        self.tracker_settings = tracker_settings
+
+    def update_cascade_settings(self, cascade_settings):
+        self.cascade_settings = dict(cascade_settings or {})
+
+    def update_cascade(self, value):
+        self.cascade_settings['enabled'] = value
+        if self.detection_processor is None:
             return
-        """Update the nth frame value."""
-        self.detection_processor.update_nth_frame(value)
+        self.detection_processor.update_cascade(value)
+
+    def update_export_settings(self, export_settings):
+        self.export_settings = export_settings or {}
+
+    def update_analytics_settings(self, analytics_settings):
+        self.analytics_settings = analytics_settings or {}
+
+    def update_latency_settings(self, latency_settings):
+        self.latency_settings = latency_settings or {}
+
+    def update_timeline_settings(self, timeline_settings):
+        self.timeline_settings = timeline_settings or {}
+
+    def update_rerender_floor(self, value):
+        """Lowest confidence kept for re-rendering while paused (see DetectionProcessor.rerender_floor); None: off."""
+        self.rerender_floor = value
+        if self.detection_processor is not None:
+            self.detection_processor.rerender_floor = value
 
+    def update_memory_settings(self, memory_settings):
+        """Byte budgets of the result queue and detection batches, used for the next video opened."""
+        self.memory_settings = memory_settings or {}
 
-    def setup_videocapture(self, video_device, fps_target=60, codec=None, resolution=(1280, 720)):
+    def new_result_queue(self):
+        return ByteBudgetQueue(self.memory_settings.get('result_queue_mb', 256) * MB,
+                               overflow=self.memory_settings.get('overflow', 'block'), name='result_queue')
+
+    def display_size(self):
+        """Size that frames are downscaled to before being sent to the GUI: the video label, capped by config."""
+        width, height = self.video_display.width(), self.video_display.height()
+        if self.display_resolution is not None:
+            width, height = min(width, self.display_resolution[0]), min(height, self.display_resolution[1])
+        return max(width, 1), max(height, 1)
+
+    def setup_videocapture(self, video_device, fps_target=60, codec=None, resolution=None):
         """Set up video capture using a video device or file."""
-        video_stream = cv2.VideoCapture(video_device)
+        if resolution is None and codec is not None:
+            resolution = self.capture_resolution
+        if isinstance(video_device, str) and os.path.isfile(video_device) and self.frame_cache is not None:
+            video_stream = None  # Opened from the frame cache once the inference size is known
+        else:
+            video_stream = open_capture(video_device, self.capture_backend, self.ffmpeg_options, self.network_options)
 
         # Configure video stream properties if it's a number (camera device)
         if isinstance(video_device, int) and codec is not None:
@@ -204,20 +487,125 @@ class VideoPanel(QWidget):
             # Set FPS
             video_stream.set(cv2.CAP_PROP_FPS, fps_target)
 
+        # Fresh queue per stream so no frames or end-of-stream markers leak over from a previous video
+        self.result_queue = self.new_result_queue()
+        remote = None
+        if self.remote_config is not None:
+            remote = RemoteDetector(self.remote_config['workers'],
+                                    max_in_flight=self.remote_config.get('max_in_flight', 2),
+                                    encoding=self.remote_config.get('encoding', 'jpeg'),
+                                    jpeg_quality=self.remote_config.get('jpeg_quality', 90),
+                                    timeout=self.remote_config.get('timeout', 10))
         self.detection_processor = DetectionProcessor(video_stream, self.model_path, self.result_queue,
-                                                      nth_frame=self.nth_frame)
-        self.renderer = RenderProcessor(self.result_queue, self.detection_processor.model.names, fps_target=fps_target,
-                                        max_boxes=self.max_boxes, omit_classes=self.omitted_classes,
-                                        use_tracking=self.tracking, conf_thres=self.conf_thres)
+                                                      nth_frame=self.nth_frame, conf_thres=self.conf_thres,
+                                                      omit_classes=self.omitted_classes,
+                                                      class_thresholds=self.class_thresholds,
+                                                      regions=RegionMask(self.roi, self.exclusions),
+                                                      inference_size=self.inference_size,
+                                                      display_size=self.display_size(), remote=remote,
+                                                      tracker_settings=self.tracker_settings,
+                                                      cascade_settings=self.cascade_settings,
+                                                      batch_mb=self.memory_settings.get('batch_mb', 0))
+        if video_stream is None:
+            # Cache recordings at the inference size so re-analysis skips decoding and resizing
+            imgsz = self.detection_processor.imgsz
+            self.detection_processor.cap = self.frame_cache.open(video_device, (imgsz, imgsz), self.capture_backend,
+                                                                 self.ffmpeg_options)
+        if self.export_settings.get('enabled'):
+            self.start_export(video_device)
+        self.latency_probe = LatencyProbe() if self.latency_settings.get('enabled') else None
+        self.latency_pattern = video_device == SYNTHETIC_LATENCY_SOURCE  # Frames carry a drawn timestamp
+        settings = self.build_settings()
+        self.detection_processor.update_settings(settings)
+        self.detection_processor.rerender_floor = self.rerender_floor
+        self.renderer = RenderProcessor(self.result_queue, self.detection_processor.model.names, settings,
+                                        fps_target=fps_target)
+        if self.analytics_settings.get('enabled'):
+            self.start_analytics(video_device)
+        self.stop_timeline()
+        if isinstance(video_device, str) and os.path.isfile(video_device) and self.timeline_settings.get('enabled'):
+            self.start_timeline(video_device)
 
         # Connect renderer signal to update display
         self.renderer.frame_updated.connect(self.update_displayed_frame)
+        self.renderer.stream_ended.connect(self.end_of_stream)
+
+    def start_export(self, video_device):
+        """Stream the detections of this video to disk in the configured format."""
+        settings = self.export_settings
+        export_format = settings.get('format', 'jsonl')
+        cap = self.detection_processor.cap
+        header = {'source': os.path.abspath(video_device) if isinstance(video_device, str) and os.path.exists(video_device)
+                  else video_device,
+                  'fps': cap.get(cv2.CAP_PROP_FPS) or 30, 'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                  'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), 'names': self.detection_processor.model.names}
+        try:
+            self.exporter = DetectionExporter(export_path(settings.get('directory', 'output/exports'), video_device,
+                                                          export_format),
+                                              export_format, header, flush_interval=settings.get('flush_interval', 1.0),
+                                              fsync=settings.get('fsync', False))
+        except (OSError, ValueError) as e:
+            logging.error(f"Unable to start detection export: {e}")
+            return
+        self.detection_processor.subscribe(self.exporter.submit)
+
+    def start_analytics(self, video_device):
+        """Count line crossings and zone occupancy from this video's tracks, drawn on the overlay."""
+        settings = self.analytics_settings
+        class_ids = {name: cls for cls, name in self.detection_processor.model.names.items()}
+
+        def resolve(items):
+            return [{**item, 'classes': [class_ids.get(cls, cls) for cls in item.get('classes') or ()]}
+                    for item in items or ()]
+
+        cap = self.detection_processor.cap
+        frame_size = (cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 1, cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 1)
+        try:
+            self.analytics = TrackAnalytics(frame_size, resolve(settings.get('lines')), resolve(settings.get('zones')),
+                                            max_age=settings.get('max_age', 150))
+        except (KeyError, ValueError) as e:
+            logging.error(f"Invalid analytics lines or zones: {e}")
+            return
+        self.analytics_source = video_device
+        self.detection_processor.subscribe(self.analytics.update)
+        self.renderer.add_overlay(self.analytics.draw)
+
+    def start_timeline(self, video_device):
+        """Build the recording's thumbnail strip in the background and track its detection density as it plays."""
+        settings = self.timeline_settings
+        self.timeline_thread = QThread()
+        self.timeline_builder = TimelineBuilder(video_device, settings.get('cache_dir', 'cache/timeline'),
+                                                settings.get('thumbnail_height', 54),
+                                                settings.get('max_thumbnails', 240), settings.get('index_path'))
+        self.timeline_builder.moveToThread(self.timeline_thread)
+        self.timeline_thread.started.connect(self.timeline_builder.run)
+        self.timeline_builder.info_ready.connect(self.timeline_strip.set_info)
+        self.timeline_builder.thumbnail_ready.connect(self.timeline_strip.add_thumbnail)
+        self.timeline_builder.density_ready.connect(self.timeline_strip.set_indexed_density)
+        self.timeline_builder.finished.connect(self.timeline_thread.quit)
+        self.timeline_thread.start()
+
+        cap = self.detection_processor.cap
+        live_density = LiveDensity(cap.get(cv2.CAP_PROP_FRAME_COUNT) / (cap.get(cv2.CAP_PROP_FPS) or 30))
+        self.detection_processor.subscribe(live_density.update)
+        self.timeline_strip.set_live_density(live_density)
+
+    def stop_timeline(self):
+        if self.timeline_builder is not None:
+            self.timeline_builder.cancel()
+            self.timeline_thread.quit()
+            self.timeline_thread.wait()
+            self.timeline_builder = None
+            self.timeline_thread = None
+        self.timeline_strip.clear()
+
+    def end_of_stream(self):
+        """Called once the last frame of the video has been displayed."""
+        self.play_pause_button.setText("Play")
 
     def update_max_boxes(self, value):
         self.max_boxes = value
-        if self.detection_processor is None or self.detection_processor is None:
-            return
-        self.renderer.update_max_boxes(value)
+        self.publish_settings()
 
     def prompt_video_settings(self, video_device):
         """Display a dialog to customize FPS, codec, and resolution for a camera device."""
@@ -259,7 +647,7 @@ class VideoPanel(QWidget):
         resolution_label = QLabel("Resolution (WxH):", dialog)
         resolution_input = QLineEdit(dialog)
         resolution_input.setPlaceholderText("e.g., 1280x720")
-        resolution_input.setText("1280x720")  # Default resolution
+        resolution_input.setText("{}x{}".format(*self.capture_resolution))  # Default resolution
         resolution_layout.addWidget(resolution_label)
         resolution_layout.addWidget(resolution_input)
         layout.addLayout(resolution_layout)
@@ -312,13 +700,8 @@ class VideoPanel(QWidget):
 
     def update_tracking(self, value):
         self.tracking = value
-        if self.detection_processor is None or self.detection_processor is None:
-            return
-        self.detection_processor.update_tracking(value)
-        self.renderer.update_tracking(value)
+        self.publish_settings()
 
     def update_omitted_classes(self, classes):
         self.omitted_classes = classes
-        if self.detection_processor is None or self.detection_processor is None:
-            return
-        self.renderer.update_omitted_classes(classes)
+        self.publish_settings()
@@ -1,5 +1,14 @@
 import cv2
+import json
 import logging
+import subprocess
+from collections import deque
+from threading import Thread
+
+import numpy as np
+
+from src.latency import SYNTHETIC_LATENCY_SOURCE, SyntheticLatencySource
+from src.network_source import NetworkCapture, is_network_source
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -20,7 +29,9 @@ class VideoStream:
         elif type == 'recording':
             self._setup_recording()
         elif type == 'capture_card':
-            self.setup_capture_card()
+            self._setup_capture_card()
+        elif type == 'network':
+            self.cap = NetworkCapture(source)
 
 
     def _setup_camera(self):
@@ -50,6 +61,10 @@ class VideoStream:
         self.cap = cap
 
 
+    def _setup_capture_card(self):
+        # Capture cards are UVC devices, so they open like cameras; MJPEG keeps USB bandwidth down at high resolutions
+        self._setup_camera()
+
     def _setup_recording(self):
         self.cap = cv2.VideoCapture(self.source)
         if not self.cap.isOpened():
@@ -76,4 +91,147 @@ class VideoStream:
         return self.cap.get_frame_postition()
 
     def release(self):
-        self.cap.release()
\ No newline at end of file
+        self.cap.release()
+
+
+# Keys of the config's ffmpeg section that FFmpegCapture accepts; anything else in the section is ignored
+FFMPEG_CAPTURE_OPTIONS = ('threads', 'hwaccel', 'scale', 'buffers', 'input_options')
+
+
+class FFmpegCapture:
+    """Video capture that decodes in an ffmpeg subprocess and streams rawvideo over a pipe.
+
+    Mirrors the parts of the ``cv2.VideoCapture`` interface the processors use. Decoder threads, hardware decoding,
+    scaling and pixel format conversion all happen inside ffmpeg, and every frame is read with ``readinto`` straight
+    into one of a fixed ring of preallocated arrays. A returned frame is therefore only valid until ``buffers`` more
+    frames have been read; keep ``buffers`` above the detection batch size, and copy frames that must live longer.
+    """
+
+    borrowed_frames = True  # Frames are reused buffers; copy any frame that must outlive the ring
+
+    def __init__(self, source, threads=0, hwaccel=None, scale=None, buffers=16, input_options=None):
+        self.source = source
+        self.process = None
+        self.frame_index = 0
+        self.stderr_lines = deque(maxlen=20)
+
+        info = self.probe(source)
+        self.fps = info.get('fps') or 30
+        self.frame_count = info.get('frames', 0)
+        if scale:
+            self.width, self.height = int(scale[0]), int(scale[1])
+        else:
+            self.width, self.height = info.get('width', 0), info.get('height', 0)
+        if not self.width or not self.height:
+            logging.error(f"Error: Unable to determine the frame size of {source}")
+            return
+
+        command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin']
+        if hwaccel:
+            command += ['-hwaccel', hwaccel]
+        command += ['-threads', str(threads)] + list(input_options or []) + ['-i', str(source)]
+        if scale:
+            command += ['-vf', f'scale={self.width}:{self.height}:flags=area']
+        command += ['-pix_fmt', 'bgr24', '-f', 'rawvideo', '-an', '-sn', 'pipe:1']
+
+        # Fixed ring of output arrays, with flat byte views for readinto
+        self.frame_bytes = self.width * self.height * 3
+        self._buffers = [np.empty((self.height, self.width, 3), np.uint8) for _ in range(max(2, buffers))]
+        self._views = [memoryview(buffer).cast('B') for buffer in self._buffers]
+        self._next = 0
+
+        try:
+            # Unbuffered so readinto goes straight from the pipe into the frame buffers
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        except FileNotFoundError:
+            logging.error("Error: FFmpeg is not installed; the ffmpeg capture backend is unavailable")
+            return
+        Thread(target=self._drain_stderr, daemon=True).start()
+
+    @staticmethod
+    def probe(source, input_options=(), timeout=15):
+        """Read the frame size, frame rate and frame count of the first video stream with ffprobe."""
+        try:
+            result = subprocess.run(['ffprobe', '-v', 'error'] + list(input_options) +
+                                    ['-select_streams', 'v:0', '-show_entries',
+                                     'stream=width,height,avg_frame_rate,r_frame_rate,nb_frames', '-of', 'json',
+                                     str(source)],
+                                    capture_output=True, text=True, timeout=timeout)
+            stream = json.loads(result.stdout)['streams'][0]
+        except (FileNotFoundError, subprocess.TimeoutExpired, ValueError, KeyError, IndexError):
+            return {}
+
+        fps = 0
+        for key in ('avg_frame_rate', 'r_frame_rate'):  # Live streams often leave the average unset (0/0)
+            numerator, _, denominator = stream.get(key, '0/1').partition('/')
+            fps = fps or (float(numerator) / float(denominator) if float(denominator or 0) else 0)
+        frames = stream.get('nb_frames', '0')
+        return {'width': stream.get('width', 0), 'height': stream.get('height', 0), 'fps': fps,
+                'frames': int(frames) if str(frames).isdigit() else 0}
+
+    def _drain_stderr(self):
+        # Keep the stderr pipe from filling up, remembering the last lines for error reports
+        for line in iter(self.process.stderr.readline, b''):
+            self.stderr_lines.append(line.decode(errors='replace').rstrip())
+
+    def isOpened(self):
+        return self.process is not None
+
+    def read(self):
+        if self.process is None:
+            return False, None
+
+        view = self._views[self._next]
+        filled = 0
+        while filled < self.frame_bytes:
+            count = self.process.stdout.readinto(view[filled:])
+            if not count:
+                if self.stderr_lines:
+                    logging.error(f"FFmpeg: {self.stderr_lines[-1]}")
+                return False, None
+            filled += count
+
+        frame = self._buffers[self._next]
+        self._next = (self._next + 1) % len(self._buffers)
+        self.frame_index += 1
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.frame_index
+        return 0
+
+    def set(self, prop, value):
+        return False  # Properties are fixed when the ffmpeg process starts
+
+    def release(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdout.close()
+        self.process = None
+
+
+def open_capture(source, backend='opencv', ffmpeg_options=None, network_options=None):
+    """Open a file or stream with the configured backend. Capture devices always use OpenCV, and network streams
+    (udp://, rtsp://, ...) always use NetworkCapture."""
+    if source == SYNTHETIC_LATENCY_SOURCE:
+        return SyntheticLatencySource()
+    if is_network_source(source):
+        ffmpeg_options = ffmpeg_options or {}
+        return NetworkCapture(source, threads=ffmpeg_options.get('threads', 0), hwaccel=ffmpeg_options.get('hwaccel'),
+                              **(network_options or {}))
+    if backend == 'ffmpeg' and not isinstance(source, int):
+        options = {key: value for key, value in (ffmpeg_options or {}).items() if key in FFMPEG_CAPTURE_OPTIONS}
+        return FFmpegCapture(source, **options)
+    return cv2.VideoCapture(source)
\ No newline at end of file